@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+
+from blclib import analysis
+from blclib.models import URLReference
+from getambassadorio_blc import is_doc_url
+
+# {grouping: (what to group on; see analysis.count_broken(), key function)}
+GROUPINGS: Dict[str, Tuple[str, Callable[[str], str]]] = {
+    'host': ('link', lambda url: urlparse(url).netloc or '-'),
+    'version': ('link', lambda url: is_doc_url(URLReference(ref=url)) or '-'),
+    'error': ('error', analysis.error_class),
+    'verdict': ('error', lambda error: error),
+    'page': ('page', lambda url: url),
+}
+
+
+def load_all(files: List[str]) -> analysis.Results:
+    return analysis.concat([analysis.load(file) for file in files])
+
+
+def print_table(table: analysis.Table, label: str) -> None:
+    print('\t'.join([label] + table.runs))
+    for group, counts in zip(table.groups, table.counts):
+        print('\t'.join([group] + [str(n) for n in counts]))
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog=argv[0],
+        description=(
+            'Analyze the broken links in the results of one or more checker runs; each '
+            'RESULTS file is either a link graph recorded with LINKGRAPH=DBFILE, or an .npz '
+            'file written by the "export" command (which loads much faster).'
+        ),
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    p = subparsers.add_parser('export', help='convert RESULTS files to a single .npz file')
+    p.add_argument('outfile')
+    p.add_argument('results', nargs='+')
+    p = subparsers.add_parser('trend', help='count the links and broken links in each run')
+    p.add_argument('results', nargs='+')
+    p = subparsers.add_parser(
+        'count', help='count the broken links in each run, grouped by GROUP'
+    )
+    p.add_argument(
+        '--by',
+        choices=GROUPINGS,
+        default='host',
+        help='the link target host, the docs version of the link target, the error class, '
+        'the exact verdict, or the page the link is on (default: host)',
+    )
+    p.add_argument('--top', type=int, metavar='N', help='only show the N largest groups')
+    p.add_argument('results', nargs='+')
+    p = subparsers.add_parser(
+        'diff', help='list the links that broke or got fixed between two runs'
+    )
+    p.add_argument('old')
+    p.add_argument('new')
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'export':
+        analysis.save(load_all(args.results), args.outfile)
+    elif args.command == 'trend':
+        print('run\tlinks\tbroken')
+        for run, links, broken in analysis.by_run(load_all(args.results)):
+            print(f'{run}\t{links}\t{broken}')
+    elif args.command == 'count':
+        results = load_all(args.results)
+        table = analysis.count_broken(results, *GROUPINGS[args.by])
+        if args.top:
+            table = analysis.top(table, args.top)
+        print_table(table, args.by)
+    elif args.command == 'diff':
+        results = load_all([args.old, args.new])
+        if len(results.runs) != 2:
+            print(f"{argv[0]}: diff: OLD and NEW must each be a single run", file=sys.stderr)
+            return 2
+        diff = analysis.diff_runs(results, 0, 1)
+        for sign, rows in (('-', diff.fixed), ('+', diff.new)):
+            order = np.lexsort((results.link[rows], results.page[rows]))
+            for row in rows[order]:
+                print(
+                    f'{sign}{results.urls[results.page[row]]}\t'
+                    + f'{results.urls[results.link[row]]}\t{results.errors[results.error[row]]}'
+                )
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv))
+    except KeyboardInterrupt as err:
+        print(err, file=sys.stderr)
+        sys.exit(130)
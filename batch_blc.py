@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Check several sites in one run, sharing one HTTP cache, one memo of
+external link verdicts, one rate limiter, and one scheduler between them
+(see blclib/batch.py).
+
+Usage: ./batch_blc.py PRODUCT=PROJDIR...
+       python3 -m blclib batch PRODUCT=PROJDIR...
+
+Each PRODUCT names a `PRODUCT_blc.py` script that supports batch mode (by
+having a `batch_site()` function); the Nth site gets served on port
+9000+N.  Each site's log lines (and summary) are prefixed with its
+PRODUCT, and the exit code is the worst of the sites'.
+
+"""
+
+import contextlib
+import importlib
+import sys
+from typing import List
+
+from blclib.batch import BatchRunner
+from blclib.output import OutputSink
+from generic_blc import Site
+
+BASE_PORT = 9000
+
+
+def cli(argv: List[str]) -> int:
+    if len(argv) < 2:
+        print(f"Usage: {argv[0]} PRODUCT=PROJDIR...", file=sys.stderr)
+        return 2
+    sites: List[Site] = []
+    for i, arg in enumerate(argv[1:]):
+        product, sep, projdir = arg.partition('=')
+        if not sep or not product or not projdir:
+            print(f"Usage: {argv[0]} PRODUCT=PROJDIR...", file=sys.stderr)
+            return 2
+        modname = f'{product}_blc'
+        try:
+            module = importlib.import_module(modname)
+        except ModuleNotFoundError as err:
+            if err.name != modname:
+                raise
+            print(f"{argv[0]}: unknown product: {product!r}", file=sys.stderr)
+            return 2
+        if not hasattr(module, 'batch_site'):
+            print(f"{argv[0]}: {product} doesn't support batch mode", file=sys.stderr)
+            return 2
+        site = module.batch_site(projdir, BASE_PORT + i, OutputSink(prefix=f'{product}: '))
+        if isinstance(site, int):
+            return site
+        sites.append(site)
+
+    runner = BatchRunner([site.checker for site in sites])
+    with contextlib.ExitStack() as stack:
+        for site in sites:
+            stack.enter_context(site.serving)
+        runner.run()
+    return max([site.report() for site in sites])
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(cli(sys.argv))
+    except KeyboardInterrupt as err:
+        print(err, file=sys.stderr)
+        sys.exit(130)
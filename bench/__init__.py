@@ -0,0 +1 @@
+"""Benchmarks for blclib; run with `python3 -m bench --help`."""
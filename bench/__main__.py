@@ -0,0 +1,291 @@
+"""Benchmark blclib end-to-end against a synthetic site and a fake internet.
+
+Usage: python3 -m bench [OPTIONS]
+
+Generates a site (see `bench.sitegen`), serves it along with a set of
+simulated external hosts (see `bench.fakenet`), runs a `BaseChecker` over
+it, and reports throughput, peak RSS, and request counts.
+
+"""
+
+import argparse
+import cProfile
+import json
+import pstats
+import resource
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from blclib import AsyncBaseChecker, BaseChecker, Link, RetryAfterException, URLReference
+
+from .fakenet import FakeInternetProcess, HostBehavior
+from .sitegen import SiteShape, external_host, generate_site
+
+# Functions whose cumulative time is reported by --profile.
+PROFILED_FUNCTIONS = [
+    ('checker.py', 'run'),
+    ('asyncchecker.py', '_run_async'),
+    ('checker.py', '_check_page'),
+    ('checker.py', '_check_links'),
+    ('checker.py', '_process_html'),
+    ('checker.py', '_process_css'),
+    ('checker.py', '_parse_soup'),
+    ('httpcache.py', 'send'),
+]
+
+
+class BenchChecker(BaseChecker):
+    domain: str
+
+    stats_requests: int = 0
+    stats_pages: int = 0
+    stats_links: int = 0
+    stats_broken: int = 0
+    stats_errors: int = 0
+    stats_429: int = 0
+    stats_sleep: float = 0
+
+    def __init__(self, domain: str, proxy: str, cache_codec: str) -> None:
+        self.domain = domain
+        self.cache_codec = cache_codec
+        super().__init__()
+        self._client.proxies = {'http': proxy}
+        self._client.trust_env = False
+
+    def is_internal_domain(self, netloc: str) -> bool:
+        return netloc == self.domain
+
+    def handle_request_starting(self, url: str) -> None:
+        if not url.startswith('data:'):
+            self.stats_requests += 1
+
+    def handle_page_starting(self, url: str) -> None:
+        self.stats_pages += 1
+
+    def handle_page_error(self, url: str, err: str) -> None:
+        self.stats_errors += 1
+
+    def handle_429(self, err: RetryAfterException) -> None:
+        self.stats_429 += 1
+
+    def handle_sleep(self, secs: float) -> None:
+        self.stats_sleep += secs
+
+    def handle_link_result(self, link: Link, broken: Optional[str]) -> None:
+        self.stats_links += 1
+        if broken:
+            self.stats_broken += 1
+        elif link.linkurl.resolved.startswith(f'http://{self.domain}/'):
+            self.enqueue(link.linkurl)
+
+
+class AsyncBenchChecker(BenchChecker, AsyncBaseChecker):
+    pass
+
+
+def peak_rss_mib() -> float:
+    # ru_maxrss is in KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_bench(args: argparse.Namespace) -> Dict[str, Any]:
+    shape = SiteShape(
+        pages=args.pages,
+        links_per_page=args.links_per_page,
+        anchors_per_page=args.anchors,
+        fragment_ratio=args.fragment_ratio,
+        css_files=args.css,
+        js_files=args.js,
+        images=args.images,
+        redirect_chains=args.redirect_chains,
+        redirect_chain_length=args.redirect_chain_length,
+        external_hosts=args.external_hosts,
+        external_links_per_page=args.external_links_per_page,
+        broken_ratio=args.broken_ratio,
+        seed=args.seed,
+    )
+    behaviors: Dict[str, HostBehavior] = {}
+    for i in range(shape.external_hosts):
+        behaviors[external_host(i)] = HostBehavior(
+            latency=args.latency,
+            rate_limit=args.rate_limit if i < args.throttled_hosts else None,
+            retry_after=args.retry_after,
+            body_delay=(
+                args.body_delay
+                if args.throttled_hosts <= i < args.throttled_hosts + args.slow_hosts
+                else 0.0
+            ),
+        )
+
+    with tempfile.TemporaryDirectory(prefix='blc-bench-') as pubdir:
+        gen_start = time.monotonic()
+        generate_site(pubdir, shape)
+        gen_secs = time.monotonic() - gen_start
+
+        with FakeInternetProcess(pubdir, behaviors, anchors=shape.anchors_per_page) as net:
+            checker_class = AsyncBenchChecker if args.use_async else BenchChecker
+            checker = checker_class(
+                domain=f'localhost:{net.port}',
+                proxy=net.proxy_url,
+                cache_codec=args.cache_codec,
+            )
+            checker.enqueue(URLReference(ref=f'{net.site_url}/'))
+
+            profiler = cProfile.Profile() if args.profile else None
+            start = time.monotonic()
+            if profiler:
+                profiler.enable()
+            checker.run()
+            if profiler:
+                profiler.disable()
+            secs = time.monotonic() - start
+            server_stats = net.stats()
+
+    report: Dict[str, Any] = {
+        'shape': shape._asdict(),
+        'async': args.use_async,
+        'generate_secs': round(gen_secs, 3),
+        'run_secs': round(secs, 3),
+        'pages': checker.stats_pages,
+        'links': checker.stats_links,
+        'broken_links': checker.stats_broken,
+        'errors': checker.stats_errors,
+        'pages_per_sec': round(checker.stats_pages / secs, 1),
+        'links_per_sec': round(checker.stats_links / secs, 1),
+        'client_requests': checker.stats_requests,
+        'server_requests': sum(server_stats['requests'].values()),
+        'server_requests_by_host': server_stats['requests'],
+        'coalesced_requests': checker._client.coalesced,
+        'cache_codec': checker._client.codec.name,
+        'cache': checker._client.cache_stats.asdict(),
+        'server_responses_by_status': server_stats['responses'],
+        'backoffs_429': checker.stats_429,
+        'sleep_secs': round(checker.stats_sleep, 3),
+        'peak_rss_mib': round(peak_rss_mib(), 1),
+    }
+    if profiler:
+        report['profile'] = _profile_report(profiler)
+    return report
+
+
+def _profile_report(profiler: cProfile.Profile) -> Dict[str, Dict[str, float]]:
+    ret: Dict[str, Dict[str, float]] = {}
+    stats = pstats.Stats(profiler).stats  # type: ignore[attr-defined]
+    for (filename, _, funcname), (_, ncalls, tottime, cumtime, _) in stats.items():
+        for wantfile, wantfunc in PROFILED_FUNCTIONS:
+            if filename.endswith(wantfile) and funcname == wantfunc:
+                key = f'{wantfile}:{funcname}'
+                ent = ret.setdefault(key, {'calls': 0, 'tottime': 0.0, 'cumtime': 0.0})
+                ent['calls'] += ncalls
+                ent['tottime'] = round(ent['tottime'] + tottime, 3)
+                ent['cumtime'] = round(ent['cumtime'] + cumtime, 3)
+    return ret
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(
+        f"Checked {report['links']} links on {report['pages']} pages in {report['run_secs']}s"
+        f" ({report['pages_per_sec']} pages/s, {report['links_per_sec']} links/s)"
+    )
+    print(f"  Results:  {report['broken_links']} broken links, {report['errors']} errors")
+    print(
+        f"  Requests: {report['client_requests']} sent by the client,"
+        f" {report['server_requests']} received by the server,"
+        f" {report['coalesced_requests']} coalesced"
+    )
+    for host, count in sorted(report['server_requests_by_host'].items()):
+        print(f"    {host}: {count}")
+    print(f"  Backoff:  {report['backoffs_429']} 429s, slept for {report['sleep_secs']}s")
+    cache = report['cache']
+    print(
+        f"  Memory:   peak RSS {report['peak_rss_mib']} MiB;"
+        f" cached bodies {cache['raw_bytes']} bytes stored in {cache['stored_bytes']}"
+        f" ({report['cache_codec']}, x{cache['ratio']})"
+    )
+    print(
+        f"  Codec:    {cache['compress_secs']}s compressing {cache['bodies']} bodies,"
+        f" {cache['decompress_secs']}s decompressing {cache['decompressions']}"
+    )
+    for key, ent in report.get('profile', {}).items():
+        print(
+            f"  Profile:  {key}: {ent['calls']} calls, {ent['tottime']}s self, {ent['cumtime']}s cumulative"
+        )
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    defaults = SiteShape()
+    parser = argparse.ArgumentParser(prog='python3 -m bench', description=__doc__)
+    site = parser.add_argument_group('site shape')
+    site.add_argument('--pages', type=int, default=defaults.pages)
+    site.add_argument('--links-per-page', type=int, default=defaults.links_per_page)
+    site.add_argument('--anchors', type=int, default=defaults.anchors_per_page)
+    site.add_argument('--fragment-ratio', type=float, default=defaults.fragment_ratio)
+    site.add_argument('--css', type=int, default=defaults.css_files)
+    site.add_argument('--js', type=int, default=defaults.js_files)
+    site.add_argument('--images', type=int, default=defaults.images)
+    site.add_argument('--redirect-chains', type=int, default=defaults.redirect_chains)
+    site.add_argument(
+        '--redirect-chain-length', type=int, default=defaults.redirect_chain_length
+    )
+    site.add_argument('--broken-ratio', type=float, default=defaults.broken_ratio)
+    site.add_argument('--seed', type=int, default=defaults.seed)
+    net = parser.add_argument_group('fake internet')
+    net.add_argument('--external-hosts', type=int, default=defaults.external_hosts)
+    net.add_argument(
+        '--external-links-per-page', type=int, default=defaults.external_links_per_page
+    )
+    net.add_argument(
+        '--latency', type=float, default=0.02, help='seconds per external request'
+    )
+    net.add_argument(
+        '--throttled-hosts',
+        type=int,
+        default=1,
+        help='how many external hosts rate-limit us',
+    )
+    net.add_argument(
+        '--rate-limit', type=float, default=20.0, help='requests/s per throttled host'
+    )
+    net.add_argument('--retry-after', choices=['seconds', 'date'], default='seconds')
+    net.add_argument(
+        '--slow-hosts', type=int, default=1, help='how many hosts send slow bodies'
+    )
+    net.add_argument('--body-delay', type=float, default=0.2, help='seconds per slow body')
+    checker = parser.add_argument_group('checker')
+    checker.add_argument(
+        '--async',
+        dest='use_async',
+        action='store_true',
+        help='run an AsyncBaseChecker instead of a BaseChecker',
+    )
+    checker.add_argument(
+        '--cache-codec',
+        default='zlib:1',
+        help='how to compress cached bodies: zlib[:LEVEL], zstd[:LEVEL], or none',
+    )
+    out = parser.add_argument_group('output')
+    out.add_argument(
+        '--profile', action='store_true', help='report time spent in hot functions'
+    )
+    out.add_argument('--json', action='store_true', help='print the report as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    report = run_bench(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except KeyboardInterrupt as err:
+        print(err, file=sys.stderr)
+        sys.exit(130)
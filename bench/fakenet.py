@@ -0,0 +1,267 @@
+"""A local stand-in for the internet, for benchmarking blclib.
+
+`FakeInternet` is an HTTP server that serves a generated site (see
+`bench.sitegen`) for its own `localhost:PORT` address, and that simulates
+any other host name that it is asked for.  Point a `requests.Session` at it
+as an HTTP proxy, and every `http://` URL goes through it; each simulated
+host has a `HostBehavior` that controls its latency, its rate-limit (answered
+with 429 + Retry-After), and how slowly it sends response bodies.
+
+"""
+
+import json
+import math
+import mimetypes
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import urllib.request
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import Connection
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+STATS_PATH = '/__bench_stats__'
+
+CONTENT_TYPES = {
+    '.css': 'text/css',
+    '.html': 'text/html',
+    '.js': 'application/javascript',
+    '.map': 'application/json',
+    '.png': 'image/png',
+    '.txt': 'text/plain',
+}
+
+
+class HostBehavior(NamedTuple):
+    latency: float = 0.0
+    # Requests per second that the host allows before it starts answering 429s.
+    rate_limit: Optional[float] = None
+    # How to express Retry-After: 'seconds' or 'date'.
+    retry_after: str = 'seconds'
+    # Seconds to stall in the middle of sending each body.
+    body_delay: float = 0.0
+
+
+class _Bucket:
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self.tokens = rate
+        self.stamp = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token; returns 0 on success, or how many seconds until a
+        token will be available."""
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class FakeInternet(ThreadingHTTPServer):
+    daemon_threads = True
+    # Like a real server's; the default of 5 drops connections from an AsyncBaseChecker.
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        pubdir: str,
+        behaviors: Dict[str, HostBehavior],
+        anchors: int = 10,
+        address: Tuple[str, int] = ('127.0.0.1', 0),
+    ) -> None:
+        super().__init__(address, _Handler)
+        self.pubdir = pubdir
+        self.behaviors = behaviors
+        self.anchors = anchors
+        self.site_host = f'localhost:{self.server_address[1]}'
+        self.redirects = self._read_redirects(os.path.join(pubdir, '_redirects'))
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, _Bucket] = {}
+        self.requests: Counter = Counter()
+        self.responses: Counter = Counter()
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # A client hanging up on a kept-alive connection is business as usual.
+        if not isinstance(sys.exc_info()[1], ConnectionResetError):
+            super().handle_error(request, client_address)
+
+    @staticmethod
+    def _read_redirects(filename: str) -> Dict[str, Tuple[str, int]]:
+        ret: Dict[str, Tuple[str, int]] = {}
+        if os.path.exists(filename):
+            with open(filename) as fh:
+                for line in fh:
+                    parts = line.split()
+                    if len(parts) >= 2:
+                        ret[parts[0]] = (parts[1], int(parts[2]) if len(parts) > 2 else 301)
+        return ret
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'requests': dict(self.requests),
+                'responses': dict(self.responses),
+            }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeInternet
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(
+        self,
+        status: int,
+        body: bytes = b'',
+        headers: Optional[Dict[str, str]] = None,
+        body_delay: float = 0.0,
+    ) -> None:
+        with self.server.lock:
+            self.server.responses[status] += 1
+        self.send_response(status)
+        for key, val in (headers or {}).items():
+            self.send_header(key, val)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        if body_delay:
+            half = len(body) // 2
+            self.wfile.write(body[:half])
+            self.wfile.flush()
+            time.sleep(body_delay)
+            body = body[half:]
+        self.wfile.write(body)
+
+    def do_HEAD(self) -> None:
+        self.do_GET()
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        host = url.netloc or self.headers.get('Host', '')
+        path = url.path or '/'
+        if path == STATS_PATH:
+            self._send(
+                200,
+                json.dumps(self.server.stats()).encode('utf-8'),
+                {'Content-Type': 'application/json'},
+            )
+            return
+        with self.server.lock:
+            self.server.requests[host] += 1
+        if host in (self.server.site_host, f'127.0.0.1:{self.server.server_address[1]}'):
+            self._serve_site(path, url.query)
+        else:
+            self._serve_external(host, path)
+
+    def _serve_site(self, path: str, query: str) -> None:
+        redirect = self.server.redirects.get(path) or self.server.redirects.get(path + '/')
+        if redirect:
+            location = redirect[0] + (f'?{query}' if query else '')
+            self._send(
+                redirect[1], b'', {'Location': location, 'Content-Type': 'text/plain'}
+            )
+            return
+        filepath = os.path.join(self.server.pubdir, path.lstrip('/'))
+        if os.path.isdir(filepath):
+            if not path.endswith('/'):
+                self._send(302, b'', {'Location': path + '/', 'Content-Type': 'text/plain'})
+                return
+            filepath = os.path.join(filepath, 'index.html')
+        try:
+            with open(filepath, 'rb') as fh:
+                body = fh.read()
+        except OSError:
+            with open(os.path.join(self.server.pubdir, '404.html'), 'rb') as fh:
+                self._send(404, fh.read(), {'Content-Type': 'text/html'})
+            return
+        ext = os.path.splitext(filepath)[1]
+        content_type = CONTENT_TYPES.get(ext) or mimetypes.guess_type(filepath)[0]
+        self._send(200, body, {'Content-Type': content_type or 'application/octet-stream'})
+
+    def _serve_external(self, host: str, path: str) -> None:
+        behavior = self.server.behaviors.get(host.split(':')[0], HostBehavior())
+        if behavior.latency:
+            time.sleep(behavior.latency)
+        if behavior.rate_limit:
+            with self.server.lock:
+                bucket = self.server.buckets.setdefault(host, _Bucket(behavior.rate_limit))
+                wait = bucket.take()
+            if wait:
+                secs = max(1, math.ceil(wait))
+                if behavior.retry_after == 'date':
+                    retry_after = formatdate(time.time() + secs, usegmt=True)
+                else:
+                    retry_after = str(secs)
+                self._send(
+                    429, b'', {'Retry-After': retry_after, 'Content-Type': 'text/plain'}
+                )
+                return
+        if path.startswith('/missing/'):
+            self._send(404, b'not found', {'Content-Type': 'text/plain'})
+            return
+        body = (
+            f'<!DOCTYPE html>\n<html><head><title>{host}{path}</title></head><body>'
+            + ''.join(
+                f'<h2 id="s{a}">Section {a}</h2><p>{"lorem ipsum " * 20}</p>'
+                for a in range(self.server.anchors)
+            )
+            + '</body></html>\n'
+        ).encode('utf-8')
+        self._send(200, body, {'Content-Type': 'text/html'}, body_delay=behavior.body_delay)
+
+
+def _serve(
+    pubdir: str, behaviors: Dict[str, HostBehavior], anchors: int, conn: Connection
+) -> None:
+    srv = FakeInternet(pubdir, behaviors, anchors)
+    conn.send(srv.server_address[1])
+    srv.serve_forever()
+
+
+class FakeInternetProcess:
+    """Run a FakeInternet in a child process, so that its CPU time and its
+    memory don't count against the checker being measured."""
+
+    port: int
+
+    def __init__(
+        self, pubdir: str, behaviors: Dict[str, HostBehavior], anchors: int
+    ) -> None:
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self._proc = multiprocessing.Process(
+            target=_serve, args=(pubdir, behaviors, anchors, child_conn), daemon=True
+        )
+        self._conn = parent_conn
+
+    def __enter__(self) -> 'FakeInternetProcess':
+        self._proc.start()
+        self.port = self._conn.recv()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._proc.terminate()
+        self._proc.join()
+
+    @property
+    def site_url(self) -> str:
+        return f'http://localhost:{self.port}'
+
+    @property
+    def proxy_url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    def stats(self) -> Dict[str, Any]:
+        opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        with opener.open(f'{self.proxy_url}{STATS_PATH}') as resp:
+            return json.loads(resp.read())
@@ -0,0 +1,109 @@
+"""Check that starting a checker stays cheap.
+
+Usage: python3 -m bench.importtime [OPTIONS] [MODULE...]
+
+Imports each MODULE (by default, each product's `*_blc` module the way
+`python3 -m blclib PRODUCT` does) in a fresh interpreter with `-X
+importtime`, and fails if it takes longer than the budget, or if it pulls
+in any of the heavy parsers (which should only get imported once a page of
+the matching content type turns up).
+
+"""
+
+import argparse
+import glob
+import os.path
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple
+
+# Modules that must not be imported just to start up.
+HEAVY_MODULES = ['bs4', 'lxml', 'soupsieve', 'tinycss2']
+
+DEFAULT_BUDGET = 0.25
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ImportTimes(NamedTuple):
+    # Cumulative seconds for each top-level import.
+    toplevel: Dict[str, float]
+    # Every module that got imported.
+    modules: List[str]
+
+
+def measure(stmt: str) -> ImportTimes:
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', stmt],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    toplevel: Dict[str, float] = {}
+    modules: List[str] = []
+    for line in result.stderr.decode('utf-8').splitlines():
+        # "import time: SELF_US | CUMULATIVE_US | NAME", with NAME indented by depth.
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:') :].split('|')
+        if not cumulative.strip().isdigit():
+            continue  # the header
+        modules.append(name.strip())
+        if not name[1:].startswith(' '):
+            toplevel[name.strip()] = int(cumulative) / 1e6
+    return ImportTimes(toplevel=toplevel, modules=modules)
+
+
+def measure_import(module: str) -> ImportTimes:
+    """Measure importing `module` (along with blclib's CLI), not counting
+    whatever the interpreter imports on its own at startup."""
+    startup = set(measure('pass').modules)
+    times = measure(f'import blclib.__main__, {module}')
+    return ImportTimes(
+        toplevel={k: v for k, v in times.toplevel.items() if k not in startup},
+        modules=[m for m in times.modules if m not in startup],
+    )
+
+
+def default_modules() -> List[str]:
+    return sorted(
+        os.path.basename(path)[: -len('.py')] for path in glob.glob(f'{ROOT}/*_blc.py')
+    )
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python3 -m bench.importtime', description=__doc__)
+    parser.add_argument(
+        '--budget',
+        type=float,
+        default=DEFAULT_BUDGET,
+        help=f'seconds each module may take to import (default: {DEFAULT_BUDGET})',
+    )
+    parser.add_argument('modules', metavar='MODULE', nargs='*')
+    args = parser.parse_args(argv)
+
+    ok = True
+    for module in args.modules or default_modules():
+        times = measure_import(module)
+        total = sum(times.toplevel.values())
+        heavy = sorted({m.split('.')[0] for m in times.modules} & set(HEAVY_MODULES))
+        slowest = sorted(times.toplevel.items(), key=lambda kv: kv[1], reverse=True)[:3]
+        status = 'ok'
+        if total > args.budget:
+            status, ok = f'OVER BUDGET ({args.budget}s)', False
+        if heavy:
+            status, ok = f"imports {', '.join(heavy)}", False
+        print(
+            f"{module}: {total:.3f}s ({status}); slowest: "
+            + ', '.join(f'{name} {secs:.3f}s' for name, secs in slowest)
+        )
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except KeyboardInterrupt as err:
+        print(err, file=sys.stderr)
+        sys.exit(130)
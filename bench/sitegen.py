@@ -0,0 +1,161 @@
+"""Generate synthetic static sites for benchmarking blclib.
+
+The generated tree looks like a `public/` directory that `serve.js` (or
+`bench.fakenet`) can serve: HTML pages that link to each other, to
+fragments, to CSS/JS/image assets, through chains of redirects (listed in a
+Netlify-style `_redirects` file), and out to a configurable set of external
+hosts.
+
+"""
+
+import os
+import random
+from typing import List, NamedTuple
+
+# A 1x1 transparent PNG.
+PNG_BYTES = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082'
+)
+
+
+class SiteShape(NamedTuple):
+    pages: int = 200
+    links_per_page: int = 20
+    anchors_per_page: int = 10
+    fragment_ratio: float = 0.3
+    css_files: int = 4
+    js_files: int = 4
+    images: int = 16
+    redirect_chains: int = 10
+    redirect_chain_length: int = 3
+    redirect_link_ratio: float = 0.05
+    external_hosts: int = 4
+    external_links_per_page: int = 3
+    broken_ratio: float = 0.01
+    seed: int = 0
+
+
+def external_host(i: int) -> str:
+    return f'ext{i}.bench.test'
+
+
+def page_path(i: int) -> str:
+    return f'/p/{i}/'
+
+
+def _write(pubdir: str, urlpath: str, content: str) -> None:
+    fullpath = os.path.join(pubdir, urlpath.lstrip('/'))
+    if fullpath.endswith('/'):
+        fullpath += 'index.html'
+    os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+    with open(fullpath, 'w') as fh:
+        fh.write(content)
+
+
+def _css(shape: SiteShape, rng: random.Random, i: int) -> str:
+    img = lambda: f'/img/{rng.randrange(shape.images)}.png'  # noqa: E731
+    return (
+        f'body {{ background: url({img()}); }}\n'
+        f'@media (min-width: 600px) {{ .hero-{i} {{ background-image: url("{img()}"); }} }}\n'
+        f'@supports (display: grid) {{ .grid-{i} {{ background: url(\'{img()}\'); }} }}\n'
+    )
+
+
+def _js(i: int) -> str:
+    return (
+        f'/*! For license information please see {i}.js.LICENSE.txt */\n'
+        f'console.log("bench {i}");\n'
+        f'//# sourceMappingURL={i}.js.map\n'
+    )
+
+
+def _page(shape: SiteShape, rng: random.Random, i: int) -> str:
+    head: List[str] = [
+        f'<title>Page {i}</title>',
+        f'<link rel="canonical" href="{page_path(i)}">',
+    ]
+    if shape.css_files:
+        head.append(f'<link rel="stylesheet" href="/css/{i % shape.css_files}.css">')
+        head.append('<style>.critical { background: url(/img/0.png); }</style>')
+    if shape.js_files:
+        head.append(f'<script src="/js/{i % shape.js_files}.js"></script>')
+
+    body: List[str] = [f'<h1 id="top">Page {i}</h1>']
+    for a in range(shape.anchors_per_page):
+        body.append(f'<h2 id="s{a}">Section {a}</h2><p>Lorem ipsum dolor sit amet.</p>')
+    if shape.images:
+        body.append(f'<img src="/img/{rng.randrange(shape.images)}.png" alt="">')
+
+    # Always link to the next page, so that every page is reachable.
+    targets = [page_path((i + 1) % shape.pages)]
+    for _ in range(max(shape.links_per_page - 1, 0)):
+        roll = rng.random()
+        if roll < shape.broken_ratio:
+            targets.append(f'/missing/{rng.randrange(1 << 16)}/')
+        elif shape.redirect_chains and roll < shape.broken_ratio + shape.redirect_link_ratio:
+            targets.append(f'/r/{rng.randrange(shape.redirect_chains)}/0/')
+        else:
+            target = page_path(rng.randrange(shape.pages))
+            if shape.anchors_per_page and rng.random() < shape.fragment_ratio:
+                target += f'#s{rng.randrange(shape.anchors_per_page)}'
+            targets.append(target)
+    for _ in range(shape.external_links_per_page if shape.external_hosts else 0):
+        host = external_host(rng.randrange(shape.external_hosts))
+        target = f'http://{host}/page/{rng.randrange(shape.pages)}'
+        if rng.random() < shape.broken_ratio:
+            target = f'http://{host}/missing/{rng.randrange(1 << 16)}'
+        elif shape.anchors_per_page and rng.random() < shape.fragment_ratio:
+            target += f'#s{rng.randrange(shape.anchors_per_page)}'
+        targets.append(target)
+    body += [f'<p><a href="{target}">link {n}</a></p>' for n, target in enumerate(targets)]
+
+    return (
+        '<!DOCTYPE html>\n<html><head>'
+        + ''.join(head)
+        + '</head><body>'
+        + '\n'.join(body)
+        + '</body></html>\n'
+    )
+
+
+def generate_site(pubdir: str, shape: SiteShape) -> None:
+    """Write a synthetic site of the given shape to `pubdir`."""
+    rng = random.Random(shape.seed)
+
+    _write(
+        pubdir,
+        '/',
+        '<!DOCTYPE html>\n<html><head><title>Home</title>'
+        '<link rel="canonical" href="/"></head><body>'
+        f'<a href="{page_path(0)}">start</a></body></html>\n',
+    )
+    _write(
+        pubdir,
+        '/404.html',
+        '<!DOCTYPE html>\n<html><head><title>Not Found</title>'
+        '<link rel="canonical" href="/404.html"></head><body>'
+        '<a href="/">home</a></body></html>\n',
+    )
+    for i in range(shape.pages):
+        _write(pubdir, page_path(i), _page(shape, rng, i))
+    for i in range(shape.css_files):
+        _write(pubdir, f'/css/{i}.css', _css(shape, rng, i))
+    for i in range(shape.js_files):
+        _write(pubdir, f'/js/{i}.js', _js(i))
+        _write(pubdir, f'/js/{i}.js.map', '{"version":3,"sources":[],"mappings":""}\n')
+        _write(pubdir, f'/js/{i}.js.LICENSE.txt', 'MIT\n')
+    os.makedirs(os.path.join(pubdir, 'img'), exist_ok=True)
+    for i in range(shape.images):
+        with open(os.path.join(pubdir, 'img', f'{i}.png'), 'wb') as fh:
+            fh.write(PNG_BYTES)
+
+    redirects: List[str] = []
+    for c in range(shape.redirect_chains):
+        for hop in range(shape.redirect_chain_length):
+            if hop + 1 < shape.redirect_chain_length:
+                to = f'/r/{c}/{hop+1}/'
+            else:
+                to = page_path(rng.randrange(shape.pages)) if shape.pages else '/'
+            redirects.append(f'/r/{c}/{hop}/ {to} 301')
+    _write(pubdir, '/_redirects', ''.join(line + '\n' for line in redirects))
@@ -1,14 +1,47 @@
-from .checker import BaseChecker, get_content_type
-from .httpcache import RetryAfterException
-from .models import Link, URLReference
+import importlib
+from typing import TYPE_CHECKING, Any, List
+
+if TYPE_CHECKING:
+    from .asyncchecker import AsyncBaseChecker
+    from .checker import BaseChecker, get_content_type, settings_errors
+    from .httpcache import RetryAfterException
+    from .models import Link, URLReference
 
 __all__ = [
+    # asyncchecker.py
+    'AsyncBaseChecker',
     # checker.py
     'BaseChecker',
     'get_content_type',
+    'settings_errors',
     # httpcache.py
     'RetryAfterException',
     # models.py
     'Link',
     'URLReference',
 ]
+
+# Which module each public name is from.  They get imported on first use (PEP 562), so that
+# `import blclib.linkgraph` (or `python -m blclib`) doesn't pay for importing requests and
+# friends.
+_EXPORTS = {
+    'AsyncBaseChecker': 'asyncchecker',
+    'BaseChecker': 'checker',
+    'get_content_type': 'checker',
+    'settings_errors': 'checker',
+    'RetryAfterException': 'httpcache',
+    'Link': 'models',
+    'URLReference': 'models',
+}
+
+
+def __getattr__(name: str) -> Any:
+    if (module := _EXPORTS.get(name)) is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    ret = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = ret
+    return ret
+
+
+def __dir__() -> List[str]:
+    return sorted(list(globals()) + __all__)
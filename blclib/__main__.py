@@ -0,0 +1,40 @@
+"""Run a product's broken-link checker.
+
+Usage: python3 -m blclib PRODUCT ARGS...
+
+PRODUCT names a `PRODUCT_blc.py` script next to the blclib directory
+(generic, getambassadorio, telepresenceio, ...), and ARGS are that script's
+arguments.  Only that product's module gets imported.
+
+"""
+
+import importlib
+import os.path
+import sys
+from typing import List
+
+
+def main(argv: List[str]) -> int:
+    prog = 'python3 -m blclib'
+    if len(argv) < 2 or argv[1].startswith('-'):
+        print(f"Usage: {prog} PRODUCT ARGS...", file=sys.stderr)
+        return 2
+    product = argv[1]
+    modname = f'{product}_blc'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        module = importlib.import_module(modname)
+    except ModuleNotFoundError as err:
+        if err.name != modname:
+            raise
+        print(f"{prog}: unknown product: {product!r}", file=sys.stderr)
+        return 2
+    return module.cli([f'{prog} {product}', *argv[2:]])
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv))
+    except KeyboardInterrupt as err:
+        print(err, file=sys.stderr)
+        sys.exit(130)
@@ -0,0 +1,224 @@
+"""Columnar analysis of the link records from one or more check runs.
+
+The records come from the link graphs that runs record with LINKGRAPH
+(see linkgraph.py), one database per run, or from `.npz` exports of those
+(see `save()`), which load much faster.  They are held as parallel arrays:
+one row per link, with the page, the link target, and the verdict each
+dictionary-encoded as an index in to a table of distinct strings; so
+group-bys are `np.bincount()`s, and run-to-run diffs are `np.isin()`s,
+with Python only ever looking at each distinct string once.
+
+"""
+
+import os.path
+import re
+import sqlite3
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Verdicts are grouped in to classes by the first of these patterns that matches.
+ERROR_CLASSES: List[Tuple[str, str]] = [
+    (r'^(HTTP_[0-9A-Z]+)', r'\1'),
+    (r'^fragment:', 'fragment'),
+    (r'^GitHub( backend)?:', 'github'),
+    (r'^redirect loop', 'redirect loop'),
+    (r'^too many redirects', 'too many redirects'),
+    (r'NameResolution|Failed to resolve|Name or service not known', 'dns'),
+    (r'Connection refused|ConnectionRefused', 'refused'),
+    (r'[Tt]imed? ?out', 'timeout'),
+    (r'Max retries exceeded|ConnectionError|Connection aborted', 'connection'),
+]
+
+
+class Results(NamedTuple):
+    # The names of the runs (their filenames, without the directory or extension).
+    runs: List[str]
+    # The distinct URLs (without fragments) and verdicts; errors[0] is '' (not broken).
+    urls: np.ndarray
+    errors: np.ndarray
+    # One row per link.
+    run: np.ndarray
+    page: np.ndarray
+    link: np.ndarray
+    error: np.ndarray
+
+    @property
+    def broken(self) -> np.ndarray:
+        return self.error != 0
+
+
+def _encode(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Dictionary-encode an array of strings; returns (table, codes)."""
+    table, codes = np.unique(values, return_inverse=True)
+    return table, codes.astype(np.int32)
+
+
+def load_linkgraph(path: str) -> Results:
+    """Load the links recorded in the link graph database `path`."""
+    db = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        url_rows = db.execute('SELECT id, url FROM urls').fetchall()
+        errors = [''] + [
+            row[0]
+            for row in db.execute(
+                'SELECT DISTINCT broken FROM edges WHERE broken IS NOT NULL'
+            )
+        ]
+        edge_rows = db.execute('SELECT src, dst, broken FROM edges').fetchall()
+    finally:
+        db.close()
+    ids = np.array([row[0] for row in url_rows], dtype=np.int64)
+    # {database ID: index in to `urls`}, as an array.
+    lookup = np.zeros(int(ids.max()) + 1 if len(ids) else 1, dtype=np.int32)
+    lookup[ids] = np.arange(len(ids), dtype=np.int32)
+    codes: Dict[Optional[str], int] = {error: i for i, error in enumerate(errors)}
+    codes[None] = 0
+    count = len(edge_rows)
+    return Results(
+        runs=[run_name(path)],
+        urls=np.array([row[1] for row in url_rows], dtype=object),
+        errors=np.array(errors, dtype=object),
+        run=np.zeros(count, dtype=np.int32),
+        page=lookup[np.fromiter((row[0] for row in edge_rows), np.int64, count)],
+        link=lookup[np.fromiter((row[1] for row in edge_rows), np.int64, count)],
+        error=np.fromiter((codes[row[2]] for row in edge_rows), np.int32, count),
+    )
+
+
+def save(results: Results, path: str) -> None:
+    """Save `results` as an `.npz` file, for `load()`."""
+    np.savez(
+        path,
+        runs=np.array(results.runs, dtype=str),
+        urls=results.urls.astype(str),
+        errors=results.errors.astype(str),
+        run=results.run,
+        page=results.page,
+        link=results.link,
+        error=results.error,
+    )
+
+
+def load(path: str) -> Results:
+    """Load a link graph database, or an `.npz` file from `save()`."""
+    if not path.endswith('.npz'):
+        return load_linkgraph(path)
+    with np.load(path, allow_pickle=False) as data:
+        return Results(
+            runs=[str(name) for name in data['runs']],
+            urls=data['urls'].astype(object),
+            errors=data['errors'].astype(object),
+            run=data['run'],
+            page=data['page'],
+            link=data['link'],
+            error=data['error'],
+        )
+
+
+def run_name(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def concat(parts: Sequence[Results]) -> Results:
+    """Combine the results of several runs in to one set of arrays."""
+    urls, url_codes = _encode(np.concatenate([part.urls for part in parts]))
+    # Keep '' (not broken) at errors[0].
+    errors, error_codes = _encode(np.concatenate([part.errors[1:] for part in parts]))
+    errors = np.concatenate([np.array([''], dtype=object), errors])
+    error_codes = error_codes + 1
+    runs: List[str] = []
+    run, page, link, error = [], [], [], []
+    url_base = error_base = 0
+    for part in parts:
+        url_map = url_codes[url_base : url_base + len(part.urls)]
+        error_map = np.concatenate(
+            [[0], error_codes[error_base : error_base + len(part.errors) - 1]]
+        ).astype(np.int32)
+        url_base += len(part.urls)
+        error_base += len(part.errors) - 1
+        run.append(part.run + len(runs))
+        page.append(url_map[part.page])
+        link.append(url_map[part.link])
+        error.append(error_map[part.error])
+        runs += part.runs
+    return Results(
+        runs=runs,
+        urls=urls,
+        errors=errors,
+        run=np.concatenate(run).astype(np.int32),
+        page=np.concatenate(page).astype(np.int32),
+        link=np.concatenate(link).astype(np.int32),
+        error=np.concatenate(error).astype(np.int32),
+    )
+
+
+def error_class(error: str) -> str:
+    for pattern, repl in ERROR_CLASSES:
+        if match := re.search(pattern, error):
+            return match.expand(repl)
+    return 'other'
+
+
+class Table(NamedTuple):
+    # The group names (rows) and run names (columns) of `counts`.
+    groups: np.ndarray
+    runs: List[str]
+    counts: np.ndarray
+
+
+def count_broken(
+    results: Results, by: str, key: Callable[[str], str], mask: 'np.ndarray | None' = None
+) -> Table:
+    """Count the broken links in each run, grouped by `key` of either the
+    link's target URL (`by='link'`), the page it is on (`by='page'`), or its
+    verdict (`by='error'`).  `key` is called once per distinct string."""
+    if by == 'error':
+        table, codes = results.errors, results.error
+    elif by in ('link', 'page'):
+        table, codes = results.urls, getattr(results, by)
+    else:
+        raise ValueError(f"can't group by {by!r}")
+    groups, group_of = _encode(np.array([key(value) for value in table], dtype=object))
+    select = results.broken if mask is None else (results.broken & mask)
+    nruns = len(results.runs)
+    counts = np.bincount(
+        group_of[codes[select]].astype(np.int64) * nruns + results.run[select],
+        minlength=len(groups) * nruns,
+    ).reshape(len(groups), nruns)
+    # Drop the groups that have no broken links in any run.
+    keep = counts.sum(axis=1) > 0
+    return Table(groups=groups[keep], runs=results.runs, counts=counts[keep])
+
+
+class Diff(NamedTuple):
+    # Indexes of the rows (in to the Results) of links that are broken in the new run but
+    # weren't in the old one, and of links that were broken in the old run but aren't in
+    # the new one (whether they were fixed or removed).
+    new: np.ndarray
+    fixed: np.ndarray
+
+
+def diff_runs(results: Results, old: int, new: int) -> Diff:
+    """Compare which (page, link) pairs are broken in runs `old` and `new`."""
+    pair = results.page.astype(np.int64) * len(results.urls) + results.link
+    in_old = (results.run == old) & results.broken
+    in_new = (results.run == new) & results.broken
+    return Diff(
+        new=np.flatnonzero(in_new & ~np.isin(pair, pair[in_old])),
+        fixed=np.flatnonzero(in_old & ~np.isin(pair, pair[in_new])),
+    )
+
+
+def top(table: Table, n: int) -> Table:
+    """Return the `n` groups with the most broken links in the last run."""
+    order = np.lexsort((table.groups, -table.counts[:, -1]))[:n]
+    return Table(groups=table.groups[order], runs=table.runs, counts=table.counts[order])
+
+
+def by_run(results: Results) -> List[Tuple[str, int, int]]:
+    """Return [(run, links, broken links)], in run order."""
+    nruns = len(results.runs)
+    links = np.bincount(results.run, minlength=nruns)
+    broken = np.bincount(results.run[results.broken], minlength=nruns)
+    return [(name, int(links[i]), int(broken[i])) for i, name in enumerate(results.runs)]
@@ -0,0 +1,158 @@
+"""A BaseChecker whose `run()` is an asyncio event loop, so that it can
+have many requests in flight at once.
+
+Each batch of tasks that the scheduler hands out first has its URL (and
+any redirect hops) fetched by an AsyncHTTPClient, which puts the responses
+in the checker's HTTPClient cache; then the batch is run the same way that
+BaseChecker runs it, with every request answered from the cache.  So the
+checking logic (and every hook) is exactly BaseChecker's; only the waiting
+on the network happens concurrently.
+
+Links that the GitHub resolver answers for (see github.py) aren't fetched;
+instead, the resolver's backend lookups for them (running git, or asking
+the API) are done ahead of time on a worker thread, and memoized, so that
+they don't hold up the event loop either.
+
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set, Union
+from urllib.parse import urldefrag
+
+import requests.exceptions
+
+from .asyncclient import AsyncHTTPClient
+from .checker import BaseChecker
+from .github import parse_github_url
+from .httpcache import RetryAfterException
+from .models import Link, URLReference
+
+
+class AsyncBaseChecker(BaseChecker):
+    # How many batches may be fetching at once.  Each one holds at most a single response
+    # body, so this also bounds how much memory is taken up by bodies that are in flight.
+    max_in_flight: int = 64
+    # How many connections to keep open, in total and to any one host.
+    max_connections: int = 100
+    max_connections_per_host: int = 8
+    # Where GitHub resolver lookups get done (one at a time, since the resolver isn't
+    # thread-safe), while running.  They share nothing else with the event loop's thread;
+    # APIBackend has its own HTTP client (see BaseChecker.__init__).
+    _github_pool: Optional[ThreadPoolExecutor] = None
+
+    def run(self) -> None:
+        """Run the checker; keep running tasks until the queue (see
+        `enqueue()`) is empty.
+
+        """
+        asyncio.run(self._run_async())
+
+    async def _run_async(self) -> None:
+        self._start_run()
+        self._github_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='github')
+        try:
+            await self._run_loop()
+        finally:
+            self._github_pool.shutdown(wait=False)
+            self._github_pool = None
+        self._finish_run()
+
+    async def _run_loop(self) -> None:
+        in_flight: Set['asyncio.Task[None]'] = set()
+        async with AsyncHTTPClient(
+            self._client,
+            max_connections=self.max_connections,
+            max_connections_per_host=self.max_connections_per_host,
+        ) as aclient:
+            while len(self._scheduler) or in_flight:
+                now = time.time()
+                if len(in_flight) < self.max_in_flight and len(self._scheduler):
+                    batch = self._next_batch(now)
+                    if batch is not None:
+                        if self._ready_to_run(batch, now):
+                            in_flight.add(
+                                asyncio.create_task(self._run_batch_async(aclient, batch))
+                            )
+                        continue
+                if not in_flight:
+                    # There's nothing to do but sleep
+                    secs = self._idle_secs(now)
+                    self.handle_sleep(secs)
+                    await asyncio.sleep(secs)
+                    continue
+                # Wait for something to finish; or, if there's room for more, for the next
+                # parked task to come due.
+                timeout = None
+                if len(in_flight) < self.max_in_flight and len(self._scheduler):
+                    timeout = self._idle_secs(now)
+                done, in_flight = await asyncio.wait(
+                    in_flight, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    task.result()
+                self._tick(time.time())
+
+    async def _run_batch_async(
+        self, aclient: AsyncHTTPClient, batch: List[Union[Link, URLReference]]
+    ) -> None:
+        task = batch[0]
+        url = task.resolved if isinstance(task, URLReference) else task.linkurl.resolved
+        if not (isinstance(task, URLReference) and self._skip_page(task)):
+            try:
+                if not await self._prefetch_github(batch):
+                    await self._prefetch(aclient, url)
+            except RetryAfterException as err:
+                self._park_throttled(batch, err)
+                return
+            except requests.exceptions.RequestException:
+                # It's in the cache; _run_batch() will run in to it again and deal with it.
+                pass
+        self._run_batch(batch)
+
+    async def _prefetch_github(self, batch: List[Union[Link, URLReference]]) -> bool:
+        """If the GitHub resolver answers for this batch of links, do its
+        lookups for them (see GitHubResolver.prefetch()) on the worker
+        thread, and return True."""
+        task = batch[0]
+        if not (
+            self.github
+            and self._github_pool
+            and isinstance(task, Link)
+            and parse_github_url(task.linkurl.resolved)
+        ):
+            return False
+        # The same URLs that _check_links() will ask about.
+        url = urldefrag(task.linkurl.resolved).url
+        check_urls = {
+            self.redirects.resolve(link.linkurl.resolved).final
+            for link in batch
+            if isinstance(link, Link)
+        }
+        return await asyncio.get_running_loop().run_in_executor(
+            self._github_pool, self.github.prefetch, url, check_urls
+        )
+
+    async def _prefetch(self, aclient: AsyncHTTPClient, url: str) -> None:
+        """Fetch `url` in to the cache the same way that `_fetch()` would,
+        following redirects through `self.redirects`."""
+        if url.startswith('data:'):
+            return
+        while True:
+            redirect = self.redirects.resolve(url)
+            if redirect.error:
+                return
+            target = urldefrag(redirect.final).url
+            resp = await aclient.prefetch(
+                target,
+                headers={
+                    'User-Agent': self._get_user_agent(target),
+                },
+                timeout=self._get_timeout(target),
+                read_body=self._wants_body,
+                spool_body=self._spools_body,
+            )
+            if not resp.is_redirect:
+                return
+            self._add_redirect_hop(target, resp)
@@ -0,0 +1,200 @@
+"""An asyncio client (using aiohttp) that sends requests on behalf of an
+HTTPClient, so that many requests can be in flight at once without a
+thread for each.
+
+It doesn't replace HTTPClient: it shares that client's cache, rate limiter,
+circuit breaker, and hooks (see HTTPClient._start_send() and friends), and
+puts each response in to that client's cache just as if HTTPClient had sent
+the request itself.  So when the (synchronous) checker code then makes the
+same request, it is answered from the cache straight away; with the same
+response, or the same exception.
+
+Requests are coalesced: a prefetch of a URL that is already being fetched
+waits for that fetch and shares its outcome, instead of sending the
+request again (see HTTPClient.coalesced).
+
+"""
+
+import asyncio
+import tempfile
+import time
+from datetime import timedelta
+from typing import Any, BinaryIO, Callable, Dict, Optional, Tuple, Union, cast
+from urllib.parse import urlparse
+
+import aiohttp
+import requests
+import requests.exceptions
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .httpcache import SPOOL_CHUNK_SIZE, HTTPClient
+
+
+def _headers(aresp: aiohttp.ClientResponse) -> 'CaseInsensitiveDict[str]':
+    # Decode and fold the headers the same way that requests (well, http.client and urllib3)
+    # does, so that a response reads the same no matter which client fetched it.
+    ret: 'CaseInsensitiveDict[str]' = CaseInsensitiveDict()
+    for rawkey, rawval in aresp.raw_headers:
+        key, val = rawkey.decode('latin1'), rawval.decode('latin1')
+        ret[key] = f'{ret[key]}, {val}' if key in ret else val
+    return ret
+
+
+class AsyncHTTPClient:
+    """AsyncHTTPClient prefetches GET requests in to `client`'s cache.  Use
+    it as an `async with` context manager (it needs a running event loop).
+
+    """
+
+    client: HTTPClient
+    max_connections: int
+    max_connections_per_host: int
+    _session: Optional[aiohttp.ClientSession]
+    # The outcome (a response or an exception) of each fetch that is in flight, by cache key.
+    _in_flight: Dict[str, 'asyncio.Future[Union[requests.Response, Exception]]']
+
+    def __init__(
+        self,
+        client: HTTPClient,
+        max_connections: int = 100,
+        max_connections_per_host: int = 8,
+    ) -> None:
+        self.client = client
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self._session = None
+        self._in_flight = {}
+
+    async def __aenter__(self) -> 'AsyncHTTPClient':
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.max_connections, limit_per_host=self.max_connections_per_host
+            ),
+            trust_env=self.client.trust_env,
+            # Let requests' default headers (from the prepared request) through as-is.
+            skip_auto_headers=['User-Agent', 'Accept-Encoding'],
+        )
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        assert self._session
+        await self._session.close()
+        self._session = None
+
+    async def prefetch(
+        self,
+        url: str,
+        headers: Optional[Any] = None,
+        timeout: Tuple[float, float] = (10.0, 10.0),
+        read_body: Callable[[requests.Response], bool] = lambda resp: True,
+        spool_body: Callable[[requests.Response], bool] = lambda resp: False,
+    ) -> requests.Response:
+        """GET `url` (without following redirects) unless it's already cached,
+        and cache the response; `read_body` says whether to download the body
+        once the headers are in, and `spool_body` whether to download it to a
+        temporary file (see HTTPClient._spool_body()).  Returns the response, and raises the
+        same exceptions that HTTPClient would.
+
+        """
+        client = self.client
+        req = client.prepare_request(requests.Request('GET', url, headers=headers))
+        cachekey = client._cache_key(req)
+        if not cachekey:
+            return await self._fetch(req, timeout, read_body, spool_body)
+        if (cached := client._cached(cachekey)) is not None:
+            return cached
+        if (pending := self._in_flight.get(cachekey)) is not None:
+            client.coalesced += 1
+            outcome = await asyncio.shield(pending)
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            self._in_flight[cachekey] = fut
+            try:
+                outcome = await self._fetch(req, timeout, read_body, spool_body)
+            except Exception as err:
+                outcome = err
+            except BaseException:
+                # Cancelled; so are the requests waiting on us.
+                fut.cancel()
+                raise
+            finally:
+                del self._in_flight[cachekey]
+            fut.set_result(outcome)
+        if isinstance(outcome, requests.exceptions.RequestException):
+            # Have each request that this prefetch stands in for fail the same way.
+            client._failures.setdefault(cachekey, []).append(outcome)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def _fetch(
+        self,
+        req: requests.models.PreparedRequest,
+        timeout: Tuple[float, float],
+        read_body: Callable[[requests.Response], bool],
+        spool_body: Callable[[requests.Response], bool],
+    ) -> requests.Response:
+        client = self.client
+        netloc = client._start_send(req, stream=True, timeout=timeout)
+        try:
+            resp, spooled = await self._send(req, timeout, read_body, spool_body)
+        except requests.exceptions.RequestException as err:
+            client._fail_send(netloc, err)
+            raise
+        client._finish_send(req, netloc, resp)
+        if spooled is not None:
+            return client._cache_spooled(resp, spooled)
+        client._cache_body(resp)
+        return resp
+
+    async def _send(
+        self,
+        req: requests.models.PreparedRequest,
+        timeout: Tuple[float, float],
+        read_body: Callable[[requests.Response], bool],
+        spool_body: Callable[[requests.Response], bool],
+    ) -> Tuple[requests.Response, Optional[BinaryIO]]:
+        """Send `req`; returns the response, and the temporary file that its
+        body was spooled to (if it was)."""
+        assert self._session
+        assert req.url
+        proxies = self.client.proxies or {}
+        start = time.monotonic()
+        try:
+            async with self._session.get(
+                req.url,
+                headers=dict(req.headers),
+                allow_redirects=False,
+                timeout=aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1]),
+                proxy=proxies.get(urlparse(req.url).scheme),
+            ) as aresp:
+                resp = requests.Response()
+                resp.status_code = aresp.status
+                resp.reason = aresp.reason or ''
+                resp.headers = _headers(aresp)
+                resp.encoding = get_encoding_from_headers(resp.headers)
+                resp.url = req.url
+                resp.request = req
+                resp.elapsed = timedelta(seconds=time.monotonic() - start)
+                # If the body isn't read, leaving the `async with` drops the connection (like
+                # HTTPClient closing a streamed response without reading it).
+                spooled: Optional[BinaryIO] = None
+                if not read_body(resp):
+                    resp._content = b''
+                elif spool_body(resp):
+                    resp._content = b''
+                    spooled = cast(BinaryIO, tempfile.TemporaryFile())
+                    async for chunk in aresp.content.iter_chunked(SPOOL_CHUNK_SIZE):
+                        spooled.write(chunk)
+                else:
+                    resp._content = await aresp.read()
+                resp._content_consumed = True  # type: ignore[attr-defined]
+                return resp, spooled
+        except asyncio.TimeoutError as err:
+            raise requests.exceptions.Timeout(err, request=req) from err
+        except aiohttp.ClientConnectorError as err:
+            # Chain the underlying OSError, so that circuit.classify_failure() can see it.
+            raise requests.exceptions.ConnectionError(err, request=req) from err.os_error
+        except aiohttp.ClientError as err:
+            raise requests.exceptions.ConnectionError(err, request=req) from err
@@ -0,0 +1,94 @@
+"""Checking several sites in one run.
+
+Sites (one checker each, with its own domain, hooks, and report) tend to
+link to a lot of the same external URLs.  Checked one process after
+another, each of them fetches and judges all of those URLs again; checked
+as a batch, they share:
+
+ - one HTTP client, and so one response cache, one per-host rate limiter,
+   and one circuit breaker;
+ - one memo of external link verdicts (see `BaseChecker.link_memo`), so
+   a link to the same URL gets judged once, whichever site it is on
+   (unless the sites send different User-Agents to its host, in which
+   case each User-Agent gets its own response and verdict);
+ - the document caches (fragment IDs, CSS, `data:` URLs), the redirect
+   map, the link graph, and the GitHub resolver; and
+ - one scheduler, so the task classes get their turns (and throttled
+   hosts get waited out) across all of the sites at once.
+
+A page error fetching an external URL (a timeout, say) is reported by
+whichever site got to it first; every site reports its own links' verdicts.
+
+"""
+
+import math
+import time
+from typing import List, Sequence
+
+from .checker import BaseChecker
+from .scheduler import Scheduler, SiteScheduler
+
+
+class BatchRunner:
+    """BatchRunner runs `checkers` (one per site) together; see the module
+    docstring.  Tasks that were enqueued on them beforehand carry over.
+
+    """
+
+    checkers: List[BaseChecker]
+    _scheduler: Scheduler
+
+    def __init__(self, checkers: Sequence[BaseChecker]) -> None:
+        if not checkers:
+            raise ValueError("no checkers to run")
+        self.checkers = list(checkers)
+        lead = self.checkers[0]
+        self._scheduler = Scheduler(lead._classify, lead.schedule_weights)
+        link_memo = lead.link_memo if lead.link_memo is not None else {}
+        for i, checker in enumerate(self.checkers):
+            own = checker._scheduler
+            checker._scheduler = SiteScheduler(self._scheduler, str(i), checker._classify)
+            own.unpark(math.inf, classes=own.weights)
+            while (batch := own.pop(math.inf)) is not None:
+                for task in batch:
+                    checker._scheduler.push(task)
+            if checker is lead:
+                continue
+            if checker.linkgraph and checker.linkgraph is not lead.linkgraph:
+                checker.linkgraph.close()
+            checker._client = lead._client
+            checker.redirects = lead.redirects
+            checker.github = lead.github
+            checker.linkgraph = lead.linkgraph
+            checker._fragcache = lead._fragcache
+            checker._csscache = lead._csscache
+            checker._datacache = lead._datacache
+        for checker in self.checkers:
+            checker.link_memo = link_memo
+
+    def run(self) -> None:
+        """Run every checker's tasks until none are left.  The first checker's
+        settings (deadline, metrics) apply to the whole batch, and it is the
+        one whose `handle_sleep()` gets called."""
+        lead = self.checkers[0]
+        lead._start_run()
+        for checker in self.checkers[1:]:
+            checker._deadline_at = lead._deadline_at
+        while len(self._scheduler):
+            now = time.time()
+            lead._tick(now)
+            lead._unpark_past_deadline(now)
+            popped = self._scheduler.pop_site(now)
+            if popped is None:
+                # There's nothing to do but sleep
+                secs = lead._idle_secs(now)
+                lead.handle_sleep(secs)
+                time.sleep(secs)
+                continue
+            site, batch = popped
+            checker = self.checkers[int(site)]
+            # Send request hooks to the checker whose task it is.
+            checker._client._checker = checker
+            if checker._ready_to_run(batch, now):
+                checker._run_batch(batch)
+        lead._finish_run()
@@ -0,0 +1,128 @@
+"""Compression for the bodies of cached responses (see httpcache.py), so
+that the cache of a large crawl doesn't hold every HTML and JS file that
+has been fetched in full.
+
+A codec is given as "NAME" or "NAME:LEVEL", where NAME is "zlib", "zstd"
+(if the `zstandard` package is installed), or "none".
+
+Bodies that are only ever read in part (PDFs; see
+`ContentExtractor.spool_body`) aren't compressed, but spooled to an
+anonymous temporary file instead (SpooledBody).
+
+"""
+
+import os
+import time
+import zlib
+from typing import BinaryIO, Callable, Dict, NamedTuple
+
+
+class Codec(NamedTuple):
+    name: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+def _identity(data: bytes) -> bytes:
+    return data
+
+
+def _level(spec: str, level: str, default: int) -> int:
+    if not level:
+        return default
+    try:
+        return int(level)
+    except ValueError:
+        raise ValueError(f"codec {spec!r}: level must be an integer") from None
+
+
+def get_codec(spec: str) -> Codec:
+    """Return the codec described by `spec` (see the module docstring);
+    raises ValueError if there isn't one."""
+    name, _, level = spec.strip().lower().partition(':')
+    if name == 'none':
+        return Codec('none', _identity, _identity)
+    if name == 'zlib':
+        zlevel = _level(spec, level, 1)
+        if not -1 <= zlevel <= 9:
+            raise ValueError(f"codec {spec!r}: level must be from -1 to 9")
+        return Codec(
+            f'zlib:{zlevel}', lambda data: zlib.compress(data, zlevel), zlib.decompress
+        )
+    if name == 'zstd':
+        try:
+            import zstandard
+        except ImportError as err:
+            raise ValueError("codec 'zstd' requires the 'zstandard' package") from err
+        zslevel = _level(spec, level, 3)
+        cctx, dctx = zstandard.ZstdCompressor(level=zslevel), zstandard.ZstdDecompressor()
+        return Codec(f'zstd:{zslevel}', cctx.compress, dctx.decompress)
+    raise ValueError(f"unknown codec: {spec!r}")
+
+
+class CodecStats:
+    """How much memory the cached bodies take up, and how long it took to
+    get them that way."""
+
+    bodies: int = 0
+    raw_bytes: int = 0
+    stored_bytes: int = 0
+    compress_secs: float = 0.0
+    decompressions: int = 0
+    decompress_secs: float = 0.0
+    spooled: int = 0
+    spooled_bytes: int = 0
+
+    def asdict(self) -> Dict[str, float]:
+        return {
+            'bodies': self.bodies,
+            'raw_bytes': self.raw_bytes,
+            'stored_bytes': self.stored_bytes,
+            'ratio': round(self.stored_bytes / self.raw_bytes, 3) if self.raw_bytes else 1.0,
+            'compress_secs': round(self.compress_secs, 3),
+            'decompressions': self.decompressions,
+            'decompress_secs': round(self.decompress_secs, 3),
+            'spooled': self.spooled,
+            'spooled_bytes': self.spooled_bytes,
+        }
+
+
+class PackedBody(NamedTuple):
+    codec: Codec
+    data: bytes
+
+    @classmethod
+    def pack(cls, codec: Codec, body: bytes, stats: CodecStats) -> 'PackedBody':
+        start = time.perf_counter()
+        data = codec.compress(body) if body else body
+        stats.compress_secs += time.perf_counter() - start
+        stats.bodies += 1
+        stats.raw_bytes += len(body)
+        stats.stored_bytes += len(data)
+        return cls(codec, data)
+
+    def unpack(self, stats: CodecStats) -> bytes:
+        if not self.data:
+            return self.data
+        start = time.perf_counter()
+        ret = self.codec.decompress(self.data)
+        stats.decompress_secs += time.perf_counter() - start
+        stats.decompressions += 1
+        return ret
+
+
+class SpooledBody(NamedTuple):
+    file: BinaryIO
+
+    @classmethod
+    def wrap(cls, file: BinaryIO, stats: CodecStats) -> 'SpooledBody':
+        """Wrap `file`, a temporary file that a body has been written to."""
+        file.flush()
+        stats.spooled += 1
+        stats.spooled_bytes += os.fstat(file.fileno()).st_size
+        return cls(file)
+
+    def unpack(self, stats: CodecStats) -> bytes:
+        # Not os.pread(), since not every platform has it.
+        self.file.seek(0)
+        return self.file.read()
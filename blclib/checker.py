@@ -1,22 +1,127 @@
 import os
 import re
 import time
+from fnmatch import fnmatch
 from http.client import HTTPMessage
-from typing import Container, Dict, List, Mapping, Optional, Set, Text, Tuple, Union
-from urllib.parse import urldefrag, urlparse
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Container,
+    Dict,
+    FrozenSet,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Text,
+    Tuple,
+    TypeVar,
+    Union,
+)
+from urllib.parse import urldefrag, urljoin, urlparse
 
-import bs4.element
 import requests
-import tinycss2
-from bs4 import BeautifulSoup
 from requests.utils import parse_header_links
 
-from .data_uri import DataAdapter
+from .bodycodec import get_codec
+from .circuit import CircuitBreaker
+from .css import CSSCache
+from .data_uri import DataAdapter, DataURICache
+from .extractors import ContentExtractor, ExtractorRegistry, default_extractors
+from .github import APIBackend, GitHubResolver, GitMirrorBackend
 from .httpcache import HTTPClient as BaseHTTPClient
-from .httpcache import RetryAfterException
+from .httpcache import RetryAfterException, ThrottledException
+from .linkgraph import LinkGraph
 from .models import Link, URLReference
+from .ratelimit import RateLimiter, parse_rate_limits
+from .redirects import Redirect, RedirectMap
+from .scheduler import DEFAULT_WEIGHTS, EXTERNAL, FRAGMENT, INTERNAL, PAGE, Scheduler
+
+if TYPE_CHECKING:
+    # bs4 (and lxml, and soupsieve) are only imported once there is some HTML to parse; see
+    # _parse_soup().
+    import bs4.element
+    from bs4 import BeautifulSoup
+
+    from .metrics import Metrics
+
+_T = TypeVar('_T')
+
+# Why each malformed setting below is malformed, by name; see settings_errors().
+_settings_errors: Dict[str, str] = {}
+
+
+def _setting(name: str, parse: Callable[[str], _T], default: str) -> _T:
+    """Return the environment variable `name` (or `default`, if it isn't set,
+    or is malformed; see `settings_errors()`) parsed by `parse`."""
+    value = os.getenv(name, '') or default
+    try:
+        return parse(value)
+    except ValueError as err:
+        _settings_errors[name] = f'{err}'
+        return parse(default)
+
+
+def settings_errors() -> List[str]:
+    """Return a "NAME: why" message for each of the environment variables
+    read by blclib that is malformed (and so is being ignored).  A program
+    using blclib should report these, rather than carry on."""
+    return [f'{name}: {err}' for name, err in _settings_errors.items()]
+
+
+def parse_timeouts(value: str) -> Dict[str, Tuple[float, float]]:
+    """Parse a string of the form "github.com=5/30,*.example.com=10" in to a
+    {host-pattern: (connect-timeout, read-timeout)} dict; a single number
+    is used for both.
+
+    """
+    ret: Dict[str, Tuple[float, float]] = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        pattern, sep, timeouts = item.partition('=')
+        if not sep:
+            raise ValueError(f"expected HOST=SECONDS[/SECONDS], got {item.strip()!r}")
+        connect, _, read = timeouts.partition('/')
+        ret[pattern.strip().lower()] = (float(connect), float(read or connect))
+    return ret
+
+
+def _codec_spec(value: str) -> str:
+    get_codec(value)  # raises ValueError if there is no such codec
+    return value
+
 
 USER_AGENT = os.getenv('USER_AGENT', 'github.com/datawire/getambassador.io-blc2')
+RATE_LIMITS = _setting('RATE_LIMITS', parse_rate_limits, '')
+# If set, how many seconds after giving up on an unreachable host to try it once more.
+CIRCUIT_COOLDOWN = _setting('CIRCUIT_COOLDOWN', float, '0') or None
+# (connect, read) timeouts, in seconds.
+DEFAULT_TIMEOUT = (10.0, 10.0)
+# If set, how many seconds the whole run may take (see BaseChecker.deadline).
+DEADLINE = _setting('DEADLINE', float, '0') or None
+# If set, the filename of an SQLite database to record the link graph in (see linkgraph.py).
+LINKGRAPH = os.getenv('LINKGRAPH', '')
+# If set, check links in to GitHub repositories against git mirrors in this directory (see
+# github.py) ...
+GITHUB_MIRROR = os.getenv('GITHUB_MIRROR', '')
+# ... or else against the GitHub REST API at this URL.
+GITHUB_API = os.getenv('GITHUB_API', '')
+# How to compress the bodies of cached responses (see bodycodec.py).
+CACHE_CODEC = _setting('CACHE_CODEC', _codec_spec, 'zlib:1')
+# If set, the localhost port to serve Prometheus metrics on (see metrics.py).
+METRICS_PORT = _setting('METRICS_PORT', int, '0') or None
+# If set, how many seconds apart to print a status line (to stderr).
+STATUS_INTERVAL = _setting('STATUS_INTERVAL', float, '0') or None
+
+TIMEOUTS = {
+    **_setting('TIMEOUTS', parse_timeouts, ''),
+    # The local server should answer right away; don't wait on it to connect.
+    'localhost': (1.0, DEFAULT_TIMEOUT[1]),
+    'localhost:*': (1.0, DEFAULT_TIMEOUT[1]),
+    '127.0.0.1': (1.0, DEFAULT_TIMEOUT[1]),
+    '127.0.0.1:*': (1.0, DEFAULT_TIMEOUT[1]),
+}
 
 
 def get_content_type(resp: requests.Response) -> str:
@@ -31,6 +136,9 @@ class HTTPClient(BaseHTTPClient):
     def __init__(self, checker: 'BaseChecker'):
         self._checker = checker
         super().__init__()
+        self.limiter = RateLimiter(checker.rate_limits)
+        self.breaker = CircuitBreaker(checker.circuit_cooldown)
+        self.codec = get_codec(checker.cache_codec)
         self.mount('data:', DataAdapter())
 
     def hook_before_send(
@@ -73,7 +181,7 @@ def task_netloc(task: Union[Link, URLReference]) -> str:
 # types-beautifulsoup4 4.10 says that bs4.element.Tag.get returns `str | list[str] | None`,
 # which I'm pretty sure is wrong, I don't think it's actually possible for it to return a
 # list[str].  So, uh, have this little assertion validate that belief.
-def get_tag_attr(tag: bs4.element.Tag, attrname: str) -> Optional[str]:
+def get_tag_attr(tag: 'bs4.element.Tag', attrname: str) -> Optional[str]:
     ret = tag.get(attrname)
     assert (ret is None) or isinstance(ret, str)
     return ret
@@ -81,15 +189,71 @@ def get_tag_attr(tag: bs4.element.Tag, attrname: str) -> Optional[str]:
 
 class BaseChecker:
     _client: HTTPClient
-    _bodycache: Dict[str, Union[BeautifulSoup, str]] = dict()
-    _queue: List[Union[Link, URLReference]] = []
-    _queued_pages: Set[str] = set()
-    _done_pages: Set[str] = set()
+    extractors: ExtractorRegistry
+    linkgraph: Optional[LinkGraph]
+    redirects: RedirectMap
+    github: Optional[GitHubResolver]
+    # Redirect chains longer than this get reported to handle_redirect_chain().
+    max_redirect_hops: int = 3
+    # The fragment IDs in each HTML document (by URL without a fragment), or why there aren't
+    # any.
+    _fragcache: Dict[str, Union[FrozenSet[str], str]]
+    _csscache: CSSCache
+    _datacache: DataURICache
+    _scheduler: Scheduler
+    # How many turns each class of task gets relative to the others (see scheduler.py).
+    schedule_weights: Dict[str, float] = dict(DEFAULT_WEIGHTS)
+    _queued_pages: Set[str]
+    _done_pages: Set[str]
+    # If set, the verdicts on external links (by the User-Agent they get checked with, and
+    # resolved URL, fragment and all); a link found here isn't checked again.  Checkers in
+    # a batch share one (see batch.py).
+    link_memo: Optional[Dict[Tuple[str, str], Optional[str]]] = None
     _user_agent_for_link: Dict[str, str] = dict()
+    # Maximum requests/second to send to hosts matching each (fnmatch-style) pattern.
+    rate_limits: Dict[str, float] = RATE_LIMITS
+    # Seconds after giving up on an unreachable host to try it once more (None=never).
+    circuit_cooldown: Optional[float] = CIRCUIT_COOLDOWN
+    # (connect, read) timeouts for hosts matching each (fnmatch-style) pattern; the first
+    # match wins, and DEFAULT_TIMEOUT is used for hosts that don't match any.
+    timeouts: Dict[str, Tuple[float, float]] = TIMEOUTS
+    # How many seconds `run()` may take.  Once `deadline_margin` of that is left, external
+    # links stop being checked; once it's all gone, nothing more is checked.  Either way the
+    # task gets passed to handle_unchecked().  A request that is already in flight at the
+    # deadline may still take up to its timeout.
+    deadline: Optional[float] = DEADLINE
+    deadline_margin: float = 0.1
+    _deadline_at: Optional[float] = None
     pages_to_check: List[str] = []
+    # How to compress the bodies of cached responses, as "NAME[:LEVEL]" (see bodycodec.py).
+    cache_codec: str = CACHE_CODEC
+    # Where to report progress during `run()` (see metrics.py).
+    metrics_port: Optional[int] = METRICS_PORT
+    status_interval: Optional[float] = STATUS_INTERVAL
+    _metrics: Optional['Metrics'] = None
 
     def __init__(self) -> None:
         self._client = HTTPClient(self)
+        self.extractors = default_extractors()
+        self.linkgraph = LinkGraph(LINKGRAPH, reset=True) if LINKGRAPH else None
+        self.redirects = RedirectMap()
+        self._fragcache = {}
+        self._csscache = CSSCache()
+        self._datacache = DataURICache()
+        self._scheduler = Scheduler(self._classify, self.schedule_weights)
+        self._queued_pages = set()
+        self._done_pages = set()
+        if GITHUB_MIRROR:
+            self.github = GitHubResolver(GitMirrorBackend(GITHUB_MIRROR))
+        elif GITHUB_API:
+            # The API gets its own client (and so its own cache, rate limiter, and circuit
+            # breaker), since AsyncBaseChecker does GitHub lookups on a worker thread.
+            api_client = BaseHTTPClient()
+            api_client.limiter = RateLimiter(self.rate_limits)
+            api_client.breaker = CircuitBreaker(self.circuit_cooldown)
+            self.github = GitHubResolver(APIBackend(GITHUB_API, api_client))
+        else:
+            self.github = None
 
     def enqueue(self, task: Union[Link, URLReference]) -> None:
         """enqueue a task for the checker to do.
@@ -108,59 +272,186 @@ class BaseChecker:
             if (clean_url in self._done_pages) or (clean_url in self._queued_pages):
                 return
             self._queued_pages.add(clean_url)
-        self._queue.append(task)
+        self._scheduler.push(task)
 
     def run(self) -> None:
         """Run the checker; keep running tasks until the queue (see
         `enqueue()`) is empty.
 
         """
-        not_before: Dict[str, float] = {}
-        while self._queue:
-            task = self._queue[0]
-            self._queue = self._queue[1:]
+        self._start_run()
+        while len(self._scheduler):
             now = time.time()
-            if not_before.get(task_netloc(task), 0) < now:
-                try:
-                    if isinstance(task, Link):
-                        self._check_link(task)
-                    elif isinstance(task, URLReference):
-                        if len(self.pages_to_check) == 0:
-                            self._check_page(task)
-                        elif task.resolved in self.pages_to_check:
-                            self._check_page(task)
-                    else:
-                        assert False
-                except RetryAfterException as err:
-                    self.handle_429(err)
-                    not_before[urlparse(err.url).netloc] = time.time() + err.retry_after
-                    self.enqueue(task)
+            batch = self._next_batch(now)
+            if batch is None:
+                # There's nothing to do but sleep
+                secs = self._idle_secs(now)
+                self.handle_sleep(secs)
+                time.sleep(secs)
+                continue
+            if self._ready_to_run(batch, now):
+                self._run_batch(batch)
+        self._finish_run()
+
+    # The steps of run(), shared with AsyncBaseChecker.
+
+    def _start_run(self) -> None:
+        if self.deadline is not None:
+            self._deadline_at = time.time() + self.deadline
+        if self.metrics_port or self.status_interval:
+            from .metrics import Metrics
+
+            self._metrics = Metrics(self, self.metrics_port, self.status_interval)
+
+    def _finish_run(self) -> None:
+        if self.linkgraph:
+            self.linkgraph.flush()
+        if self._metrics:
+            self._metrics.close()
+            self._metrics = None
+
+    def _tick(self, now: float) -> None:
+        if self._metrics:
+            self._metrics.tick(now)
+
+    def _next_batch(self, now: float) -> Optional[List[Union[Link, URLReference]]]:
+        self._tick(now)
+        self._unpark_past_deadline(now)
+        return self._scheduler.pop(now)
+
+    def _unpark_past_deadline(self, now: float) -> None:
+        # Don't wait for the backoff on things that won't get checked anyway.
+        if self._deadline_at is not None and self.deadline is not None:
+            if now >= self._deadline_at:
+                self._scheduler.unpark(now, classes=self.schedule_weights)
+            elif now >= self._deadline_at - (self.deadline * self.deadline_margin):
+                self._scheduler.unpark(now, classes=[EXTERNAL])
+
+    def _idle_secs(self, now: float) -> float:
+        """Return how long to sleep for when `_next_batch()` has nothing."""
+        wake = self._scheduler.next_wake()
+        assert wake is not None
+        secs = max(wake - now, 0)
+        if self._deadline_at is not None:
+            secs = min(secs, max(self._deadline_at - now, 0))
+        return secs
+
+    def _ready_to_run(self, batch: List[Union[Link, URLReference]], now: float) -> bool:
+        """Return whether to run `batch` now; if not, it has been dealt with
+        (skipped because of the deadline, or parked until its host is ready
+        for us)."""
+        task = batch[0]
+        if self._past_deadline(task, now):
+            for task in batch:
+                if self.linkgraph:
+                    self.linkgraph.add_unchecked(
+                        task.linkurl.resolved if isinstance(task, Link) else task.resolved
+                    )
+                self.handle_unchecked(task, "not checked (deadline)")
+            return False
+        if (not_before := self._client.limiter.not_before(task_netloc(task))) > now:
+            self._scheduler.park(batch, not_before)
+            return False
+        return True
+
+    def _skip_page(self, task: URLReference) -> bool:
+        return len(self.pages_to_check) > 0 and task.resolved not in self.pages_to_check
+
+    def _run_batch(self, batch: List[Union[Link, URLReference]]) -> None:
+        task = batch[0]
+        try:
+            if isinstance(task, URLReference):
+                if not self._skip_page(task):
+                    self._check_page(task)
             else:
-                times = [not_before.get(task_netloc(ot), 0) for ot in self._queue]
-                if any(ts < now for ts in times):
-                    # There's other stuff to do in the mean-time, just queue it again after
-                    # that stuff.
-                    self.enqueue(task)
-                else:
-                    # There's nothing to do but sleep
-                    secs = min(times) - now
-                    self.handle_sleep(secs)
-                    time.sleep(secs)
-                    self.enqueue(task)
+                self._check_links([t for t in batch if isinstance(t, Link)])
+        except RetryAfterException as err:
+            self._park_throttled(batch, err)
+
+    def _park_throttled(
+        self, batch: List[Union[Link, URLReference]], err: RetryAfterException
+    ) -> None:
+        if not isinstance(err, ThrottledException):
+            self.handle_429(err)
+        # The limiter has already recorded when to try again.
+        self._scheduler.park(
+            batch, self._client.limiter.not_before(urlparse(err.url).netloc)
+        )
+
+    def _classify(self, task: Union[Link, URLReference]) -> str:
+        if isinstance(task, URLReference):
+            return PAGE
+        if task.linkurl.ref.startswith('#'):
+            return FRAGMENT
+        netloc = task_netloc(task)
+        if not netloc or self.is_internal_domain(netloc):
+            return INTERNAL
+        return EXTERNAL
+
+    def _past_deadline(self, task: Union[Link, URLReference], now: float) -> bool:
+        if self._deadline_at is None or self.deadline is None:
+            return False
+        if now >= self._deadline_at:
+            return True
+        if now >= self._deadline_at - (self.deadline * self.deadline_margin):
+            return self._classify(task) == EXTERNAL
+        return False
 
     def _get_user_agent(self, url: str) -> str:
         domain = urlparse(url).netloc
         return self._user_agent_for_link.get(domain, USER_AGENT)
 
-    def _get_resp(self, url: str) -> Union[requests.Response, str]:
-        try:
+    def _get_timeout(self, url: str) -> Tuple[float, float]:
+        netloc = urlparse(url).netloc.lower()
+        for pattern, timeout in self.timeouts.items():
+            if fnmatch(netloc, pattern):
+                return timeout
+        return DEFAULT_TIMEOUT
+
+    def _fetch(self, url: str) -> Union[requests.Response, str]:
+        """GET `url`, following redirects through `self.redirects`: a hop that
+        has been seen before is followed from the map instead of being
+        requested again.  Returns the final response (with `.url` set to the
+        final URL, fragment and all), or an error string if the redirects
+        are broken.
+
+        """
+        while True:
+            redirect = self.redirects.resolve(url)
+            if redirect.error:
+                return redirect.error
+            target = urldefrag(redirect.final).url
             resp: requests.Response = self._client.get(
-                url,
+                target,
                 headers={
-                    'User-Agent': self._get_user_agent(url),
+                    'User-Agent': self._get_user_agent(target),
                 },
-                timeout=10,
+                timeout=self._get_timeout(target),
+                stream=True,
+                allow_redirects=False,
             )
+            if not resp.is_redirect:
+                break
+            resp.close()
+            self._add_redirect_hop(target, resp)
+        resp.url = redirect.final
+        if redirect.hops:
+            self.handle_redirect(urldefrag(url).url, target)
+            if self.linkgraph:
+                self.linkgraph.add_redirect(url, target)
+        return resp
+
+    def _add_redirect_hop(self, url: str, resp: requests.Response) -> None:
+        # Like requests.Session.get_redirect_target(), undo the Latin-1 decoding of the header.
+        location = resp.headers['location'].encode('latin1').decode('utf8')
+        self.redirects.add_hop(url, resp.status_code, urljoin(url, location))
+
+    def _get_resp(self, url: str) -> Union[requests.Response, str]:
+        try:
+            resp = self._fetch(url)
+            if isinstance(resp, str):
+                return resp
+            resp = self._read_body(resp)
             if resp.status_code != 200:
                 reterr = f"HTTP_{resp.status_code}"
                 if resp.status_code == 429 or int(resp.status_code / 100) == 5:
@@ -179,31 +470,175 @@ class BaseChecker:
             self.handle_page_error(url, reterr)
             return reterr
 
-    def _get_soup(self, url: str) -> Union[BeautifulSoup, str]:
-        """returns a BeautifulSoup on success, or an error string on failure."""
+    @staticmethod
+    def _body_too_large(resp: requests.Response, extractor: ContentExtractor) -> bool:
+        if extractor.max_size is None:
+            return False
+        try:
+            return int(resp.headers.get('content-length', '')) > extractor.max_size
+        except ValueError:
+            return False
+
+    def _wants_body(self, resp: requests.Response) -> bool:
+        """Return whether anything is going to look at the body of `resp`."""
+        extractor = self.extractors.lookup(get_content_type(resp))
+        return (
+            resp.status_code == 200
+            and extractor is not None
+            and extractor.needs_body
+            and not self._body_too_large(resp, extractor)
+        )
+
+    def _spools_body(self, resp: requests.Response) -> bool:
+        """Return whether the body of `resp` (if it is wanted at all) should be
+        downloaded to a temporary file rather than in to memory."""
+        extractor = self.extractors.lookup(get_content_type(resp))
+        return extractor is not None and extractor.spool_body
+
+    def _read_body(self, resp: requests.Response) -> requests.Response:
+        """Download the body of a streamed response, unless nothing is going
+        to look at it; in which case drop the connection without reading it
+        (the body then reads as empty).  Returns the response to use in place
+        of `resp`.
+
+        """
+        if not self._wants_body(resp):
+            resp.close()
+        elif self._spools_body(resp):
+            return self._client._spool_body(resp)
+        # Either way, mark the body as consumed, so that the response is safe to cache
+        # (compressed) and to copy.
+        resp.content
+        self._client._cache_body(resp)
+        return resp
+
+    def _parse_soup(self, url: str, resp: requests.Response) -> Union['BeautifulSoup', str]:
+        """returns a BeautifulSoup of the response to `url` on success, or an
+        error string on failure; and indexes its fragment IDs."""
+        content_type = get_content_type(resp)
+        soup: Union['BeautifulSoup', str]
+        if content_type == 'text/html' or content_type == 'image/svg+xml':
+            from bs4 import BeautifulSoup
+
+            try:
+                soup = BeautifulSoup(resp.text, 'lxml')
+            except Exception as err:
+                soup = f"{err}"
+        else:
+            soup = f"unknown Content-Type: {content_type}"
         baseurl = urldefrag(url).url
-        if baseurl not in self._bodycache:
-            soup: Union[BeautifulSoup, str] = "HTML_unknown"
+        if isinstance(soup, str):
+            self._fragcache[baseurl] = soup
+        else:
+            self._fragcache[baseurl] = frozenset(
+                [str(tag['id']) for tag in soup.find_all(id=True)]
+                + [str(tag['name']) for tag in soup.find_all('a', attrs={'name': True})]
+            )
+        return soup
 
+    def _get_soup(self, url: str) -> Union['BeautifulSoup', str]:
+        """returns a BeautifulSoup on success, or an error string on failure."""
+        resp = self._get_resp(url)
+        if isinstance(resp, str):
+            return resp
+        return self._parse_soup(url, resp)
+
+    def _get_fragments(self, url: str) -> Union[FrozenSet[str], str]:
+        """returns the set of fragment IDs (element IDs and <a name>s) in the
+        document at `url` on success, or an error string on failure."""
+        baseurl = urldefrag(url).url
+        if baseurl not in self._fragcache:
+            soup = self._get_soup(baseurl)
+            if isinstance(soup, str):
+                self._fragcache[baseurl] = soup
+        return self._fragcache[baseurl]
+
+    def _check_links(self, links: List[Link]) -> None:
+        """Check a batch of links that all have the same resolved URL, except
+        for maybe the fragment; the document is only fetched (and indexed)
+        once for all of them."""
+        if links[0].linkurl.resolved[:5].lower() == 'data:':
+            self._check_data_links(links)
+            return
+        memo = self.link_memo if self._classify(links[0]) == EXTERNAL else None
+        if memo is not None:
+            todo = []
+            for link in links:
+                if (key := self._memo_key(link)) in memo:
+                    self._link_result(link, memo[key])
+                else:
+                    todo.append(link)
+            if not todo:
+                return
+            links = todo
+        url = urldefrag(links[0].linkurl.resolved).url
+        resp: Union[requests.Response, str, None] = None
+        if not (self.github and self._github_handles(url)):
             resp = self._get_resp(url)
+        verdicts: Dict[str, Optional[str]] = {}
+        for link in links:
+            redirect = self.redirects.resolve(link.linkurl.resolved)
+            broken: Optional[str]
             if isinstance(resp, str):
-                soup = resp
+                broken = resp
             else:
-                content_type = get_content_type(resp)
-                if content_type == 'text/html' or content_type == 'image/svg+xml':
-                    try:
-                        soup = BeautifulSoup(resp.text, 'lxml')
-                    except Exception as err:
-                        soup = f"{err}"
-                else:
-                    soup = f"unknown Content-Type: {content_type}"
+                if redirect.final not in verdicts:
+                    if resp is None:
+                        verdicts[redirect.final] = self._github_check(redirect.final)
+                    else:
+                        verdicts[redirect.final] = self._check_fragment(resp, redirect.final)
+                broken = verdicts[redirect.final]
+            if memo is not None:
+                memo[self._memo_key(link)] = broken
+            self._link_result(link, broken, redirect)
+
+    def _memo_key(self, link: Link) -> Tuple[str, str]:
+        url = link.linkurl.resolved
+        return self._get_user_agent(url), url
+
+    def _check_data_links(self, links: List[Link]) -> None:
+        """Check a batch of `data:` links without requesting them: one is
+        broken if it is malformed (its payload doesn't get decoded)."""
+        reported = False
+        for link in links:
+            broken = self._datacache.check(link.linkurl.resolved)
+            if broken and not reported:
+                self.handle_page_error(urldefrag(link.linkurl.resolved).url, broken)
+                reported = True
+            self._link_result(link, broken)
+
+    def _link_result(
+        self, link: Link, broken: Optional[str], redirect: Optional[Redirect] = None
+    ) -> None:
+        if not broken:
+            redirect = redirect or self.redirects.resolve(link.linkurl.resolved)
+            if redirect.hops > self.max_redirect_hops:
+                self.handle_redirect_chain(link, redirect)
+        if self.linkgraph:
+            self.linkgraph.add_link(link, broken)
+        self.handle_link_result(link, broken)
 
-            self._bodycache[baseurl] = soup
-        return self._bodycache[baseurl]
+    def _github_handles(self, url: str) -> bool:
+        assert self.github
+        try:
+            return self.github.handles(url)
+        except RetryAfterException as err:
+            raise err
+        except Exception as err:
+            # The backend isn't working; fall back to asking github.com.
+            self.handle_page_error(url, f"GitHub backend: {err}")
+            return False
 
-    def _check_link(self, link: Link) -> None:
-        broken = self._is_link_broken(link)
-        self.handle_link_result(link, broken)
+    def _github_check(self, url: str) -> Optional[str]:
+        assert self.github
+        try:
+            return self.github.check(url)
+        except RetryAfterException as err:
+            raise err
+        except Exception as err:
+            reterr = f"GitHub backend: {err}"
+            self.handle_page_error(url, reterr)
+            return reterr
 
     def isGitHubFile(self, response: requests.Response):
         try:
@@ -215,36 +650,26 @@ class BaseChecker:
         except Exception:
             return False
 
-    def _is_link_broken(self, link: Link) -> Optional[str]:
-        # Resolve redirects
-        resp = self._get_resp(link.linkurl.resolved)
-        if isinstance(resp, str):
-            return resp
-        link = link._replace(linkurl=link.linkurl._replace(resolved=resp.url))
-
+    def _check_fragment(self, resp: requests.Response, url: str) -> Optional[str]:
+        """Check the fragment of `url` (the final URL, after redirects) against
+        `resp`, the response for that URL."""
         if self.isGitHubFile(resp):
             return None
-
-        # Check the fragment
-        fragment = urldefrag(link.linkurl.resolved).fragment
-        if fragment:
-            soup = self._get_soup(link.linkurl.resolved)
-            if isinstance(soup, str):
-                return f"fragment: {soup}"
-            if not (
-                soup.find(id=fragment)
-                or soup.find("a", {"name": fragment})
-                or soup.find(id="user-content-" + fragment)
-            ):
-                return f"fragment: no element with that id/name={repr(fragment)}"
-
+        fragment = urldefrag(url).fragment
+        if not fragment:
+            return None
+        fragments = self._get_fragments(url)
+        if isinstance(fragments, str):
+            return f"fragment: {fragments}"
+        if fragment not in fragments and ("user-content-" + fragment) not in fragments:
+            return f"fragment: no element with that id/name={repr(fragment)}"
         return None
 
     @staticmethod
     def _parse_srcset_value(attrvalue: str) -> List:
         return [desc.split()[0] for desc in attrvalue.split(',')]
 
-    def _process_html(self, page_url: URLReference, page_soup: BeautifulSoup) -> None:
+    def _process_html(self, page_url: URLReference, page_soup: 'BeautifulSoup') -> None:
         # This list of selectors is the union of all lists in
         # https://github.com/stevenvachon/broken-link-checker/blob/master/lib/internal/tags.js
         selectors = {
@@ -316,7 +741,12 @@ class BaseChecker:
                     for url_str in url_strs:
                         link_url = base_url.parse(url_str)
                         self.handle_link(
-                            Link(linkurl=link_url, pageurl=page_url, html=element)
+                            Link(
+                                linkurl=link_url,
+                                pageurl=page_url,
+                                html=element,
+                                attr=attrname,
+                            )
                         )
         for element in page_soup.select('style'):
             assert element.string
@@ -330,23 +760,14 @@ class BaseChecker:
         page_url: URLReference,
         base_url: URLReference,
         css_str: str,
-        tag: Optional[bs4.element.Tag] = None,
+        tag: Optional['bs4.element.Tag'] = None,
     ) -> None:
-        rules = tinycss2.parse_stylesheet(css_str)
-        errors = [rule for rule in rules if isinstance(rule, tinycss2.ast.ParseError)]
-        if errors:
-            self.handle_page_error(page_url.resolved, f"{errors[0]}")
-        for rule in rules:
-            if isinstance(rule, tinycss2.ast.QualifiedRule) or isinstance(
-                rule, tinycss2.ast.AtRule
-            ):
-                if rule.content:
-                    for component in rule.content:
-                        if isinstance(component, tinycss2.ast.URLToken):
-                            link_url = base_url.parse(component.value)
-                            self.handle_link(
-                                Link(linkurl=link_url, pageurl=page_url, html=tag)
-                            )
+        css_links = self._csscache.extract(css_str)
+        if css_links.error:
+            self.handle_page_error(page_url.resolved, css_links.error)
+        for url_str in css_links.urls:
+            link_url = base_url.parse(url_str)
+            self.handle_link(Link(linkurl=link_url, pageurl=page_url, html=tag))
 
     def _check_page(self, page_url: URLReference) -> None:
         # Handle redirects
@@ -360,7 +781,7 @@ class BaseChecker:
             else:
                 self.handle_page_error(page_clean_url, page_resp)
             return
-        page_urls = set(urldefrag(r.url).url for r in ([page_resp] + page_resp.history))
+        page_urls = set(self.redirects.resolve(page_url.resolved).chain)
         page_url = page_url._replace(resolved=page_resp.url)
         page_clean_url = urldefrag(page_url.resolved).url
 
@@ -371,6 +792,8 @@ class BaseChecker:
 
         # Log that we're starting
         self.handle_page_starting(page_clean_url)
+        if self.linkgraph:
+            self.linkgraph.add_page(page_clean_url)
 
         # Inspect the headers for bad links ##############################################
 
@@ -385,56 +808,16 @@ class BaseChecker:
         # Inspect the page for bad links #################################################
 
         content_type = get_content_type(page_resp)
-        if content_type == 'application/javascript':
-            if m := re.search(
-                r'^/\*! For license information please see (\S+) \*/', page_resp.text
-            ):
-                link_url = page_url.parse(m[1])
-                self.handle_link(Link(linkurl=link_url, pageurl=page_url, html=None))
-            if m := re.search(r'//[#@] sourceMappingURL=(\S+)\n?$', page_resp.text):
-                # sourcemap v3 https://docs.google.com/document/d/1U1RGAehQwRypUTovF1KRlpiOFze0b-_2gc6fAH0KY0k/edit#
-                link_url = page_url.parse(m[1])
-                self.handle_link(Link(linkurl=link_url, pageurl=page_url, html=None))
-            # TODO: check for ES6 imports
-        elif content_type == 'application/json':
-            pass  # nothing to do
-        elif content_type == 'application/manifest+json':
-            # TODO: https://w3c.github.io/manifest/
-            pass
-        elif content_type == 'image/svg+xml':
-            # TODO: check SVGs for links
-            pass
-        elif content_type == 'application/pdf':
-            # TODO: check PDFs for links
-            pass
-        elif content_type == 'application/x-yaml':
-            pass  # nothing to do
-        elif content_type == 'image/jpeg':
-            pass  # nothing to do
-        elif content_type == 'image/png':
-            pass  # nothing to do
-        elif content_type == 'image/vnd.microsoft.icon':
-            pass  # nothing to do
-        elif content_type == 'application/vnd.ms-fontobject':
-            pass  # nothing to do
-        elif content_type == 'font/ttf':
-            pass  # nothing to do
-        elif content_type == 'font/woff':
-            pass  # nothing to do
-        elif content_type == 'font/woff2':
-            pass  # nothing to do
-        elif content_type == 'text/css':
-            self._process_css(page_url=page_url, base_url=page_url, css_str=page_resp.text)
-        elif content_type == 'text/html':
-            page_soup = self._get_soup(page_clean_url)
-            if isinstance(page_soup, str):
-                self.handle_page_error(page_clean_url, page_soup)
-                return
-            self._process_html(page_url, page_soup)
-        elif content_type == 'text/plain':
-            pass  # nothing to do
-        else:
+        extractor = self.extractors.lookup(content_type)
+        if extractor is None:
             self.handle_page_error(page_clean_url, f"unknown Content-Type: {content_type}")
+        elif self._body_too_large(page_resp, extractor):
+            self.handle_page_error(
+                page_clean_url,
+                f"{content_type} body is too large to check ({page_resp.headers['content-length']} bytes)",
+            )
+        else:
+            extractor.extract(self, page_url, page_resp)
 
     def handle_request_starting(self, url: str) -> None:
         """handle_request_starting is a hook; called before we send a
@@ -452,7 +835,22 @@ class BaseChecker:
         """
         pass
 
-    def handle_html_extra(self, page_url: URLReference, page_soup: BeautifulSoup) -> None:
+    def handle_redirect(self, url: str, final_url: str) -> None:
+        """handle_redirect is a hook; called whenever fetching `url` got
+        redirected (possibly through several hops) to `final_url`.
+
+        """
+        pass
+
+    def handle_redirect_chain(self, link: Link, redirect: Redirect) -> None:
+        """handle_redirect_chain is a hook; called for a (non-broken) link that
+        goes through more than `max_redirect_hops` redirects before reaching
+        its destination.
+
+        """
+        pass
+
+    def handle_html_extra(self, page_url: URLReference, page_soup: 'BeautifulSoup') -> None:
         """handle_html_extra is a hook; called for each page we process.  This
         allows an application to do extra validation of the HTML beyond what is
         built in to blclib.
@@ -488,6 +886,7 @@ class BaseChecker:
               ref:      str                     # '.pageurl.ref' is the original request URL.
               resolved: str                     # '.pageurl.resolved' is '.pageurl.ref', but after following any redirects.
             html:    Optional[bs4.element.Tag]  # '.html' is the HTML tag that contained the link.  May be None if linked to from other resources, like an external stylsheet.
+            attr:    Optional[str]              # '.attr' is the name of the attribute of '.html' that the link is in.  May be None if the link isn't in an attribute (like a '<style>' block), or if '.html' is None.
 
         The 'broken' argument is a string identifying why the link is
         considered broken, or is None if the link is not broken.
@@ -495,6 +894,22 @@ class BaseChecker:
         """
         pass
 
+    def handle_unchecked(self, task: Union[Link, URLReference], reason: str) -> None:
+        """handle_unchecked is a hook; called for each task (a link to check,
+        or a page to check the links on) that got skipped, such as because
+        the run's deadline (see `deadline`) is (nearly) up.
+
+        """
+        pass
+
+    def is_internal_domain(self, netloc: str) -> bool:
+        """is_internal_domain is a hook; it says whether links to `netloc` are
+        internal to the site being checked.  Internal links are checked
+        ahead of external ones as the deadline approaches.
+
+        """
+        return False
+
     def handle_page_error(self, url: str, err: str) -> None:
         """handle_page_error is a hook; called whenever we encounter an error
         proccessing a page that we've been told to check for broken
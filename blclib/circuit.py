@@ -0,0 +1,117 @@
+import socket
+import time
+from typing import Dict, List, Optional, Set
+
+import requests.exceptions
+
+# How many timeouts in a row it takes to give up on a host.
+MAX_TIMEOUTS = 3
+
+
+def classify_failure(err: BaseException) -> Optional[str]:
+    """Say whether a request exception means that the whole host is
+    unreachable: returns "dns" (the name doesn't resolve), "refused"
+    (nothing is listening), "timeout", or None (some other failure, which
+    might be specific to the URL).
+
+    """
+    if isinstance(err, requests.exceptions.Timeout):
+        return 'timeout'
+    if not isinstance(err, requests.exceptions.ConnectionError):
+        return None
+    # requests.ConnectionError wraps urllib3.MaxRetryError, whose .reason is the urllib3
+    # exception, which was raised `from` the underlying socket error.
+    todo: List[BaseException] = [err]
+    seen: Set[int] = set()
+    while todo:
+        exc = todo.pop()
+        if id(exc) in seen:
+            continue
+        seen.add(id(exc))
+        if isinstance(exc, socket.gaierror):
+            return 'dns'
+        if isinstance(exc, ConnectionRefusedError):
+            return 'refused'
+        todo += [
+            e
+            for e in [
+                exc.__cause__,
+                exc.__context__,
+                getattr(exc, 'reason', None),
+                *exc.args,
+            ]
+            if isinstance(e, BaseException)
+        ]
+    return None
+
+
+class HostCircuit:
+    # The failure that opened the circuit, if it's open.
+    error: Optional[BaseException]
+    opened_at: float
+    timeouts: int
+    # Whether we've already let a request through after the cool-down.
+    retried: bool
+    # Whether a request is currently being let through after the cool-down.
+    trial: bool
+
+    def __init__(self) -> None:
+        self.error = None
+        self.opened_at = 0.0
+        self.timeouts = 0
+        self.retried = False
+        self.trial = False
+
+
+class CircuitBreaker:
+    """CircuitBreaker remembers hosts that are unreachable (a name that
+    doesn't resolve, a connection that gets refused, or MAX_TIMEOUTS
+    timeouts in a row), so that requests to them can fail fast with the same
+    exception instead of each one waiting it out.
+
+    If `cooldown` is set, then that many seconds after a host's circuit
+    opens, one more request is let through to see if the host has come
+    back; if that request fails too, the circuit stays open for good.
+
+    """
+
+    cooldown: Optional[float]
+    _hosts: Dict[str, HostCircuit]
+
+    def __init__(self, cooldown: Optional[float] = None) -> None:
+        self.cooldown = cooldown
+        self._hosts = {}
+
+    def check(self, netloc: str) -> Optional[BaseException]:
+        """Return the exception to fail a request to `netloc` with, or None if
+        the request should be sent."""
+        host = self._hosts.get(netloc)
+        if host is None or host.error is None:
+            return None
+        if (
+            self.cooldown is not None
+            and not host.retried
+            and time.time() >= host.opened_at + self.cooldown
+        ):
+            host.retried = host.trial = True
+            return None
+        return host.error
+
+    def on_success(self, netloc: str) -> None:
+        if (host := self._hosts.get(netloc)) is not None:
+            host.error = None
+            host.timeouts = 0
+            host.trial = False
+
+    def on_failure(self, netloc: str, err: BaseException) -> None:
+        kind = classify_failure(err)
+        if kind is None:
+            return
+        host = self._hosts.setdefault(netloc, HostCircuit())
+        if kind == 'timeout':
+            host.timeouts += 1
+            if host.timeouts < MAX_TIMEOUTS and not host.trial:
+                return
+        host.error = err
+        host.opened_at = time.time()
+        host.trial = False
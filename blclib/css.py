@@ -0,0 +1,178 @@
+import hashlib
+from typing import TYPE_CHECKING, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    # Imported by the functions that use it, when they are first called; see
+    # iter_css_urls().
+    import tinycss2
+    import tinycss2.ast
+
+
+class CSSLinks(NamedTuple):
+    urls: Tuple[str, ...]
+    error: Optional[str]
+
+
+def _children(
+    node: 'tinycss2.ast._ComponentValue',
+) -> Optional[List['tinycss2.ast._ComponentValue']]:
+    import tinycss2.ast
+
+    if isinstance(
+        node,
+        (
+            tinycss2.ast.CurlyBracketsBlock,
+            tinycss2.ast.ParenthesesBlock,
+            tinycss2.ast.SquareBracketsBlock,
+        ),
+    ):
+        return node.content
+    if isinstance(node, tinycss2.ast.FunctionBlock):
+        return node.arguments
+    return None
+
+
+def _url_function_value(node: 'tinycss2.ast.FunctionBlock') -> Optional[str]:
+    """Return the URL from a quoted `url("...")` (which the tokenizer
+    reports as a function, rather than as a URLToken)."""
+    import tinycss2.ast
+
+    if node.lower_name not in ('url', 'src'):
+        return None
+    args = [
+        arg
+        for arg in node.arguments
+        if not isinstance(arg, (tinycss2.ast.WhitespaceToken, tinycss2.ast.Comment))
+    ]
+    if len(args) >= 1 and isinstance(args[0], tinycss2.ast.StringToken):
+        return args[0].value
+    return None
+
+
+def iter_css_urls(css_str: str, errors: Optional[List[str]] = None) -> Iterator[str]:
+    """Yield every URL referenced by the stylesheet `css_str`, in document
+    order: `url()` at any nesting depth (including inside `@media`,
+    `@supports`, and other blocks), and the target of `@import`.
+
+    This walks the component values (tokens and `{}`/`()`/`[]` blocks) that
+    tinycss2 parses the stylesheet in to, rather than parsed rules, so it
+    never builds rule or declaration objects.  It is not streaming: the
+    component values of the whole stylesheet are in memory at once.  If
+    `errors` is given, any parse errors are appended to it.
+
+    """
+    # tinycss2 is only imported once there is some CSS to look at, so that importing blclib
+    # stays cheap for runs that never see any.
+    import tinycss2.ast
+
+    # Each stack entry is an iterator over the children of one block.
+    stack: List[Iterator['tinycss2.ast._ComponentValue']] = [
+        iter(tinycss2.parse_component_value_list(css_str, skip_comments=True))
+    ]
+    # Whether the next significant token is the target of an `@import`.
+    in_import = False
+    # Top-level rule tracking, to catch qualified rules that never get a `{}` block.  This
+    # is the only error that `tinycss2.parse_stylesheet()` would report; bad tokens inside
+    # of a rule just invalidate that part of the rule.
+    in_atrule = False
+    in_prelude = False
+    # The last top-level token of the prelude, for where to report it not being finished.
+    last: Optional['tinycss2.ast.Node'] = None
+
+    while stack:
+        node = next(stack[-1], None)
+        if node is None:
+            stack.pop()
+            continue
+        toplevel = len(stack) == 1
+        if isinstance(node, tinycss2.ast.WhitespaceToken):
+            if toplevel and in_prelude:
+                last = node
+            continue
+        if (
+            toplevel
+            and not (in_atrule or in_prelude)
+            and isinstance(node, tinycss2.ast.LiteralToken)
+            and node.value in ('<!--', '-->')
+        ):
+            # CDO/CDC (left over from hiding `<style>` contents from ancient browsers) are
+            # ignored between rules, like whitespace.
+            continue
+        children = _children(node)
+
+        if in_import and isinstance(node, tinycss2.ast.StringToken):
+            yield node.value
+        elif isinstance(node, tinycss2.ast.URLToken):
+            yield node.value
+        elif isinstance(node, tinycss2.ast.FunctionBlock):
+            if (url := _url_function_value(node)) is not None:
+                yield url
+                children = None
+        in_import = (
+            isinstance(node, tinycss2.ast.AtKeywordToken) and node.lower_value == 'import'
+        )
+
+        if toplevel:
+            if isinstance(node, tinycss2.ast.AtKeywordToken):
+                in_atrule = True
+            elif isinstance(node, tinycss2.ast.CurlyBracketsBlock) or (
+                in_atrule
+                and isinstance(node, tinycss2.ast.LiteralToken)
+                and node.value == ';'
+            ):
+                in_atrule = in_prelude = False
+            elif not in_atrule:
+                in_prelude = True
+                last = node
+
+        if children is not None:
+            stack.append(iter(children))
+
+    if in_prelude and last is not None and errors is not None:
+        err = tinycss2.ast.ParseError(
+            last.source_line,
+            last.source_column,
+            'invalid',
+            'EOF reached before {} block for a qualified rule.',
+        )
+        errors.append(f'{err} at {err.source_line}:{err.source_column}: {err.message}')
+
+
+def extract_css_links(css_str: str) -> CSSLinks:
+    errors: List[str] = []
+    urls = tuple(iter_css_urls(css_str, errors))
+    return CSSLinks(urls=urls, error=(errors[0] if errors else None))
+
+
+class CSSCache:
+    """A cache of `extract_css_links()` results, keyed on a hash of the CSS
+    text, so that a stylesheet that appears many times (such as an inline
+    critical-CSS `<style>` block that is on every page) is only tokenized
+    once.
+
+    """
+
+    _entries: Dict[bytes, CSSLinks]
+    hits: int
+    misses: int
+
+    def __init__(self) -> None:
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(css: Union[str, bytes]) -> bytes:
+        if isinstance(css, str):
+            css = css.encode('utf-8', 'surrogatepass')
+        return hashlib.blake2b(css, digest_size=16).digest()
+
+    def extract(self, css_str: str) -> CSSLinks:
+        key = self._key(css_str)
+        if (ret := self._entries.get(key)) is not None:
+            self.hits += 1
+            return ret
+        self.misses += 1
+        ret = extract_css_links(css_str)
+        self._entries[key] = ret
+        return ret
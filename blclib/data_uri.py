@@ -1,6 +1,21 @@
+"""`data:` URLs (RFC 2397).
+
+`parse_data_uri()` checks a `data:` URL the way browsers do (per the
+Fetch standard: an unparsable media type falls back to text/plain, so the
+only errors are a missing ',' and malformed base64), without decoding its
+payload; the payload is only
+decoded if something reads it.  The checker uses that to judge `data:`
+links without making a request for them at all (see DataURICache), and
+DataAdapter uses it to answer requests for them (with a body that gets
+decoded on the first read).
+
+"""
+
 import base64
+import hashlib
 import io
-from typing import Container, Mapping, Optional, Text, Tuple, Union, cast
+import re
+from typing import BinaryIO, Container, Dict, Mapping, Optional, Text, Tuple, Union, cast
 from urllib.parse import unquote_to_bytes
 
 import requests.models
@@ -8,6 +23,170 @@ from requests.adapters import BaseAdapter, HTTPAdapter
 from requests.exceptions import InvalidURL
 from urllib3.response import HTTPResponse
 
+DEFAULT_MEDIATYPE = 'text/plain;charset=US-ASCII'
+
+# RFC 7231 `type/subtype`, then `;attribute=value` parameters, with optional whitespace
+# around the `;`s.  Parameters without a value (such as the common-but-wrong
+# `image/svg+xml;utf8`), and empty ones, are let through, since browsers let them through.
+_TOKEN = r"[!#$%&'*+.^_`|~0-9A-Za-z-]+"
+_MEDIATYPE_RE = re.compile(
+    rf'{_TOKEN}/{_TOKEN}'
+    rf'(?:[ \t]*;[ \t]*(?:{_TOKEN}(?:=(?:{_TOKEN}|"(?:[^"\\]|\\.)*"))?)?)*'
+)
+_BASE64_SUFFIX_RE = re.compile(r';[ ]*base64$', re.IGNORECASE)
+_BASE64_ALPHABET = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+# ASCII whitespace, per the Infra standard.
+_SPACE = ' \t\n\f\r'
+_SPACE_RE = re.compile(f'[{_SPACE}]')
+
+
+def _b64decode(data: bytes) -> bytes:
+    """Decode base64 the way browsers do (the Infra standard's "forgiving-base64
+    decode"): whitespace is ignored, and so is missing padding."""
+    data = data.translate(None, _SPACE.encode('ascii'))
+    if len(data) % 4 == 0 and data.endswith(b'='):
+        data = data[:-2] if data.endswith(b'==') else data[:-1]
+    if len(data) % 4 == 1 or data.translate(None, _BASE64_ALPHABET):
+        raise ValueError("not valid base64")
+    return base64.b64decode(data + b'=' * (-len(data) % 4))
+
+
+class DataURI:
+    """DataURI is a parsed `data:` URL; see `parse_data_uri()`.  `mediatype`
+    is what it should be served as (DEFAULT_MEDIATYPE if it didn't say, or
+    said something unparsable)."""
+
+    mediatype: str
+    is_base64: bool
+    payload: str
+    _data: Optional[bytes]
+
+    def __init__(self, mediatype: str, is_base64: bool, payload: str) -> None:
+        self.mediatype = mediatype
+        self.is_base64 = is_base64
+        self.payload = payload
+        self._data = None
+
+    @property
+    def size(self) -> int:
+        """The length of the decoded payload (without decoding it, if it is
+        plain base64 or has no %-escapes)."""
+        if self._data is not None:
+            return len(self._data)
+        if '%' in self.payload or (self.is_base64 and _SPACE_RE.search(self.payload)):
+            return len(self.data)
+        if self.is_base64:
+            return len(self.payload.rstrip('=')) * 3 // 4
+        if self.payload.isascii():
+            return len(self.payload)
+        return len(self.payload.encode('utf-8'))
+
+    @property
+    def data(self) -> bytes:
+        """The decoded payload."""
+        if self._data is None:
+            data = unquote_to_bytes(self.payload)
+            if self.is_base64:
+                data = _b64decode(data)
+            self._data = data
+        return self._data
+
+
+def parse_data_uri(url: str) -> DataURI:
+    """Parse a `data:` URL; raises ValueError if it is malformed."""
+    scheme, sep, rest = url.partition(':')
+    if not sep or scheme.lower() != 'data':
+        raise ValueError("not a data: URL")
+    mediatype, sep, payload = rest.partition(',')
+    if not sep:
+        raise ValueError("data: URL has no ',' before the data")
+    mediatype = mediatype.strip(_SPACE)
+    is_base64 = False
+    if match := _BASE64_SUFFIX_RE.search(mediatype):
+        is_base64 = True
+        mediatype = mediatype[: match.start()].rstrip(_SPACE)
+    if mediatype.startswith(';'):
+        # Parameters, but no type.
+        mediatype = 'text/plain' + mediatype
+    if not _MEDIATYPE_RE.fullmatch(mediatype):
+        mediatype = DEFAULT_MEDIATYPE
+    ret = DataURI(mediatype, is_base64, payload)
+    if is_base64:
+        if '%' in payload or _SPACE_RE.search(payload):
+            # Uncommon; just try it.
+            try:
+                ret.data
+            except ValueError as err:
+                raise ValueError(f"data: URL has malformed base64: {err}")
+        else:
+            # The same checks as _b64decode(), without decoding: everything but the alphabet
+            # should be up to 2 '='s of padding at the end (if the length is a multiple of 4).
+            padding = payload.encode('utf-8').translate(None, _BASE64_ALPHABET)
+            unpadded = len(payload) - len(padding)
+            if (
+                padding not in (b'', b'=', b'==')
+                or not payload.endswith(padding.decode('ascii'))
+                or (padding and len(payload) % 4)
+                or unpadded % 4 == 1
+            ):
+                raise ValueError("data: URL has malformed base64")
+    return ret
+
+
+class DataURICache:
+    """A cache of verdicts on `data:` URLs (None if it is fine, or why it
+    is broken), keyed on a hash of the URL, so that an inline image or font
+    that appears many times is only parsed once, and so that the cache
+    doesn't hold on to the URLs themselves (which can be big).
+
+    """
+
+    _entries: Dict[bytes, Optional[str]]
+    hits: int
+    misses: int
+
+    def __init__(self) -> None:
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(url: str) -> bytes:
+        return hashlib.sha256(url.encode('utf-8', 'surrogatepass')).digest()
+
+    def check(self, url: str) -> Optional[str]:
+        key = self._key(url)
+        if key in self._entries:
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        ret: Optional[str] = None
+        try:
+            parse_data_uri(url)
+        except ValueError as err:
+            ret = f"{err}"
+        self._entries[key] = ret
+        return ret
+
+
+class _LazyBody(io.RawIOBase):
+    """A file-like body for a DataURI, which decodes it on the first read."""
+
+    _uri: DataURI
+    _buf: Optional[io.BytesIO]
+
+    def __init__(self, uri: DataURI) -> None:
+        self._uri = uri
+        self._buf = None
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b: bytearray) -> int:  # type: ignore[override]
+        if self._buf is None:
+            self._buf = io.BytesIO(self._uri.data)
+        return self._buf.readinto(b)
+
 
 class DataAdapter(BaseAdapter):
     def send(
@@ -20,19 +199,9 @@ class DataAdapter(BaseAdapter):
         proxies: Optional[Mapping[str, str]] = None,
     ) -> requests.models.Response:
         try:
-            # This is very similar to the parser in
-            # urllib.request.DataHandler in the standard library.
             assert request.url
-            scheme, data_str = request.url.split(':', 1)
-            mediatype, data_str = data_str.split(',', 1)
-
-            data_bytes = unquote_to_bytes(data_str)
-            if mediatype.endswith(';base64'):
-                data_bytes = base64.decodebytes(data_bytes)
-                mediatype = mediatype[: -len(';base64')]
-
-            if not mediatype:
-                mediatype = "text/plain;charset=US-ASCII"
+            uri = parse_data_uri(request.url)
+            size = uri.size
         except BaseException as err:
             raise InvalidURL(err, request=request)
 
@@ -41,10 +210,11 @@ class DataAdapter(BaseAdapter):
             status=200,
             reason='OK',
             headers={
-                'Content-Type': mediatype,
-                'Content-Length': str(len(data_bytes)),
+                'Content-Type': uri.mediatype,
+                'Content-Length': str(size),
             },
-            body=io.BytesIO(data_bytes),
+            body=cast(BinaryIO, _LazyBody(uri)),
+            preload_content=False,
         )
 
         # Now pack that info in to a requests.models.Response.
@@ -0,0 +1,195 @@
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Type
+from urllib.parse import urldefrag
+from xml.etree.ElementTree import ParseError
+
+import requests
+
+from .js import scan_js_response
+from .manifest import scan_manifest_response
+from .models import Link, URLReference
+from .pdf import PDFError, scan_pdf_response
+from .sitemap import scan_sitemap_response
+from .svg import scan_svg_response
+
+if TYPE_CHECKING:
+    from .checker import BaseChecker
+
+
+class ContentExtractor:
+    """A ContentExtractor finds the links in one kind of resource, and hands
+    each of them to `checker.handle_link()`.
+
+    The class attributes describe what the extractor needs, so that the
+    fetch layer can decide how much of a response to download before
+    calling `extract()`:
+
+      - needs_body: If False, the response body is never downloaded.
+      - max_size: If the response says (by Content-Length) that it is larger
+        than this, the body isn't downloaded, and the page is reported as an
+        error instead of being extracted.
+      - spool_body: Whether to download the body to a temporary file, rather
+        than in to memory, for formats that get read in part and out of
+        order (see `CachedResponse.body_file()`).
+      - process_safe: Whether the extraction is a pure function of the body
+        (it doesn't touch any checker state), and so could be run in a
+        worker process.
+
+    """
+
+    needs_body: bool = True
+    max_size: Optional[int] = None
+    spool_body: bool = False
+    process_safe: bool = False
+
+    def extract(
+        self, checker: 'BaseChecker', page_url: URLReference, resp: requests.Response
+    ) -> None:
+        pass
+
+
+class NullExtractor(ContentExtractor):
+    """NullExtractor is for content types that are known to not contain
+    any links (images, fonts, plain text, ...)."""
+
+    needs_body = False
+    process_safe = True
+
+
+class URLListExtractor(ContentExtractor):
+    """URLListExtractor is a base for extractors that produce a flat list of
+    URL strings (relative to the resource itself) from a response body;
+    subclasses implement `scan()`, and list the exceptions that it raises
+    for malformed input in `errors`.
+
+    """
+
+    errors: Tuple[Type[Exception], ...] = ()
+
+    def scan(self, checker: 'BaseChecker', resp: requests.Response) -> List[str]:
+        raise NotImplementedError()
+
+    def extract(
+        self, checker: 'BaseChecker', page_url: URLReference, resp: requests.Response
+    ) -> None:
+        try:
+            url_strs = self.scan(checker, resp)
+        except self.errors as err:
+            checker.handle_page_error(urldefrag(page_url.resolved).url, f"{err}")
+            return
+        for url_str in url_strs:
+            link_url = page_url.parse(url_str)
+            checker.handle_link(Link(linkurl=link_url, pageurl=page_url, html=None))
+
+
+class HTMLExtractor(ContentExtractor):
+    def extract(
+        self, checker: 'BaseChecker', page_url: URLReference, resp: requests.Response
+    ) -> None:
+        page_clean_url = urldefrag(page_url.resolved).url
+        page_soup = checker._parse_soup(page_clean_url, resp)
+        if isinstance(page_soup, str):
+            checker.handle_page_error(page_clean_url, page_soup)
+            return
+        checker._process_html(page_url, page_soup)
+
+
+class CSSExtractor(ContentExtractor):
+    def extract(
+        self, checker: 'BaseChecker', page_url: URLReference, resp: requests.Response
+    ) -> None:
+        checker._process_css(page_url=page_url, base_url=page_url, css_str=resp.text)
+
+
+class JSExtractor(URLListExtractor):
+    process_safe = True
+
+    def scan(self, checker: 'BaseChecker', resp: requests.Response) -> List[str]:
+        return scan_js_response(resp)
+
+
+class SVGExtractor(URLListExtractor):
+    errors = (ParseError,)
+
+    def scan(self, checker: 'BaseChecker', resp: requests.Response) -> List[str]:
+        return scan_svg_response(resp, checker._csscache)
+
+
+class PDFExtractor(URLListExtractor):
+    errors = (PDFError,)
+    # This also caps how much the streams that get read may decompress to, so that a small
+    # PDF can't inflate in to an unbounded amount of memory.
+    max_size = 100 * 1024 * 1024
+    spool_body = True
+    process_safe = True
+
+    def scan(self, checker: 'BaseChecker', resp: requests.Response) -> List[str]:
+        return scan_pdf_response(resp, self.max_size)
+
+
+class ManifestExtractor(URLListExtractor):
+    errors = (ValueError,)
+    process_safe = True
+
+    def scan(self, checker: 'BaseChecker', resp: requests.Response) -> List[str]:
+        return scan_manifest_response(resp)
+
+
+class SitemapExtractor(URLListExtractor):
+    errors = (ParseError,)
+    # https://www.sitemaps.org/protocol.html#index says 50MB uncompressed.
+    max_size = 50 * 1024 * 1024
+    process_safe = True
+
+    def scan(self, checker: 'BaseChecker', resp: requests.Response) -> List[str]:
+        return scan_sitemap_response(resp)
+
+
+class ExtractorRegistry:
+    """ExtractorRegistry maps content types to ContentExtractors.  Keys are
+    either exact MIME types ("text/css"), or wildcards ("image/*" or "*/*");
+    `lookup()` prefers an exact match, then the "type/*" wildcard, then
+    "*/*".
+
+    """
+
+    _entries: Dict[str, ContentExtractor]
+
+    def __init__(self) -> None:
+        self._entries = {}
+
+    def register(self, content_type: str, extractor: ContentExtractor) -> None:
+        self._entries[content_type.lower()] = extractor
+
+    def unregister(self, content_type: str) -> None:
+        self._entries.pop(content_type.lower(), None)
+
+    def lookup(self, content_type: str) -> Optional[ContentExtractor]:
+        content_type = content_type.lower()
+        maintype = content_type.split('/', 1)[0]
+        for key in (content_type, f'{maintype}/*', '*/*'):
+            if (extractor := self._entries.get(key)) is not None:
+                return extractor
+        return None
+
+
+def default_extractors() -> ExtractorRegistry:
+    ret = ExtractorRegistry()
+    ret.register('text/html', HTMLExtractor())
+    ret.register('text/css', CSSExtractor())
+    ret.register('application/javascript', JSExtractor())
+    ret.register('text/javascript', JSExtractor())
+    ret.register('image/svg+xml', SVGExtractor())
+    ret.register('application/pdf', PDFExtractor())
+    ret.register('application/manifest+json', ManifestExtractor())
+
+    nothing = NullExtractor()
+    for content_type in [
+        'application/json',
+        'application/x-yaml',
+        'application/vnd.ms-fontobject',
+        'text/plain',
+        'font/*',
+        'image/*',
+    ]:
+        ret.register(content_type, nothing)
+    return ret
@@ -0,0 +1,124 @@
+"""Listing every file in a directory tree, quickly, for serve.js to load and
+for the orphan check to compare against.
+
+Directories are read with `os.scandir()` by a pool of threads, a level of
+the tree at a time.  The listing (the "manifest") records each directory's
+mtime, and can be saved and passed back in to the next walk: a directory
+whose mtime hasn't changed since then (that is, that hasn't had anything
+added, removed, or renamed in it) doesn't get read again, only stat()ed.
+
+"""
+
+import fnmatch
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+# Bump this when the manifest file format changes; files of other versions are ignored.
+VERSION = 1
+
+# A directory whose mtime is this close to when it was read might get changed again
+# without its mtime changing (if the filesystem's timestamps are coarse); so it gets read
+# again next time regardless.
+RACY_NS = 2 * 1000 * 1000 * 1000
+
+
+class DirEntry(NamedTuple):
+    mtime_ns: int
+    files: List[str]
+    dirs: List[str]
+
+
+# {directory path relative to the top ('' for the top itself, otherwise with no leading or
+# trailing '/'): DirEntry}
+Manifest = Dict[str, DirEntry]
+
+
+def load(filename: str) -> Manifest:
+    """Load a manifest saved by `save()`; or return an empty one, if there
+    isn't a usable one there."""
+    try:
+        with open(filename, 'r') as fh:
+            data = json.load(fh)
+        if data.get('version') != VERSION:
+            return {}
+        return {rel: DirEntry(*entry) for rel, entry in data['dirs'].items()}
+    except (OSError, ValueError, AttributeError, KeyError, TypeError):
+        return {}
+
+
+def save(filename: str, manifest: Manifest) -> None:
+    tmpname = f'{filename}.tmp'
+    with open(tmpname, 'w') as fh:
+        json.dump({'version': VERSION, 'dirs': manifest}, fh, separators=(',', ':'))
+    os.replace(tmpname, filename)
+
+
+def _read_dir(topdir: str, rel: str, cached: Optional[DirEntry]) -> DirEntry:
+    dirpath = os.path.join(topdir, rel) if rel else topdir
+    mtime_ns = os.stat(dirpath).st_mtime_ns
+    if cached and cached.mtime_ns == mtime_ns:
+        return cached
+    now_ns = time.time_ns()
+    files: List[str] = []
+    dirs: List[str] = []
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if not is_dir:
+                files.append(entry.name)
+            elif not entry.is_symlink():
+                # Like os.walk(), don't follow symlinks to directories (and don't count them
+                # as files either).
+                dirs.append(entry.name)
+    if now_ns - mtime_ns < RACY_NS:
+        mtime_ns = -1
+    return DirEntry(mtime_ns=mtime_ns, files=sorted(files), dirs=sorted(dirs))
+
+
+def walk(
+    topdir: str, cache: Optional[Manifest] = None, workers: Optional[int] = None
+) -> Manifest:
+    """List the tree under `topdir`, reusing the entries in `cache` (a
+    manifest from an earlier walk) for directories that haven't changed."""
+    cache = cache or {}
+    ret: Manifest = {}
+    level = ['']
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fswalk') as pool:
+        while level:
+            entries = pool.map(lambda rel: _read_dir(topdir, rel, cache.get(rel)), level)
+            next_level: List[str] = []
+            for rel, entry in zip(level, entries):
+                ret[rel] = entry
+                next_level += [f'{rel}/{name}' if rel else name for name in entry.dirs]
+            level = next_level
+    return ret
+
+
+def files(manifest: Manifest) -> List[str]:
+    """Return the path of every file in `manifest`, relative to the top,
+    with a leading '/'."""
+    return [
+        f'/{rel}/{name}' if rel else f'/{name}'
+        for rel, entry in manifest.items()
+        for name in entry.files
+    ]
+
+
+def parse_globs(value: str) -> List[str]:
+    return [glob.strip() for glob in value.split(',') if glob.strip()]
+
+
+def matches(path: str, include: Sequence[str] = (), exclude: Sequence[str] = ()) -> bool:
+    """Return whether `path` matches any of the `include` globs (or there
+    are none) and none of the `exclude` globs.  Globs are matched with
+    `fnmatch`, so '*' matches across '/' too: '*.png' matches PNGs in any
+    directory, and '/assets/*' everything under /assets/."""
+    if include and not any(fnmatch.fnmatchcase(path, glob) for glob in include):
+        return False
+    return not any(fnmatch.fnmatchcase(path, glob) for glob in exclude)
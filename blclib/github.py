@@ -0,0 +1,374 @@
+"""Checking links to GitHub against repository metadata, instead of by
+scraping github.com.
+
+A link to a file, directory, or repository on github.com is answered from a
+listing of the whole tree at that ref (fetched once per repo+ref, and shared
+by every link in to it), plus the contents of the few files that a fragment
+needs to be checked against: a line count for `#L10` or `#L10-L20`, and the
+heading anchors for a `#heading` in a README or other Markdown file.
+
+The metadata comes from a backend: either local git mirrors
+(`GitMirrorBackend`) or something that speaks the relevant bits of the
+GitHub REST API (`APIBackend`), such as a local stand-in for it.
+
+"""
+
+import os.path
+import re
+import subprocess
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote, unquote, urldefrag, urlparse
+
+import requests
+
+from .httpcache import RetryAfterException
+
+# A tree listing: {path: "blob" or "tree"}.
+Tree = Dict[str, str]
+
+
+class GitHubURL(NamedTuple):
+    owner: str
+    repo: str
+    # "blob", "tree", "raw", or "" for the repository itself.
+    kind: str
+    # The rest of the path after the kind; the ref, then the path within the tree (we
+    # can't tell where one ends and the other starts until we know what refs exist).
+    rest: Tuple[str, ...]
+    fragment: str
+
+
+def parse_github_url(url: str) -> Optional[GitHubURL]:
+    """Parse a github.com (or raw.githubusercontent.com) URL that points in
+    to a repository's tree, or return None for any other URL."""
+    parsed = urlparse(url)
+    netloc = parsed.netloc.lower()
+    parts = [unquote(p) for p in parsed.path.split('/') if p]
+    fragment = unquote(urldefrag(url).fragment)
+    if netloc == 'raw.githubusercontent.com' and len(parts) >= 4:
+        return GitHubURL(parts[0], parts[1], 'raw', tuple(parts[2:]), fragment)
+    if netloc not in ('github.com', 'www.github.com') or len(parts) < 2 or parsed.query:
+        return None
+    owner, repo = parts[0], parts[1]
+    if repo.endswith('.git'):
+        repo = repo[: -len('.git')]
+    if len(parts) == 2:
+        return GitHubURL(owner, repo, '', (), fragment)
+    if parts[2] in ('blob', 'tree', 'raw') and len(parts) >= 4:
+        return GitHubURL(owner, repo, parts[2], tuple(parts[3:]), fragment)
+    return None
+
+
+class GitHubBackend:
+    """GitHubBackend is the interface to where the repository metadata comes
+    from."""
+
+    def tree(self, owner: str, repo: str, ref: str) -> Optional[Tree]:
+        """Return the full (recursive) tree of `ref` in the repository, or
+        None if the backend doesn't know of that repository+ref."""
+        raise NotImplementedError()
+
+    def read(self, owner: str, repo: str, ref: str, path: str) -> bytes:
+        """Return the contents of the file at `path` in `ref`."""
+        raise NotImplementedError()
+
+
+class GitMirrorBackend(GitHubBackend):
+    """GitMirrorBackend reads from git mirrors (as made by `git clone
+    --mirror`) at `ROOT/OWNER/REPO.git` (or `ROOT/OWNER/REPO`)."""
+
+    root: str
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def _git_dir(self, owner: str, repo: str) -> Optional[str]:
+        for name in (f'{repo}.git', repo):
+            path = os.path.join(self.root, owner, name)
+            if os.path.isdir(path):
+                return path
+        return None
+
+    def tree(self, owner: str, repo: str, ref: str) -> Optional[Tree]:
+        git_dir = self._git_dir(owner, repo)
+        if git_dir is None or ref.startswith('-'):
+            # The ref comes from a URL; don't let it be taken as an option.
+            return None
+        try:
+            out = subprocess.run(
+                ['git', f'--git-dir={git_dir}', 'ls-tree', '-r', '-t', '-z', ref, '--'],
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            ).stdout
+        except subprocess.CalledProcessError:
+            return None
+        ret: Tree = {}
+        for entry in out.decode('utf-8', errors='surrogateescape').split('\0'):
+            if not entry:
+                continue
+            # "MODE TYPE OBJECT\tPATH"
+            info, _, path = entry.partition('\t')
+            ret[path] = info.split()[1]
+        return ret
+
+    def read(self, owner: str, repo: str, ref: str, path: str) -> bytes:
+        git_dir = self._git_dir(owner, repo)
+        assert git_dir and not ref.startswith('-')
+        return subprocess.run(
+            ['git', f'--git-dir={git_dir}', 'cat-file', 'blob', f'{ref}:{path}'],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        ).stdout
+
+
+class APIBackend(GitHubBackend):
+    """APIBackend reads from the GitHub REST API at `base_url` (either
+    https://api.github.com or a local stand-in for it), using the
+    `/repos/OWNER/REPO/git/trees/REF?recursive=1` and
+    `/repos/OWNER/REPO/contents/PATH?ref=REF` endpoints."""
+
+    base_url: str
+    session: requests.Session
+    timeout: float
+
+    def __init__(
+        self, base_url: str, session: requests.Session, timeout: float = 30
+    ) -> None:
+        self.base_url = base_url.rstrip('/')
+        self.session = session
+        self.timeout = timeout
+
+    def tree(self, owner: str, repo: str, ref: str) -> Optional[Tree]:
+        resp = self.session.get(
+            f'{self.base_url}/repos/{quote(owner)}/{quote(repo)}/git/trees/{quote(ref)}',
+            params={'recursive': '1'},
+            headers={'Accept': 'application/vnd.github+json'},
+            timeout=self.timeout,
+        )
+        if resp.status_code in (404, 409, 422):
+            return None
+        resp.raise_for_status()
+        body = resp.json()
+        if body.get('truncated'):
+            # Too big to list in one go; leave it to the regular HTTP check.
+            return None
+        return {entry['path']: entry['type'] for entry in body['tree']}
+
+    def read(self, owner: str, repo: str, ref: str, path: str) -> bytes:
+        resp = self.session.get(
+            f'{self.base_url}/repos/{quote(owner)}/{quote(repo)}/contents/{quote(path)}',
+            params={'ref': ref},
+            headers={'Accept': 'application/vnd.github.raw'},
+            timeout=self.timeout,
+        )
+        resp.raise_for_status()
+        return resp.content
+
+
+_FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+_ATX_RE = re.compile(r'^ {0,3}#{1,6}(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$')
+_SETEXT_RE = re.compile(r'^ {0,3}(?:=+|-+)[ \t]*$')
+_HTML_ANCHOR_RE = re.compile(r'''<[^>]*\s(?:id|name)\s*=\s*["']([^"']+)["']''', re.I)
+_MD_IMAGE_RE = re.compile(r'!\[([^\]]*)\]\([^)]*\)')
+_MD_LINK_RE = re.compile(r'\[([^\]]*)\](?:\([^)]*\)|\[[^\]]*\])')
+_MD_TAG_RE = re.compile(r'<[^>]+>')
+_MD_EMPHASIS_RE = re.compile(r'(?<!\w)_+|_+(?!\w)')
+_SLUG_STRIP_RE = re.compile(r'[^\w\- ]')
+
+
+def github_slug(heading: str) -> str:
+    """Return the anchor that GitHub generates for a Markdown heading (before
+    de-duplication)."""
+    text = _MD_IMAGE_RE.sub(r'\1', heading)
+    text = _MD_LINK_RE.sub(r'\1', text)
+    text = _MD_TAG_RE.sub('', text)
+    text = _MD_EMPHASIS_RE.sub('', text)
+    return _SLUG_STRIP_RE.sub('', text.strip().lower()).replace(' ', '-')
+
+
+def markdown_anchors(text: str) -> FrozenSet[str]:
+    """Return the anchors in a Markdown document as rendered by GitHub: one
+    per ATX or setext heading (with "-1", "-2", ... added to repeats), plus
+    the id/name of any HTML elements in it."""
+    ret: List[str] = []
+    counts: Dict[str, int] = {}
+    fence = ''
+    prev = ''
+    for line in text.splitlines():
+        if fence:
+            if line.strip().startswith(fence):
+                fence = ''
+            continue
+        if m := _FENCE_RE.match(line):
+            fence = m.group(1)
+            prev = ''
+            continue
+        heading = None
+        if m := _ATX_RE.match(line):
+            heading = m.group(1) or ''
+        elif prev.strip() and _SETEXT_RE.match(line):
+            heading = prev
+        if heading is not None:
+            slug = github_slug(heading)
+            if slug in counts:
+                counts[slug] += 1
+                slug = f'{slug}-{counts[slug]}'
+            else:
+                counts[slug] = 0
+            ret.append(slug)
+        ret += _HTML_ANCHOR_RE.findall(line)
+        prev = '' if heading is not None else line
+    return frozenset(ret)
+
+
+def is_markdown(path: str) -> bool:
+    return path.lower().endswith(('.md', '.markdown', '.mdown', '.mkd'))
+
+
+def count_lines(data: bytes) -> int:
+    return data.count(b'\n') + (1 if data and not data.endswith(b'\n') else 0)
+
+
+_LINE_RE = re.compile(r'^L([0-9]+)(?:C[0-9]+)?(?:-L([0-9]+)(?:C[0-9]+)?)?$')
+
+
+class GitHubResolver:
+    """GitHubResolver answers whether links in to GitHub repositories are
+    broken, from a GitHubBackend instead of from github.com.  Everything is
+    cached per repository+ref, so a ref's tree is listed once no matter how
+    many links go in to it, and a file is read at most once no matter how
+    many fragments point in to it.
+
+    """
+
+    backend: GitHubBackend
+    _trees: Dict[Tuple[str, str, str], Optional[Tree]]
+    _lines: Dict[Tuple[str, str, str, str], int]
+    _anchors: Dict[Tuple[str, str, str, str], FrozenSet[str]]
+
+    def __init__(self, backend: GitHubBackend) -> None:
+        self.backend = backend
+        self._trees = {}
+        self._lines = {}
+        self._anchors = {}
+
+    def _tree(self, owner: str, repo: str, ref: str) -> Optional[Tree]:
+        key = (owner, repo, ref)
+        if key not in self._trees:
+            self._trees[key] = self.backend.tree(owner, repo, ref)
+        return self._trees[key]
+
+    def _split_ref(self, url: GitHubURL) -> Optional[Tuple[str, str, Tree]]:
+        """Split the ref from the path (refs may contain slashes), returning
+        (ref, path, tree); or None if the backend doesn't know the repo."""
+        if not url.rest:
+            tree = self._tree(url.owner, url.repo, 'HEAD')
+            return None if tree is None else ('HEAD', '', tree)
+        for i in range(1, len(url.rest) + 1):
+            ref = '/'.join(url.rest[:i])
+            if (tree := self._tree(url.owner, url.repo, ref)) is not None:
+                return ref, '/'.join(url.rest[i:]), tree
+        return None
+
+    def _line_count(self, owner: str, repo: str, ref: str, path: str) -> int:
+        key = (owner, repo, ref, path)
+        if key not in self._lines:
+            self._lines[key] = count_lines(self.backend.read(owner, repo, ref, path))
+        return self._lines[key]
+
+    def _markdown_anchors(
+        self, owner: str, repo: str, ref: str, path: str
+    ) -> FrozenSet[str]:
+        key = (owner, repo, ref, path)
+        if key not in self._anchors:
+            data = self.backend.read(owner, repo, ref, path)
+            self._anchors[key] = markdown_anchors(data.decode('utf-8', errors='replace'))
+        return self._anchors[key]
+
+    def handles(self, url: str) -> bool:
+        """Return whether `check(url)` can answer for `url`: it is a link in
+        to a repository (and ref) that the backend knows about."""
+        parsed = parse_github_url(url)
+        return parsed is not None and self._split_ref(parsed) is not None
+
+    def prefetch(self, url: str, check_urls: Iterable[str]) -> bool:
+        """Do the backend lookups for `handles(url)` and (if it does) for
+        `check()`ing each of `check_urls` ahead of time, so that those calls
+        get answered from what is memoized; returns `handles(url)`.  This
+        blocks; see AsyncBaseChecker.  Other than a RetryAfterException,
+        errors are left for the calls themselves to run in to again (and
+        report)."""
+        try:
+            if not self.handles(url):
+                return False
+        except RetryAfterException:
+            raise
+        except Exception:
+            return False
+        for check_url in check_urls:
+            try:
+                self.check(check_url)
+            except RetryAfterException:
+                raise
+            except Exception:
+                pass
+        return True
+
+    def check(self, url: str) -> Optional[str]:
+        """Return why the link to `url` is broken, or None if it isn't.  Only
+        call this if `handles(url)`."""
+        parsed = parse_github_url(url)
+        assert parsed
+        split = self._split_ref(parsed)
+        assert split
+        ref, path, tree = split
+        owner, repo = parsed.owner, parsed.repo
+
+        kind = tree.get(path, 'tree' if not path else None)
+        if kind is None:
+            return f"GitHub: no such file or directory in {owner}/{repo}@{ref}: {path!r}"
+        if parsed.kind in ('blob', 'raw') and kind != 'blob':
+            return f"GitHub: not a file in {owner}/{repo}@{ref}: {path!r}"
+
+        fragment = parsed.fragment
+        if fragment.startswith('user-content-'):
+            fragment = fragment[len('user-content-') :]
+        if not fragment or parsed.kind == 'raw':
+            return None
+
+        if kind == 'blob' and (m := _LINE_RE.match(fragment)):
+            nlines = self._line_count(owner, repo, ref, path)
+            for line in m.groups():
+                if line is not None and not 1 <= int(line) <= nlines:
+                    return (
+                        f"GitHub: line {line} is past the end of {path!r} ({nlines} lines)"
+                    )
+            return None
+
+        if kind == 'tree':
+            if fragment.lower() == 'readme':
+                return None
+            prefix = f'{path}/' if path else ''
+            readmes = [
+                p
+                for p, t in tree.items()
+                if t == 'blob'
+                and p.startswith(prefix)
+                and '/' not in p[len(prefix) :]
+                and p[len(prefix) :].lower().startswith('readme')
+            ]
+            if not readmes:
+                return f"GitHub: no README for fragment {fragment!r}"
+            doc = min(readmes, key=lambda p: (not is_markdown(p), p))
+        else:
+            doc = path
+        if not is_markdown(doc):
+            # Not something we know how GitHub renders; don't second-guess it.
+            return None
+
+        anchors = self._markdown_anchors(owner, repo, ref, doc)
+        if fragment not in anchors and fragment.lower() not in anchors:
+            return f"GitHub: no heading/anchor {fragment!r} in {doc!r}"
+        return None
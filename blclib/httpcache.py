@@ -1,21 +1,134 @@
-from copy import deepcopy
-from typing import Container, Dict, Mapping, Optional, Text, Tuple, Union
+import tempfile
+from datetime import timedelta
+from typing import (
+    Any,
+    BinaryIO,
+    Container,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Text,
+    Tuple,
+    Union,
+    cast,
+)
 from urllib.parse import parse_qs, urldefrag, urljoin, urlparse
 
 import requests
 import requests.adapters
 import requests.models
+from requests.structures import CaseInsensitiveDict
+
+from .bodycodec import Codec, CodecStats, PackedBody, SpooledBody, get_codec
+from .circuit import CircuitBreaker
+from .ratelimit import RateLimiter, parse_retry_after
+
+# How much of a body to hold in memory at once while spooling it to a file (see
+# HTTPClient._spool_body()).
+SPOOL_CHUNK_SIZE = 64 * 1024
 
 
 class RetryAfterException(Exception):
-    def __init__(self, url: str, retry_after: int) -> None:
+    def __init__(self, url: str, retry_after: float) -> None:
         super().__init__(f"HTTP 429 Too Many Requests / Retry-After: {retry_after} / {url}")
         self.url = url
         self.retry_after = retry_after
 
 
+class ThrottledException(RetryAfterException):
+    """ThrottledException is raised instead of sending a request when our own
+    rate limiter says that it's too soon to send another request to that
+    host; the server hasn't told us anything.
+
+    """
+
+    def __init__(self, url: str, retry_after: float) -> None:
+        Exception.__init__(self, f"self-throttled for {retry_after:.3f}s / {url}")
+        self.url = url
+        self.retry_after = retry_after
+
+
+class CachedResponse(requests.Response):
+    """CachedResponse is a response from the cache; its body is only
+    decompressed (or read in from its temporary file) once something reads
+    it."""
+
+    _packed: Union[None, PackedBody, SpooledBody] = None
+    _stats: CodecStats
+
+    def body_file(self) -> Optional[BinaryIO]:
+        """Return the temporary file that the body was spooled to (see
+        `HTTPClient._spool_body()`), or None if it wasn't, or if it has been
+        read in to memory already."""
+        return self._packed.file if isinstance(self._packed, SpooledBody) else None
+
+    @property
+    def content(self) -> Any:
+        if self._packed is not None:
+            self._content = self._packed.unpack(self._stats)
+            self._packed = None
+        return super().content
+
+    def iter_content(
+        self, chunk_size: Optional[int] = 1, decode_unicode: bool = False
+    ) -> Iterator[Any]:
+        self.content
+        return super().iter_content(chunk_size, decode_unicode)
+
+
+class _CacheEntry(NamedTuple):
+    status_code: int
+    reason: str
+    headers: 'CaseInsensitiveDict[str]'
+    encoding: Optional[str]
+    elapsed: timedelta
+    body: Union[PackedBody, SpooledBody]
+
+    def response(self, stats: CodecStats) -> CachedResponse:
+        resp = CachedResponse()
+        resp.status_code = self.status_code
+        resp.reason = self.reason
+        resp.headers = CaseInsensitiveDict(self.headers)
+        resp.encoding = self.encoding
+        resp.elapsed = self.elapsed
+        resp._packed = self.body
+        resp._stats = stats
+        resp._content_consumed = True  # type: ignore[attr-defined]
+        return resp
+
+
 class HTTPClient(requests.Session):
-    _cache: Dict[str, requests.Response] = dict()
+    # Responses whose bodies haven't been read yet (see _cache_body()) are kept as-is.
+    _cache: Dict[str, Union[requests.Response, _CacheEntry]]
+    # Failures of requests that were sent on our behalf (see asyncclient.py), to be raised
+    # (once each) in place of sending the request again.
+    _failures: Dict[str, List[BaseException]]
+    limiter: RateLimiter
+    breaker: CircuitBreaker
+    # How many requests have been made of us (as opposed to the async client), and how many
+    # requests have actually been sent (by either); the rest were answered from the cache.
+    requested: int
+    sent: int
+    # How many requests were not sent because an identical one was already in flight.
+    coalesced: int
+    # How cached bodies are compressed.
+    codec: Codec
+    cache_stats: CodecStats
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._cache = {}
+        self._failures = {}
+        self.requested = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.codec = get_codec('zlib')
+        self.cache_stats = CodecStats()
+        self.limiter = RateLimiter()
+        self.breaker = CircuitBreaker()
 
     def get_adapter(self, url: str) -> requests.adapters.BaseAdapter:
         client = self
@@ -31,21 +144,17 @@ class HTTPClient(requests.Session):
                 cert: Union[None, Union[bytes, Text], Container[Union[bytes, Text]]] = None,
                 proxies: Optional[Mapping[str, str]] = None,
             ) -> requests.models.Response:
-                cachekey = client._cache_key(req)
-                if cachekey and cachekey in client._cache:
-                    resp = deepcopy(client._cache[cachekey])
-                    assert req.url
-                    resp.url = req.url
-                    resp.request = req
-                else:
-                    client.hook_before_send(
-                        req,
-                        stream=stream,
-                        timeout=timeout,
-                        verify=verify,
-                        cert=cert,
-                        proxies=proxies,
-                    )
+                if (resp := client._get_cached(req)) is not None:
+                    return resp
+                netloc = client._start_send(
+                    req,
+                    stream=stream,
+                    timeout=timeout,
+                    verify=verify,
+                    cert=cert,
+                    proxies=proxies,
+                )
+                try:
                     resp = inner.send(
                         req,
                         stream=stream,
@@ -54,22 +163,10 @@ class HTTPClient(requests.Session):
                         cert=cert,
                         proxies=proxies,
                     )
-                    if (
-                        resp.status_code == 429
-                        and (retry_after := resp.headers.get('retry-after', 'x')).isnumeric()
-                    ):
-                        raise RetryAfterException(str(req.url), int(retry_after))
-                    elif (
-                        resp.is_redirect
-                        and req.url
-                        and urljoin(req.url, resp.headers['location']) == req.url
-                    ):
-                        raise RetryAfterException(str(req.url), 60)
-                    elif cachekey:
-                        parsed_url = urlparse(req.url)
-                        args = parse_qs(str(parsed_url.query))
-                        if not resp.is_redirect or "//localhost" in str(req.url) or not args:
-                            client._cache[cachekey] = resp
+                except requests.exceptions.RequestException as err:
+                    client._fail_send(netloc, err)
+                    raise
+                client._finish_send(req, netloc, resp)
                 return resp
 
             def close(self) -> None:
@@ -77,10 +174,157 @@ class HTTPClient(requests.Session):
 
         return AdapterWrapper()
 
+    # The steps of sending a request, shared with asyncclient.AsyncHTTPClient.
+
+    def _get_cached(
+        self, req: requests.models.PreparedRequest
+    ) -> Optional[requests.Response]:
+        """Return a copy of the cached response to `req`, or None if there
+        isn't one."""
+        self.requested += 1
+        cachekey = self._cache_key(req)
+        if not cachekey:
+            return None
+        if errs := self._failures.get(cachekey):
+            err = errs.pop(0)
+            if not errs:
+                del self._failures[cachekey]
+            raise err.with_traceback(None)
+        if (resp := self._cached(cachekey)) is None:
+            return None
+        assert req.url
+        resp.url = req.url
+        resp.request = req
+        return resp
+
+    def _cached(self, cachekey: str) -> Optional[requests.Response]:
+        if (entry := self._cache.get(cachekey)) is None:
+            return None
+        if isinstance(entry, requests.Response):
+            entry = self._cache[cachekey] = self._pack(entry)
+        return entry.response(self.cache_stats)
+
+    def _pack(
+        self, resp: requests.Response, body: Union[None, PackedBody, SpooledBody] = None
+    ) -> _CacheEntry:
+        return _CacheEntry(
+            status_code=resp.status_code,
+            reason=resp.reason,
+            headers=resp.headers,
+            encoding=resp.encoding,
+            elapsed=resp.elapsed,
+            body=(
+                body
+                if body is not None
+                else PackedBody.pack(self.codec, resp.content or b'', self.cache_stats)
+            ),
+        )
+
+    def _cache_body(self, resp: requests.Response) -> None:
+        """Call this once the body of `resp` (a streamed response) has been
+        read, or dropped; if `resp` is in the cache, this swaps it for a
+        compressed copy."""
+        assert resp.request
+        cachekey = self._cache_key(resp.request)
+        if cachekey and self._cache.get(cachekey) is resp:
+            self._cache[cachekey] = self._pack(resp)
+
+    def _spool_body(
+        self, resp: requests.Response, chunk_size: int = SPOOL_CHUNK_SIZE
+    ) -> requests.Response:
+        """Like `_cache_body()`, but first download the body of `resp` (a
+        streamed response) to a temporary file, rather than in to memory.
+        Returns the response to use in place of `resp`, whose `body_file()`
+        is that file."""
+        if resp._content_consumed:  # type: ignore[attr-defined]
+            # It's in memory already (from the cache, or prefetched by AsyncHTTPClient).
+            self._cache_body(resp)
+            return resp
+        file = tempfile.TemporaryFile()
+        for chunk in resp.iter_content(chunk_size):
+            file.write(chunk)
+        return self._cache_spooled(resp, cast(BinaryIO, file))
+
+    def _cache_spooled(self, resp: requests.Response, file: BinaryIO) -> requests.Response:
+        """`_spool_body()`, once the body of `resp` has been written to `file`."""
+        entry = self._pack(resp, SpooledBody.wrap(file, self.cache_stats))
+        assert resp.request
+        cachekey = self._cache_key(resp.request)
+        if cachekey and self._cache.get(cachekey) is resp:
+            self._cache[cachekey] = entry
+        ret = entry.response(self.cache_stats)
+        ret.url = resp.url
+        ret.request = resp.request
+        return ret
+
+    def _start_send(
+        self,
+        req: requests.models.PreparedRequest,
+        stream: bool = False,
+        timeout: Union[None, float, Tuple[float, float], Tuple[float, None]] = None,
+        verify: Union[bool, str] = True,
+        cert: Union[None, Union[bytes, Text], Container[Union[bytes, Text]]] = None,
+        proxies: Optional[Mapping[str, str]] = None,
+    ) -> str:
+        """Get ready to send `req` (which isn't cached); raises an exception if
+        it shouldn't be sent after all.  Returns the netloc that it's being
+        sent to."""
+        assert req.url
+        netloc = urlparse(req.url).netloc
+        if netloc and (err := self.breaker.check(netloc)) is not None:
+            # The host is unreachable; fail the same way as last time.
+            raise err.with_traceback(None)
+        if netloc and (wait := self.limiter.acquire(netloc)):
+            raise ThrottledException(req.url, wait)
+        self.hook_before_send(
+            req,
+            stream=stream,
+            timeout=timeout,
+            verify=verify,
+            cert=cert,
+            proxies=proxies,
+        )
+        self.sent += 1
+        return netloc
+
+    def _fail_send(self, netloc: str, err: requests.exceptions.RequestException) -> None:
+        if netloc:
+            self.breaker.on_failure(netloc, err)
+
+    def _finish_send(
+        self, req: requests.models.PreparedRequest, netloc: str, resp: requests.Response
+    ) -> None:
+        """Handle having gotten the (headers of the) response `resp` to `req`;
+        raises RetryAfterException if we've been told to back off, or else
+        caches the response (as appropriate)."""
+        assert req.url
+        if netloc:
+            self.breaker.on_success(netloc)
+        self.hook_after_send(req, resp)
+        retry_after = parse_retry_after(resp.headers.get('retry-after', ''))
+        if (
+            resp.status_code == 429
+            or (resp.status_code == 503 and retry_after is not None)
+            or (resp.is_redirect and urljoin(req.url, resp.headers['location']) == req.url)
+        ):
+            raise RetryAfterException(req.url, self.limiter.on_throttle(netloc, retry_after))
+        if resp.status_code == 503:
+            self.limiter.on_throttle(netloc, None)
+        elif netloc:
+            self.limiter.on_success(netloc, resp.elapsed.total_seconds())
+        if cachekey := self._cache_key(req):
+            parsed_url = urlparse(req.url)
+            args = parse_qs(str(parsed_url.query))
+            if not resp.is_redirect or "//localhost" in str(req.url) or not args:
+                self._cache[cachekey] = resp
+
     def _cache_key(self, req: requests.models.PreparedRequest) -> Optional[str]:
         if req.method != "GET":
             return None
-        return f"{str(req.method)} {urldefrag(str(req.url)).url}"
+        # The response may depend on the User-Agent; clients can send different ones to
+        # the same host (see BaseChecker._user_agent_for_link, and batch.py).
+        user_agent = req.headers.get('User-Agent', '')
+        return f"{str(req.method)} {urldefrag(str(req.url)).url} {user_agent}"
 
     def hook_before_send(
         self,
@@ -96,3 +340,13 @@ class HTTPClient(requests.Session):
 
         """
         pass
+
+    def hook_after_send(
+        self, request: requests.models.PreparedRequest, response: requests.models.Response
+    ) -> None:
+        """Override this to provide a callback that is called after receiving
+        the headers of a (non-cached) response; `response.elapsed` is how long
+        that took.
+
+        """
+        pass
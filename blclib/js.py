@@ -0,0 +1,246 @@
+import codecs
+import re
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import requests
+
+# How much text to hand the regex engine at once.
+CHUNK_SIZE = 64 * 1024
+# The longest construct that we promise to find even when it straddles two chunks.
+MAX_MATCH = 16 * 1024
+# How much of the start of the file to look at for comment-style markers.
+HEAD_SIZE = 4 * 1024
+# How much of the end of the file to look at for comment-style markers (more is kept if
+# the end of the file is an in-progress `sourceMappingURL=` value, e.g. a `data:` URL).
+TAIL_SIZE = 4 * 1024
+
+_LICENSE_RE = re.compile(r'^/\*! For license information please see (\S+) \*/')
+_SOURCEMAP_MARKERS = ('//# sourceMappingURL=', '//@ sourceMappingURL=')
+_SOURCEMAP_RE = re.compile(r'//[#@] sourceMappingURL=(\S+)\n?$')
+
+
+def _str(name: str) -> str:
+    return f'''(?:"(?P<{name}>[^"\\\\\\n]*)"|'(?P<{name}_sq>[^'\\\\\\n]*)')'''
+
+
+_BODY_RE = re.compile(
+    # `import x from "..."`, `import {a, b as c} from "..."`, `import "..."`
+    r'\bimport\s*(?:[\w$*{}\s,]+?\s*\bfrom\s*)?'
+    + _str('imp')
+    # `export * from "..."`, `export {a} from "..."`
+    + r'|\bexport\s*(?:\*\s*(?:as\s+[\w$]+\s*)?|\{[^{}]*\}\s*)\bfrom\s*'
+    + _str('exp')
+    # `import("...")`
+    + r'|\bimport\s*\(\s*'
+    + _str('dyn')
+    + r'\s*\)'
+    # webpack: `__webpack_require__.p = "..."`, or minified, `r.p="..."` (the runtime's
+    # one- or two-letter name for __webpack_require__); not just any `.p = "..."`.
+    + r'|(?:\b__webpack_require__\.p\s*=\s*|(?<![\w$.])[\w$]{1,2}\.p=)'
+    + r'"(?P<publicpath>[^"\\\n]*)"'
+    # webpack: `"prefix" + ({names}[id] || id) + "sep" + {hashes}[id] + "suffix"`
+    + r'|"(?P<cprefix>[^"\\\n]*)"\s*\+\s*'
+    + r'(?:\(\s*(?P<cnames>\{[^{}]*\})\s*\[\s*(?P<cid1>[\w$]+)\s*\]\s*\|\|\s*(?P=cid1)\s*\)'
+    + r'|(?P<cid2>[\w$]+))'
+    + r'\s*\+\s*"(?P<csep>[^"\\\n]*)"\s*\+\s*(?P<chashes>\{[^{}]*\})\s*\[\s*[\w$]+\s*\]'
+    + r'\s*\+\s*"(?P<csuffix>[^"\\\n]*)"'
+    # Comments and string/template literals are skipped, so that what is in them (such as a
+    # code sample) isn't mistaken for code; so are regex literals (where they can be told
+    # apart from division: after a punctuator or `return`, and maybe some whitespace), so
+    # that a quote or `//` in one doesn't throw that off.  This has to come after the
+    # patterns that start with a string.
+    + r'|(?P<regex>(?:[(,=:[!&|?{};]|\breturn)\s*'
+    + r'/(?![/*])(?:[^/\\\n[]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/)'
+    # The start of a comment or string/template literal; see _SKIP_RES for the rest of it.
+    + r'|(?P<skip>(?<!\\)//|(?<!\\)/\*|[`"\'])'
+)
+# For each way that `skip` can start, the rest of it (not counting `${}` inside of template
+# literals; this is a minimal lexer, not a parser).
+_SKIP_RES = {
+    '//': re.compile(r'[^\n]*\n'),
+    '/*': re.compile(r'[\s\S]*?\*/'),
+    '`': re.compile(r'(?:[^`\\]|\\[\s\S])*`'),
+    '"': re.compile(r'(?:[^"\\\n]|\\[\s\S])*["\n]'),
+    "'": re.compile(r"(?:[^'\\\n]|\\[\s\S])*['\n]"),
+}
+_MAP_ENTRY_RE = re.compile(
+    r'''(?:"([^"\\]*)"|'([^'\\]*)'|([\w$]+))\s*:\s*(?:"([^"\\]*)"|'([^'\\]*)')'''
+)
+
+
+def _str_value(m: 're.Match[str]', name: str) -> Optional[str]:
+    val = m[name]
+    if val is None:
+        val = m[f'{name}_sq']
+    return val
+
+
+def _is_url_specifier(spec: str) -> bool:
+    """Whether an ES module specifier is a URL (as opposed to a bare "package"
+    specifier that only makes sense to a bundler or an import map)."""
+    return spec.startswith(('./', '../', '/')) or bool(
+        re.match(r'^[a-zA-Z][a-zA-Z0-9+.-]*:', spec)
+    )
+
+
+def _parse_map(text: str) -> Dict[str, str]:
+    ret: Dict[str, str] = {}
+    for m in _MAP_ENTRY_RE.finditer(text):
+        key = m[1] if m[1] is not None else (m[2] if m[2] is not None else m[3])
+        ret[key] = m[4] if m[4] is not None else m[5]
+    return ret
+
+
+class JSScanner:
+    """JSScanner finds the URLs that a JavaScript file references, looking at
+    the file only once, a chunk at a time (see `feed()`), and holding at most
+    a few chunks of it in memory at once:
+
+      - `/*! For license information please see … */` (Babel/WebPack), at the
+        start of the file
+      - `//# sourceMappingURL=…` (sourcemap v3), at the end of the file
+      - static `import … from "…"` and `export … from "…"`
+      - dynamic `import("…")`
+      - WebPack chunk-URL maps (`__webpack_require__.u`), made absolute using
+        `__webpack_require__.p` if it is set
+
+    Bare module specifiers (`import "react"`) are not URLs, and are ignored.
+
+    """
+
+    _buf: str
+    _head: str
+    _tail: str
+    _urls: List[str]
+    _chunks: List[str]
+    _public_path: Optional[str]
+    # The `skip` that the buffer starts in the middle of, if any.
+    _skipping: Optional[str]
+
+    def __init__(self) -> None:
+        self._buf = ''
+        self._head = ''
+        self._tail = ''
+        self._urls = []
+        self._chunks = []
+        self._public_path = None
+        self._skipping = None
+
+    def feed(self, text: str) -> None:
+        if len(self._head) < HEAD_SIZE:
+            self._head += text[: HEAD_SIZE - len(self._head)]
+        self._feed_tail(text)
+        self._buf += text
+        if len(self._buf) >= CHUNK_SIZE + MAX_MATCH:
+            self._scan(final=False)
+
+    def _feed_tail(self, text: str) -> None:
+        tail = self._tail + text
+        keep = max(len(tail) - TAIL_SIZE, 0)
+        for marker in _SOURCEMAP_MARKERS:
+            pos = tail.rfind(marker)
+            if 0 <= pos < keep:
+                value = tail[pos + len(marker) :]
+                if value.endswith('\n'):
+                    value = value[:-1]
+                if not re.search(r'\s', value):
+                    keep = pos
+        self._tail = tail[keep:]
+
+    def _scan(self, final: bool) -> None:
+        # Only accept matches that start in the first part of the buffer; anything that
+        # starts in the last MAX_MATCH characters might be cut off, and will get scanned
+        # again with the next chunk.
+        buf = self._buf
+        limit = len(buf) if final else len(buf) - MAX_MATCH
+        pos: Optional[int] = 0
+        if self._skipping is not None:
+            pos = self._skip(self._skipping, 0, final)
+        while pos is not None:
+            m = _BODY_RE.search(buf, pos)
+            if m is None or m.start() >= limit:
+                self._buf = buf[max(pos, limit) :]
+                break
+            if m['skip'] is not None:
+                pos = self._skip(m['skip'], m.end(), final)
+            elif m['regex'] is not None:
+                pos = m.end()
+            else:
+                self._handle_match(m)
+                pos = m.end()
+
+    def _skip(self, start: str, pos: int, final: bool) -> Optional[int]:
+        """Return where the comment or string that `start`ed just before `pos`
+        ends; or, if that is past the end of the buffer, hold on to just
+        enough of the buffer to find the end in the next chunk, and return
+        None."""
+        self._skipping = None
+        if m := _SKIP_RES[start].match(self._buf, pos):
+            return m.end()
+        if final:
+            self._buf = ''
+        else:
+            # Keep a trailing `*` (of a `*/`), or an odd trailing `\` (escaping whatever
+            # comes next).
+            tail = self._buf[pos:]
+            escapes = len(tail) - len(tail.rstrip('\\'))
+            keep = 1 if (start == '/*' and tail.endswith('*')) or escapes % 2 else 0
+            self._buf = tail[len(tail) - keep :]
+            self._skipping = start
+        return None
+
+    def _handle_match(self, m: 're.Match[str]') -> None:
+        for group in ('imp', 'exp', 'dyn'):
+            spec = _str_value(m, group)
+            if spec is not None:
+                if _is_url_specifier(spec):
+                    self._urls.append(spec)
+                return
+        if m['publicpath'] is not None:
+            self._public_path = m['publicpath']
+            return
+        names = _parse_map(m['cnames']) if m['cnames'] else {}
+        for chunk_id, chunk_hash in _parse_map(m['chashes']).items():
+            self._chunks.append(
+                f"{m['cprefix']}{names.get(chunk_id, chunk_id)}{m['csep']}{chunk_hash}{m['csuffix']}"
+            )
+
+    def close(self) -> List[str]:
+        """Finish scanning, and return the list of URL references found (not
+        yet resolved against the script's URL)."""
+        self._scan(final=True)
+        ret: List[str] = []
+        if m := _LICENSE_RE.search(self._head):
+            ret.append(m[1])
+        ret += self._urls
+        ret += [(self._public_path or '') + chunk for chunk in self._chunks]
+        if m := _SOURCEMAP_RE.search(self._tail):
+            # sourcemap v3 https://docs.google.com/document/d/1U1RGAehQwRypUTovF1KRlpiOFze0b-_2gc6fAH0KY0k/edit#
+            ret.append(m[1])
+        return ret
+
+
+def scan_js(chunks: Iterable[str]) -> List[str]:
+    scanner = JSScanner()
+    for chunk in chunks:
+        scanner.feed(chunk)
+    return scanner.close()
+
+
+def iter_response_text(
+    resp: requests.Response, chunk_size: int = CHUNK_SIZE
+) -> Iterator[str]:
+    """Like `resp.iter_content(decode_unicode=True)`, but always yields `str`,
+    and assumes UTF-8 rather than sniffing the whole body when the server
+    didn't specify a charset (`resp.text` would sniff)."""
+    try:
+        decoder = codecs.getincrementaldecoder(resp.encoding or 'utf-8')(errors='replace')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for chunk in resp.iter_content(chunk_size):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def scan_js_response(resp: requests.Response) -> List[str]:
+    return scan_js(iter_response_text(resp))
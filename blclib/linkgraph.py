@@ -0,0 +1,244 @@
+"""A persistent store for the link graph that a check run discovers.
+
+Each URL is stored once (in the `urls` table) and referred to by integer ID
+everywhere else, and the `edges` table is indexed in both directions, so
+both "what does this page link to" and "what links here" are single index
+lookups.
+
+"""
+
+import sqlite3
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urldefrag
+
+from .models import Link
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS urls (
+    id  INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url INTEGER PRIMARY KEY REFERENCES urls(id)
+);
+CREATE TABLE IF NOT EXISTS redirects (
+    src INTEGER PRIMARY KEY REFERENCES urls(id),
+    dst INTEGER NOT NULL REFERENCES urls(id)
+);
+CREATE TABLE IF NOT EXISTS edges (
+    src      INTEGER NOT NULL REFERENCES urls(id),
+    dst      INTEGER NOT NULL REFERENCES urls(id),
+    fragment TEXT NOT NULL,
+    ref      TEXT NOT NULL,
+    -- '' rather than NULL when there isn't one, since NULLs are all distinct as far as
+    -- UNIQUE is concerned, and so re-recording an edge would add a copy of it.
+    tag      TEXT NOT NULL DEFAULT '',
+    attr     TEXT NOT NULL DEFAULT '',
+    broken   TEXT,
+    UNIQUE (src, dst, fragment, ref, tag, attr)
+);
+CREATE TABLE IF NOT EXISTS unchecked (
+    url INTEGER PRIMARY KEY REFERENCES urls(id)
+);
+CREATE INDEX IF NOT EXISTS edges_dst ON edges (dst);
+CREATE INDEX IF NOT EXISTS edges_broken ON edges (broken) WHERE broken IS NOT NULL;
+'''
+
+# How many writes to batch up in to a single transaction.
+BATCH_SIZE = 1000
+
+
+class Edge(NamedTuple):
+    pageurl: str
+    linkurl: str
+    ref: str
+    tag: Optional[str]
+    attr: Optional[str]
+    broken: Optional[str]
+
+
+_EDGE_SELECT = '''
+SELECT s.url, d.url, e.fragment, e.ref, e.tag, e.attr, e.broken
+FROM edges e JOIN urls s ON s.id = e.src JOIN urls d ON d.id = e.dst
+'''
+
+
+def _edge(row: Tuple) -> Edge:
+    src, dst, fragment, ref, tag, attr, broken = row
+    return Edge(
+        pageurl=src,
+        linkurl=(f'{dst}#{fragment}' if fragment else dst),
+        ref=ref,
+        tag=tag or None,
+        attr=attr or None,
+        broken=broken,
+    )
+
+
+class LinkGraph:
+    """LinkGraph is an SQLite file of the pages that were checked, the
+    redirects that were followed, and every (page, link) edge along with
+    the tag/attribute that it was found in and its verdict.
+
+    Opening a LinkGraph with `reset=True` clears out anything from a
+    previous run; `readonly=True` is for querying.  Writes are batched; call
+    `flush()` (or `close()`) when done.
+
+    """
+
+    _db: sqlite3.Connection
+    _ids: Dict[str, int]
+    _pending: int
+
+    def __init__(self, path: str, reset: bool = False, readonly: bool = False) -> None:
+        if readonly:
+            self._db = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        else:
+            self._db = sqlite3.connect(path)
+            self._db.execute('PRAGMA journal_mode = WAL')
+            self._db.execute('PRAGMA synchronous = NORMAL')
+            if reset:
+                for table in ('edges', 'redirects', 'pages', 'unchecked', 'urls'):
+                    self._db.execute(f'DROP TABLE IF EXISTS {table}')
+            self._db.executescript(SCHEMA)
+        self._ids = {}
+        self._pending = 0
+
+    def _id(self, url: str) -> int:
+        if (ret := self._ids.get(url)) is None:
+            cur = self._db.execute('INSERT OR IGNORE INTO urls (url) VALUES (?)', (url,))
+            if cur.rowcount:
+                ret = cur.lastrowid
+            else:
+                (ret,) = self._db.execute(
+                    'SELECT id FROM urls WHERE url = ?', (url,)
+                ).fetchone()
+            assert ret is not None
+            self._ids[url] = ret
+        return ret
+
+    def _lookup_id(self, url: str) -> Optional[int]:
+        row = self._db.execute('SELECT id FROM urls WHERE url = ?', (url,)).fetchone()
+        return row[0] if row else None
+
+    def _wrote(self) -> None:
+        self._pending += 1
+        if self._pending >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        self._db.commit()
+        self._pending = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
+
+    # Recording ##########################################################################
+
+    def add_page(self, url: str) -> None:
+        self._db.execute(
+            'INSERT OR IGNORE INTO pages (url) VALUES (?)', (self._id(urldefrag(url).url),)
+        )
+        self._wrote()
+
+    def add_redirect(self, url: str, final_url: str) -> None:
+        self._db.execute(
+            'INSERT OR REPLACE INTO redirects (src, dst) VALUES (?, ?)',
+            (self._id(urldefrag(url).url), self._id(urldefrag(final_url).url)),
+        )
+        self._wrote()
+
+    def add_unchecked(self, url: str) -> None:
+        self._db.execute(
+            'INSERT OR IGNORE INTO unchecked (url) VALUES (?)',
+            (self._id(urldefrag(url).url),),
+        )
+        self._wrote()
+
+    def add_link(self, link: Link, broken: Optional[str]) -> None:
+        dst, fragment = urldefrag(link.linkurl.resolved)
+        self._db.execute(
+            'INSERT OR REPLACE INTO edges (src, dst, fragment, ref, tag, attr, broken)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (
+                self._id(urldefrag(link.pageurl.resolved).url),
+                self._id(dst),
+                fragment,
+                link.linkurl.ref,
+                link.html.name if link.html else '',
+                link.attr or '',
+                broken,
+            ),
+        )
+        self._wrote()
+
+    # Querying ###########################################################################
+
+    def outbound(self, pageurl: str) -> List[Edge]:
+        """Return the links on the page `pageurl`."""
+        if (src := self._lookup_id(urldefrag(pageurl).url)) is None:
+            return []
+        return [
+            _edge(row)
+            for row in self._db.execute(
+                _EDGE_SELECT + 'WHERE e.src = ? ORDER BY e.rowid', (src,)
+            )
+        ]
+
+    def inbound(self, url: str) -> List[Edge]:
+        """Return the links that point at `url` (with any fragment), or at a URL
+        that redirects to it."""
+        if (dst := self._lookup_id(urldefrag(url).url)) is None:
+            return []
+        return [
+            _edge(row)
+            for row in self._db.execute(
+                _EDGE_SELECT
+                + 'WHERE e.dst = ? OR e.dst IN (SELECT src FROM redirects WHERE dst = ?)'
+                + ' ORDER BY s.url',
+                (dst, dst),
+            )
+        ]
+
+    def broken(self, url: Optional[str] = None) -> List[Edge]:
+        """Return the broken links; either all of them, or just the ones that
+        point at `url`.  The `pageurl` of each is a page that is affected."""
+        args: Tuple[int, ...] = ()
+        if url is None:
+            query = 'WHERE e.broken IS NOT NULL ORDER BY d.url, s.url'
+        elif (dst := self._lookup_id(urldefrag(url).url)) is None:
+            return []
+        else:
+            query, args = 'WHERE e.broken IS NOT NULL AND e.dst = ? ORDER BY s.url', (dst,)
+        return [_edge(row) for row in self._db.execute(_EDGE_SELECT + query, args)]
+
+    def unchecked(self) -> int:
+        """Return how many URLs the run ran out of time before checking."""
+        try:
+            (ret,) = self._db.execute('SELECT COUNT(*) FROM unchecked').fetchone()
+        except sqlite3.OperationalError:
+            # Recorded before unchecked URLs were.
+            return 0
+        return int(ret)
+
+    def orphans(self, roots: Iterable[str]) -> List[str]:
+        """Return the checked pages that can't be reached from any of `roots` by
+        following links and redirects.  If the run didn't finish (see
+        `unchecked()`), the links on the pages it didn't get to are missing,
+        so some of these might not really be orphans."""
+        roots = [urldefrag(url).url for url in roots]
+        rows = self._db.execute(
+            f'''
+            WITH RECURSIVE reach(id) AS (
+              SELECT id FROM urls WHERE url IN ({', '.join('?' for _ in roots)})
+              UNION SELECT e.dst FROM reach JOIN edges e ON e.src = reach.id
+              UNION SELECT r.dst FROM reach JOIN redirects r ON r.src = reach.id
+            )
+            SELECT urls.url FROM pages JOIN urls ON urls.id = pages.url
+            WHERE pages.url NOT IN reach
+            ORDER BY urls.url
+            ''',
+            roots,
+        )
+        return [url for (url,) in rows]
@@ -0,0 +1,42 @@
+import json
+from typing import Any, List
+
+import requests
+
+
+def _image_srcs(images: Any) -> List[str]:
+    if not isinstance(images, list):
+        return []
+    return [img['src'] for img in images if isinstance(img, dict) and 'src' in img]
+
+
+def scan_manifest(data: bytes) -> List[str]:
+    """Return the URL references in a web application manifest
+    (https://w3c.github.io/manifest/): `start_url`, `scope`, the `src` of
+    `icons` and `screenshots`, `shortcuts` (and their icons), and the `url`
+    of `related_applications`.  Raises ValueError if it isn't a JSON
+    object.
+
+    """
+    manifest = json.loads(data)
+    if not isinstance(manifest, dict):
+        raise ValueError("manifest: not a JSON object")
+    ret: List[str] = []
+    for key in ('start_url', 'scope'):
+        if isinstance(manifest.get(key), str):
+            ret.append(manifest[key])
+    ret += _image_srcs(manifest.get('icons'))
+    ret += _image_srcs(manifest.get('screenshots'))
+    for shortcut in manifest.get('shortcuts') or []:
+        if isinstance(shortcut, dict):
+            if isinstance(shortcut.get('url'), str):
+                ret.append(shortcut['url'])
+            ret += _image_srcs(shortcut.get('icons'))
+    for app in manifest.get('related_applications') or []:
+        if isinstance(app, dict) and isinstance(app.get('url'), str):
+            ret.append(app['url'])
+    return [url for url in ret if isinstance(url, str)]
+
+
+def scan_manifest_response(resp: requests.Response) -> List[str]:
+    return scan_manifest(resp.content)
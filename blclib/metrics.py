@@ -0,0 +1,255 @@
+"""Progress reporting for long runs: a status line printed every so often,
+and/or metrics in the Prometheus text format served on a localhost port.
+
+Both are made from a snapshot of the checker's counters (the scheduler's
+queues, the HTTP client's request counts, the rate limiter's backoffs)
+that the checker takes as it runs (see `Metrics.tick()`); so the metrics
+server never looks at the checker's state from another thread.
+
+"""
+
+import os
+import resource
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, TextIO, Tuple
+
+from .scheduler import PAGE
+
+if TYPE_CHECKING:
+    from .checker import BaseChecker
+
+# How often (in seconds) to take a snapshot for the metrics server.
+SNAPSHOT_INTERVAL = 1.0
+
+
+def resident_memory() -> int:
+    """Return the current resident set size of this process, in bytes."""
+    try:
+        with open('/proc/self/statm', 'r') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Not Linux; make do with the peak (which ru_maxrss is in KiB on Linux, but in bytes
+        # on macOS).
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class Snapshot(NamedTuple):
+    time: float
+    # Tasks waiting in each class, and how many batches of them are parked.
+    queued: Dict[str, int]
+    parked: int
+    # Tasks of each class that have been run (or at least started).
+    done: Dict[str, int]
+    requested: int
+    sent: int
+    coalesced: int
+    # {host: (seconds left to back off for, times throttled)} for hosts that have ever
+    # throttled us.
+    backoffs: Dict[str, Tuple[float, int]]
+    cache_raw_bytes: int
+    cache_stored_bytes: int
+    memory: int
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        if not self.requested:
+            return 0.0
+        return max(self.requested - self.sent, 0) / self.requested
+
+
+def take_snapshot(checker: 'BaseChecker', now: float) -> Snapshot:
+    client = checker._client
+    return Snapshot(
+        time=now,
+        queued=checker._scheduler.sizes(),
+        parked=checker._scheduler.parked(),
+        done=dict(checker._scheduler.popped),
+        requested=client.requested,
+        sent=client.sent,
+        coalesced=client.coalesced,
+        backoffs={
+            netloc: (max(host.not_before - now, 0.0), host.throttles)
+            for netloc, host in client.limiter.hosts().items()
+            if host.throttles
+        },
+        cache_raw_bytes=client.cache_stats.raw_bytes,
+        cache_stored_bytes=client.cache_stats.stored_bytes,
+        memory=resident_memory(),
+    )
+
+
+def _label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(snap: Snapshot) -> str:
+    lines: List[str] = []
+
+    def metric(name: str, kind: str, doc: str, samples: Dict[str, float]) -> None:
+        lines.append(f'# HELP blc_{name} {doc}')
+        lines.append(f'# TYPE blc_{name} {kind}')
+        for labels, value in samples.items():
+            lines.append(f'blc_{name}{labels} {value}')
+
+    metric(
+        'queued_tasks',
+        'gauge',
+        'Tasks waiting to be run, by class.',
+        {f'{{class="{_label(cls)}"}}': n for cls, n in snap.queued.items()},
+    )
+    metric('parked_batches', 'gauge', 'Batches waiting out a backoff.', {'': snap.parked})
+    metric(
+        'tasks_total',
+        'counter',
+        'Tasks run, by class.',
+        {f'{{class="{_label(cls)}"}}': n for cls, n in snap.done.items()},
+    )
+    metric(
+        'requests_total',
+        'counter',
+        'Requests made of the HTTP client.',
+        {'': snap.requested},
+    )
+    metric(
+        'requests_sent_total', 'counter', 'Requests sent over the network.', {'': snap.sent}
+    )
+    metric(
+        'requests_coalesced_total',
+        'counter',
+        'Requests not sent because the same one was in flight.',
+        {'': snap.coalesced},
+    )
+    metric(
+        'cache_hit_ratio',
+        'gauge',
+        'Fraction of requests answered from the cache.',
+        {'': round(snap.cache_hit_ratio, 4)},
+    )
+    metric(
+        'cache_body_bytes',
+        'gauge',
+        'Size of the cached response bodies, raw and as stored.',
+        {'{form="raw"}': snap.cache_raw_bytes, '{form="stored"}': snap.cache_stored_bytes},
+    )
+    metric(
+        'host_backoff_seconds',
+        'gauge',
+        'Seconds left before a host that throttled us may be sent to again.',
+        {f'{{host="{_label(h)}"}}': round(b[0], 3) for h, b in snap.backoffs.items()},
+    )
+    metric(
+        'host_throttles_total',
+        'counter',
+        'Times a host throttled us.',
+        {f'{{host="{_label(h)}"}}': b[1] for h, b in snap.backoffs.items()},
+    )
+    metric('resident_memory_bytes', 'gauge', 'Resident set size.', {'': snap.memory})
+    return '\n'.join(lines) + '\n'
+
+
+def format_status(snap: Snapshot, prev: Snapshot) -> str:
+    secs = max(snap.time - prev.time, 1e-3)
+    pages_rate = (snap.done.get(PAGE, 0) - prev.done.get(PAGE, 0)) / secs
+    tasks_rate = (sum(snap.done.values()) - sum(prev.done.values())) / secs
+    queued = sum(snap.queued.values())
+    eta = f'{queued / tasks_rate:.0f}s' if tasks_rate else '?'
+    backing_off = sorted(h for h, (left, _) in snap.backoffs.items() if left > 0)
+    return (
+        f"status: queued {queued} ("
+        + ', '.join(f'{cls} {n}' for cls, n in snap.queued.items())
+        + f"; {snap.parked} parked)"
+        + f"; {(snap.sent - prev.sent) / secs:.1f} req/s, {pages_rate:.1f} pages/s"
+        + f"; cache hits {snap.cache_hit_ratio:.0%}"
+        + f"; backing off: {', '.join(backing_off) or 'none'}"
+        + f"; RSS {snap.memory / (1024 * 1024):.0f} MiB; ETA {eta}"
+    )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: '_MetricsServer'
+
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class _MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+    text: str = ''
+
+
+class Metrics:
+    """Metrics reports on `checker`'s progress: on `port` (on localhost) at
+    /metrics, if `port` is set; and by writing a status line to `out` every
+    `status_interval` seconds, if that is set.  Call `tick()` regularly,
+    and `close()` at the end.
+
+    """
+
+    checker: 'BaseChecker'
+    status_interval: Optional[float]
+    out: TextIO
+    _server: Optional[_MetricsServer]
+    _thread: Optional[threading.Thread]
+    _next_snapshot: float
+    _status_prev: Snapshot
+
+    def __init__(
+        self,
+        checker: 'BaseChecker',
+        port: Optional[int] = None,
+        status_interval: Optional[float] = None,
+        out: TextIO = sys.stderr,
+    ) -> None:
+        self.checker = checker
+        self.status_interval = status_interval
+        self.out = out
+        self._server = None
+        self._thread = None
+        now = time.time()
+        self._next_snapshot = 0.0
+        self._status_prev = take_snapshot(checker, now)
+        if port:
+            self._server = _MetricsServer(('127.0.0.1', port), _Handler)
+            self._thread = threading.Thread(
+                target=self._server.serve_forever, name='metrics', daemon=True
+            )
+            self._thread.start()
+
+    def tick(self, now: float) -> None:
+        """Take a snapshot (if it's time for one)."""
+        if now < self._next_snapshot:
+            return
+        self._next_snapshot = now + SNAPSHOT_INTERVAL
+        snap = take_snapshot(self.checker, now)
+        if self._server:
+            self._server.text = render_prometheus(snap)
+        if self.status_interval and now - self._status_prev.time >= self.status_interval:
+            self._print_status(snap)
+
+    def _print_status(self, snap: Snapshot) -> None:
+        print(format_status(snap, self._status_prev), file=self.out, flush=True)
+        self._status_prev = snap
+
+    def close(self) -> None:
+        if self.status_interval:
+            self._print_status(take_snapshot(self.checker, time.time()))
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            assert self._thread
+            self._thread.join()
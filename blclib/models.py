@@ -1,7 +1,8 @@
-from typing import NamedTuple, Optional
+from typing import TYPE_CHECKING, NamedTuple, Optional
 from urllib.parse import urljoin, urlparse
 
-import bs4.element
+if TYPE_CHECKING:
+    import bs4.element
 
 
 class URLReference:
@@ -73,4 +74,5 @@ class URLReference:
 class Link(NamedTuple):
     linkurl: URLReference
     pageurl: URLReference
-    html: Optional[bs4.element.Tag]
+    html: Optional['bs4.element.Tag']
+    attr: Optional[str] = None
@@ -0,0 +1,107 @@
+"""Buffered output with verbosity levels, for a checker's log.
+
+Each line is written at a level; lines above the sink's verbosity are
+dropped, and the rest are written out a block at a time (once enough has
+built up, or once the oldest line has waited long enough), instead of with
+a write (and a flush) per line.  Whatever is left is flushed when the
+process exits.
+
+"""
+
+import atexit
+import sys
+import threading
+import time
+from typing import List, Optional, TextIO
+
+# Levels, from most to least important.
+RESULT = 0  # broken/ugly/unchecked links, page errors, the summary
+INFO = 1  # backoffs, the local server starting up
+DEBUG = 2  # every request sent ("clt GET ...", and serve.js's "srv GET ...")
+
+LEVELS = {'result': RESULT, 'info': INFO, 'debug': DEBUG}
+
+# Write buffered lines out once there are this many bytes of them ...
+BUFFER_SIZE = 64 * 1024
+# ... or once the oldest of them is this many seconds old.
+FLUSH_INTERVAL = 1.0
+
+
+def parse_verbosity(value: str) -> int:
+    """Parse a level name (see LEVELS) or number; empty means DEBUG (that
+    is, everything)."""
+    value = value.strip().lower()
+    if not value:
+        return DEBUG
+    if value.isdigit():
+        return int(value)
+    if value not in LEVELS:
+        raise ValueError(f"unknown level: {repr(value)} (valid levels: {', '.join(LEVELS)})")
+    return LEVELS[value]
+
+
+class OutputSink:
+    """OutputSink writes lines to `stream` (by default, stdout); see the
+    module docstring.  It is safe to write to from multiple threads.
+
+    """
+
+    stream: TextIO
+    verbosity: int
+    # Put at the start of every line (to tell apart the logs of several checkers writing to
+    # the same stream).
+    prefix: str
+    buffer_size: int
+    flush_interval: float
+    _buf: List[str]
+    _size: int
+    _since: Optional[float]
+    _lock: threading.Lock
+
+    def __init__(
+        self,
+        stream: Optional[TextIO] = None,
+        verbosity: int = DEBUG,
+        buffer_size: int = BUFFER_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        prefix: str = '',
+    ) -> None:
+        self.stream = stream or sys.stdout
+        self.verbosity = verbosity
+        self.prefix = prefix
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buf = []
+        self._size = 0
+        self._since = None
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def enabled(self, level: int) -> bool:
+        """Return whether lines at `level` get written; so that a caller can
+        skip formatting a line that would be dropped anyway."""
+        return level <= self.verbosity
+
+    def write(self, line: str, level: int = RESULT) -> None:
+        if level > self.verbosity:
+            return
+        with self._lock:
+            self._buf.append(self.prefix + line + '\n')
+            self._size += len(self.prefix) + len(line) + 1
+            now = time.monotonic()
+            if self._since is None:
+                self._since = now
+            if self._size >= self.buffer_size or now - self._since >= self.flush_interval:
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._buf:
+            self.stream.write(''.join(self._buf))
+            self._buf = []
+            self._size = 0
+            self._since = None
+        self.stream.flush()
@@ -0,0 +1,489 @@
+"""Find the URI links in a PDF file.
+
+Rather than scanning (or fully parsing) the whole file, this reads the
+cross-reference table(s) from the end of the file, and then follows
+references from the trailer to the document catalog, the page tree, each
+page's `/Annots`, and each annotation's `/A` action; only those objects are
+ever parsed.  A PDF that the checker has spooled to a temporary file (see
+`ContentExtractor.spool_body`) is read through `mmap`, so only the parts
+that get looked at are ever paged in.  Both classic `xref` tables and (PDF 1.5+) cross-reference
+streams and object streams are understood.
+
+"""
+
+import mmap
+import os
+import re
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple, Union
+from urllib.parse import urljoin
+
+import requests
+
+from .httpcache import CachedResponse
+
+# How far from the end of the file to look for `startxref`.
+TAIL_SIZE = 1024
+# Give up on following `/Prev` chains, page trees, etc. past these sizes.
+MAX_XREF_SECTIONS = 64
+MAX_PAGES = 100000
+MAX_DEPTH = 64
+
+
+class PDFError(Exception):
+    pass
+
+
+class _Ref(NamedTuple):
+    num: int
+    gen: int
+
+
+class _Name(str):
+    pass
+
+
+# The whole file, in memory or mapped.
+_Buffer = Union[bytes, mmap.mmap]
+
+
+def _startswith(data: _Buffer, prefix: bytes, pos: int) -> bool:
+    # mmap has no .startswith().
+    return data[pos : pos + len(prefix)] == prefix
+
+
+class _Stream(NamedTuple):
+    dict: Dict[str, Any]
+    data: bytes
+
+
+_WHITESPACE = b'\x00\t\n\x0c\r '
+_REGULAR_RE = re.compile(rb'[^\x00\t\n\x0c\r ()<>\[\]{}/%]+')
+_INT_RE = re.compile(rb'[+-]?\d+$')
+_STARTXREF_RE = re.compile(rb'startxref\s+(\d+)')
+_OCTAL_RE = re.compile(rb'[0-7]{1,3}')
+_ESCAPES = {
+    ord('n'): b'\n',
+    ord('r'): b'\r',
+    ord('t'): b'\t',
+    ord('b'): b'\b',
+    ord('f'): b'\f',
+    ord('('): b'(',
+    ord(')'): b')',
+    ord('\\'): b'\\',
+}
+
+
+class _Lexer:
+    def __init__(self, data: _Buffer, pos: int) -> None:
+        self.data = data
+        self.pos = pos
+
+    def skip_whitespace(self) -> None:
+        data = self.data
+        while self.pos < len(data):
+            c = data[self.pos]
+            if c in _WHITESPACE:
+                self.pos += 1
+            elif c == ord('%'):
+                while self.pos < len(data) and data[self.pos] not in b'\r\n':
+                    self.pos += 1
+            else:
+                break
+
+    def keyword(self) -> bytes:
+        self.skip_whitespace()
+        m = _REGULAR_RE.match(self.data, self.pos)
+        if not m:
+            raise PDFError(f'expected a keyword at offset {self.pos}')
+        self.pos = m.end()
+        return m[0]
+
+    def parse(self, depth: int = 0) -> Any:
+        if depth > MAX_DEPTH:
+            raise PDFError('objects nested too deeply')
+        self.skip_whitespace()
+        data = self.data
+        if self.pos >= len(data):
+            raise PDFError('unexpected end of file')
+        c = data[self.pos : self.pos + 1]
+        if _startswith(data, b'<<', self.pos):
+            self.pos += 2
+            ret: Dict[str, Any] = {}
+            while True:
+                self.skip_whitespace()
+                if _startswith(data, b'>>', self.pos):
+                    self.pos += 2
+                    return ret
+                key = self.parse(depth + 1)
+                if not isinstance(key, _Name):
+                    raise PDFError(
+                        f'expected a name as a dictionary key at offset {self.pos}'
+                    )
+                ret[key] = self.parse(depth + 1)
+        if c == b'[':
+            self.pos += 1
+            arr: List[Any] = []
+            while True:
+                self.skip_whitespace()
+                if _startswith(data, b']', self.pos):
+                    self.pos += 1
+                    return arr
+                arr.append(self.parse(depth + 1))
+        if c == b'/':
+            m = _REGULAR_RE.match(data, self.pos + 1)
+            raw = m[0] if m else b''
+            self.pos += 1 + len(raw)
+            name = re.sub(rb'#([0-9A-Fa-f]{2})', lambda x: bytes([int(x[1], 16)]), raw)
+            return _Name(name.decode('latin-1'))
+        if c == b'(':
+            return self._literal_string()
+        if c == b'<':
+            end = data.find(b'>', self.pos)
+            if end < 0:
+                raise PDFError('unterminated hex string')
+            hexstr = re.sub(rb'\s', b'', data[self.pos + 1 : end])
+            self.pos = end + 1
+            if len(hexstr) % 2:
+                hexstr += b'0'
+            return bytes.fromhex(hexstr.decode('latin-1'))
+        token = self.keyword()
+        if token == b'true':
+            return True
+        if token == b'false':
+            return False
+        if token == b'null':
+            return None
+        if _INT_RE.match(token):
+            # Might be the start of an indirect reference: "NUM GEN R".
+            save = self.pos
+            try:
+                gen = self.keyword()
+                if _INT_RE.match(gen) and self.keyword() == b'R':
+                    return _Ref(int(token), int(gen))
+            except PDFError:
+                pass
+            self.pos = save
+            return int(token)
+        try:
+            return float(token)
+        except ValueError:
+            raise PDFError(f'unexpected token {token!r} at offset {self.pos}')
+
+    def _literal_string(self) -> bytes:
+        data = self.data
+        self.pos += 1
+        ret = bytearray()
+        nesting = 1
+        while self.pos < len(data):
+            c = data[self.pos]
+            self.pos += 1
+            if c == ord('\\'):
+                e = data[self.pos] if self.pos < len(data) else None
+                self.pos += 1
+                if e is None:
+                    break
+                elif e in _ESCAPES:
+                    ret += _ESCAPES[e]
+                elif ord('0') <= e <= ord('7'):
+                    m = _OCTAL_RE.match(data, self.pos - 1)
+                    assert m
+                    ret.append(int(m[0], 8) & 0xFF)
+                    self.pos = m.end()
+                elif e == ord('\r'):
+                    if _startswith(data, b'\n', self.pos):
+                        self.pos += 1
+                elif e != ord('\n'):
+                    ret.append(e)
+            elif c == ord('('):
+                nesting += 1
+                ret.append(c)
+            elif c == ord(')'):
+                nesting -= 1
+                if nesting == 0:
+                    return bytes(ret)
+                ret.append(c)
+            else:
+                ret.append(c)
+        raise PDFError('unterminated string')
+
+
+def _png_unpredict(data: bytes, columns: int) -> bytes:
+    rowlen = columns + 1
+    prev = bytearray(columns)
+    out = bytearray()
+    for i in range(0, len(data) - len(data) % rowlen, rowlen):
+        ftype = data[i]
+        row = bytearray(data[i + 1 : i + rowlen])
+        for j in range(columns):
+            left = row[j - 1] if j else 0
+            up = prev[j]
+            upleft = prev[j - 1] if j else 0
+            if ftype == 1:
+                row[j] = (row[j] + left) & 0xFF
+            elif ftype == 2:
+                row[j] = (row[j] + up) & 0xFF
+            elif ftype == 3:
+                row[j] = (row[j] + ((left + up) >> 1)) & 0xFF
+            elif ftype == 4:
+                p = left + up - upleft
+                pa, pb, pc = abs(p - left), abs(p - up), abs(p - upleft)
+                pred = left if pa <= pb and pa <= pc else (up if pb <= pc else upleft)
+                row[j] = (row[j] + pred) & 0xFF
+        out += row
+        prev = row
+    return bytes(out)
+
+
+# An xref entry is either ('offset', byte_offset) or ('objstm', stream_objnum, index).
+_XRefEntry = Union[Tuple[str, int], Tuple[str, int, int]]
+
+
+class PDFReader:
+    data: _Buffer
+    # How many bytes all of the streams may decompress to, between them (None=no limit),
+    # and how many they have so far.
+    max_decoded: Optional[int]
+    decoded: int
+    trailer: Dict[str, Any]
+    _xref: Dict[int, _XRefEntry]
+    _objects: Dict[int, Any]
+    _objstms: Dict[int, Tuple[bytes, Dict[int, int]]]
+
+    def __init__(self, data: _Buffer, max_decoded: Optional[int] = None) -> None:
+        self.data = data
+        self.max_decoded = max_decoded
+        self.decoded = 0
+        self.trailer = {}
+        self._xref = {}
+        self._objects = {}
+        self._objstms = {}
+        m = None
+        for m in _STARTXREF_RE.finditer(data, max(len(data) - TAIL_SIZE, 0)):
+            pass
+        if not m:
+            raise PDFError('no startxref')
+        self._read_xref(int(m[1]))
+
+    def _read_xref(self, offset: Optional[int]) -> None:
+        seen: Set[int] = set()
+        while offset is not None and offset not in seen:
+            if len(seen) > MAX_XREF_SECTIONS:
+                raise PDFError('too many xref sections')
+            seen.add(offset)
+            lexer = _Lexer(self.data, offset)
+            lexer.skip_whitespace()
+            if _startswith(self.data, b'xref', lexer.pos):
+                trailer = self._read_xref_table(lexer)
+                if isinstance(stm := trailer.get('XRefStm'), int):
+                    self._read_xref_stream(_Lexer(self.data, stm))
+            else:
+                trailer = self._read_xref_stream(lexer)
+            for key, val in trailer.items():
+                self.trailer.setdefault(key, val)
+            prev = trailer.get('Prev')
+            offset = prev if isinstance(prev, int) else None
+
+    def _read_xref_table(self, lexer: _Lexer) -> Dict[str, Any]:
+        lexer.keyword()  # 'xref'
+        while True:
+            token = lexer.keyword()
+            if token == b'trailer':
+                trailer = lexer.parse()
+                if not isinstance(trailer, dict):
+                    raise PDFError('malformed trailer')
+                return trailer
+            start, count = int(token), int(lexer.keyword())
+            for num in range(start, start + count):
+                offset = int(lexer.keyword())
+                lexer.keyword()  # generation
+                kind = lexer.keyword()
+                if kind == b'n':
+                    self._xref.setdefault(num, ('offset', offset))
+
+    def _read_xref_stream(self, lexer: _Lexer) -> Dict[str, Any]:
+        stream = self._read_indirect(lexer)
+        if not isinstance(stream, _Stream) or stream.dict.get('Type') != 'XRef':
+            raise PDFError('malformed xref stream')
+        widths = [int(w) for w in stream.dict.get('W', [])]
+        if len(widths) != 3:
+            raise PDFError('malformed xref stream /W')
+        index = stream.dict.get('Index') or [0, stream.dict.get('Size', 0)]
+        data = self._decode(stream)
+        rowlen = sum(widths)
+        pos = 0
+        for start, count in zip(index[0::2], index[1::2]):
+            for num in range(start, start + count):
+                fields = []
+                for width in widths:
+                    fields.append(int.from_bytes(data[pos : pos + width], 'big'))
+                    pos += width
+                kind = fields[0] if widths[0] else 1
+                if kind == 1:
+                    self._xref.setdefault(num, ('offset', fields[1]))
+                elif kind == 2:
+                    self._xref.setdefault(num, ('objstm', fields[1], fields[2]))
+                if pos + rowlen > len(data):
+                    break
+        return stream.dict
+
+    def _read_indirect(self, lexer: _Lexer) -> Any:
+        lexer.keyword()  # number
+        lexer.keyword()  # generation
+        if lexer.keyword() != b'obj':
+            raise PDFError(f'expected "obj" at offset {lexer.pos}')
+        obj = lexer.parse()
+        lexer.skip_whitespace()
+        if isinstance(obj, dict) and _startswith(self.data, b'stream', lexer.pos):
+            start = lexer.pos + len(b'stream')
+            if _startswith(self.data, b'\r\n', start):
+                start += 2
+            elif _startswith(self.data, b'\n', start):
+                start += 1
+            length = self.resolve(obj.get('Length'))
+            if not isinstance(length, int):
+                end = self.data.find(b'endstream', start)
+                if end < 0:
+                    raise PDFError('unterminated stream')
+                length = end - start
+            return _Stream(obj, self.data[start : start + length])
+        return obj
+
+    def _decode(self, stream: _Stream) -> bytes:
+        filters = self.resolve(stream.dict.get('Filter'))
+        if not isinstance(filters, list):
+            filters = [filters] if filters else []
+        parms = self.resolve(stream.dict.get('DecodeParms'))
+        if not isinstance(parms, list):
+            parms = [parms] * len(filters)
+        data = stream.data
+        for filt, parm in zip(filters, parms):
+            if filt != 'FlateDecode':
+                raise PDFError(f'unsupported stream filter {filt}')
+            data = self._inflate(data)
+            parm = self.resolve(parm) or {}
+            if self.resolve(parm.get('Predictor', 1)) >= 10:
+                data = _png_unpredict(data, int(self.resolve(parm.get('Columns', 1))))
+        return data
+
+    def _inflate(self, data: bytes) -> bytes:
+        if self.max_decoded is None:
+            return zlib.decompressobj().decompress(data)
+        budget = self.max_decoded - self.decoded
+        decompressor = zlib.decompressobj()
+        # One byte over budget is enough to tell that it is too much.
+        ret = decompressor.decompress(data, budget + 1)
+        self.decoded += len(ret)
+        if len(ret) > budget:
+            raise PDFError(f'streams decompress to more than {self.max_decoded} bytes')
+        return ret
+
+    def resolve(self, obj: Any) -> Any:
+        """Follow an indirect reference (if `obj` is one)."""
+        if not isinstance(obj, _Ref):
+            return obj
+        if obj.num in self._objects:
+            return self._objects[obj.num]
+        self._objects[obj.num] = None  # guard against reference cycles
+        entry = self._xref.get(obj.num)
+        ret: Any = None
+        if entry and entry[0] == 'offset':
+            ret = self._read_indirect(_Lexer(self.data, entry[1]))
+        elif entry and entry[0] == 'objstm':
+            ret = self._read_from_objstm(entry[1], entry[2])  # type: ignore[misc]
+        self._objects[obj.num] = ret
+        return ret
+
+    def _read_from_objstm(self, stmnum: int, index: int) -> Any:
+        if stmnum not in self._objstms:
+            stream = self.resolve(_Ref(stmnum, 0))
+            if not isinstance(stream, _Stream):
+                raise PDFError(f'object stream {stmnum} is not a stream')
+            data = self._decode(stream)
+            header = _Lexer(data, 0)
+            offsets: Dict[int, int] = {}
+            first = int(self.resolve(stream.dict.get('First', 0)))
+            for i in range(int(self.resolve(stream.dict.get('N', 0)))):
+                header.keyword()  # object number
+                offsets[i] = first + int(header.keyword())
+            self._objstms[stmnum] = (data, offsets)
+        data, offsets = self._objstms[stmnum]
+        if index not in offsets:
+            return None
+        return _Lexer(data, offsets[index]).parse()
+
+    def iter_pages(self) -> List[Dict[str, Any]]:
+        catalog = self.resolve(self.trailer.get('Root'))
+        if not isinstance(catalog, dict):
+            raise PDFError('no document catalog')
+        pages: List[Dict[str, Any]] = []
+        stack = [catalog.get('Pages')]
+        seen: Set[_Ref] = set()
+        while stack and len(pages) < MAX_PAGES:
+            ref = stack.pop()
+            if isinstance(ref, _Ref):
+                if ref in seen:
+                    continue
+                seen.add(ref)
+            node = self.resolve(ref)
+            if not isinstance(node, dict):
+                continue
+            kids = self.resolve(node.get('Kids'))
+            if isinstance(kids, list):
+                stack.extend(reversed(kids))
+            else:
+                pages.append(node)
+        return pages
+
+    def uri_base(self) -> Optional[str]:
+        catalog = self.resolve(self.trailer.get('Root'))
+        uri = self.resolve(catalog.get('URI')) if isinstance(catalog, dict) else None
+        base = self.resolve(uri.get('Base')) if isinstance(uri, dict) else None
+        return base.decode('latin-1') if isinstance(base, bytes) else None
+
+    def iter_uris(self) -> List[str]:
+        base = self.uri_base()
+        ret: List[str] = []
+        for page in self.iter_pages():
+            annots = self.resolve(page.get('Annots'))
+            if not isinstance(annots, list):
+                continue
+            for annot in annots:
+                annot = self.resolve(annot)
+                if not isinstance(annot, dict):
+                    continue
+                action = self.resolve(annot.get('A'))
+                if not isinstance(action, dict) or self.resolve(action.get('S')) != 'URI':
+                    continue
+                uri = self.resolve(action.get('URI'))
+                if isinstance(uri, bytes):
+                    uri_str = uri.decode('latin-1').strip()
+                    ret.append(urljoin(base, uri_str) if base else uri_str)
+        return ret
+
+
+def scan_pdf(data: _Buffer, max_decoded: Optional[int] = None) -> List[str]:
+    """Return the URIs of the link annotations in a PDF file.  Raises
+    PDFError if the file can't be understood, or if the streams that get
+    read decompress to more than `max_decoded` bytes."""
+    try:
+        reader = PDFReader(data, max_decoded)
+        if reader.trailer.get('Encrypt'):
+            # The strings are encrypted; there's nothing that we can read.
+            return []
+        return reader.iter_uris()
+    except (ValueError, TypeError, AttributeError, IndexError, zlib.error) as err:
+        raise PDFError(f'{err}')
+
+
+def scan_pdf_response(
+    resp: requests.Response, max_decoded: Optional[int] = None
+) -> List[str]:
+    file = resp.body_file() if isinstance(resp, CachedResponse) else None
+    if file is None:
+        return scan_pdf(resp.content, max_decoded)
+    if not os.fstat(file.fileno()).st_size:
+        # mmap can't map an empty file.
+        return scan_pdf(b'', max_decoded)
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return scan_pdf(data, max_decoded)
@@ -0,0 +1,227 @@
+"""Working out which pages a change affects, so that a pull request only
+needs to check those.
+
+The affected set is:
+
+ 1. the built pages that the changed files resolve to: each changed source
+    file is matched up with the built page (in a content-hash manifest of
+    the `public/` directory) whose path it shares the longest suffix with;
+ 2. the built pages whose content hash differs from a baseline manifest
+    (such as one from a build of the base branch), which catches pages
+    that changed through a shared template or include;
+ 3. every page that links in to any of those (according to the link graph
+    of an earlier full run; see linkgraph.py), since a link's #fragment
+    may have broken even though the page it's on didn't change.
+
+Usage: python3 -m blclib.prmode manifest PUBDIR OUTFILE
+       python3 -m blclib.prmode affected [OPTIONS] PUBDIR BASE_URL CHANGED_FILES
+
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from .linkgraph import LinkGraph
+
+# {URL path: content hash} for every file in a `public/` directory.
+Manifest = Dict[str, str]
+
+CHUNK_SIZE = 64 * 1024
+
+
+def urlpath_for_file(pubdir: str, fullpath: str) -> str:
+    urlpath = '/' + os.path.relpath(fullpath, pubdir).replace(os.sep, '/')
+    if urlpath.endswith('/index.html'):
+        urlpath = urlpath[: -len('index.html')]
+    return urlpath
+
+
+def build_manifest(pubdir: str) -> Manifest:
+    """Hash every file in `pubdir`, keyed by the URL path it is served at."""
+    ret: Manifest = {}
+    for root, _, files in os.walk(pubdir):
+        for file in files:
+            fullpath = os.path.join(root, file)
+            digest = hashlib.sha256()
+            with open(fullpath, 'rb') as fh:
+                while chunk := fh.read(CHUNK_SIZE):
+                    digest.update(chunk)
+            ret[urlpath_for_file(pubdir, fullpath)] = digest.hexdigest()
+    return ret
+
+
+def load_manifest(filename: str) -> Manifest:
+    with open(filename, 'r') as fh:
+        ret = json.load(fh)
+    if not isinstance(ret, dict):
+        raise ValueError(f"{filename}: not a manifest")
+    return ret
+
+
+def write_manifest(filename: str, manifest: Manifest) -> None:
+    with open(filename, 'w') as fh:
+        json.dump(manifest, fh, indent=0, sort_keys=True)
+
+
+def is_page(urlpath: str) -> bool:
+    return urlpath.endswith('/') or urlpath.endswith('.html')
+
+
+def changed_pages(baseline: Manifest, manifest: Manifest) -> Set[str]:
+    """Return the pages that were added, changed, or removed between
+    `baseline` and `manifest`."""
+    return {
+        path
+        for path in set(baseline) | set(manifest)
+        if is_page(path) and baseline.get(path) != manifest.get(path)
+    }
+
+
+def _components(path: str) -> Tuple[str, ...]:
+    path = re.sub(r'(/index)?\.(html|md|mdx|markdown)$', '', path.strip('/'))
+    ret = [
+        # "v2.5" in a source tree is often "2.5" in the built site.
+        re.sub(r'^v(?=[0-9])', '', part.lower())
+        for part in path.split('/')
+        if part
+    ]
+    if ret and ret[-1] in ('index', '_index', 'readme'):
+        ret.pop()
+    return tuple(ret)
+
+
+def _common_suffix(a: Tuple[str, ...], b: Tuple[str, ...]) -> int:
+    n = 0
+    while n < min(len(a), len(b)) and a[-1 - n] == b[-1 - n]:
+        n += 1
+    return n
+
+
+class Resolution(NamedTuple):
+    pages: Set[str]
+    # Changed files that didn't resolve to any page.
+    unresolved: List[str]
+
+
+def resolve_sources(files: Iterable[str], manifest: Manifest) -> Resolution:
+    """Resolve changed source files (such as
+    "ambassador-docs/docs/edge-stack/2.0/howtos/rate-limiting.md") to the
+    built pages in `manifest` (such as "/docs/edge-stack/2.0/howtos/rate-limiting/")
+    that share the longest path suffix with them; files that are in
+    `public/` resolve to themselves."""
+    by_name: Dict[str, List[Tuple[str, Tuple[str, ...]]]] = {}
+    for path in manifest:
+        if is_page(path) and (parts := _components(path)):
+            by_name.setdefault(parts[-1], []).append((path, parts))
+
+    pages: Set[str] = set()
+    unresolved: List[str] = []
+    for file in files:
+        if file.startswith('public/') and is_page(path := urlpath_for_file('public', file)):
+            pages.add(path)
+            continue
+        parts = _components(file)
+        best, matches = 0, []
+        for path, page_parts in by_name.get(parts[-1], []) if parts else []:
+            n = _common_suffix(parts, page_parts)
+            if n > best:
+                best, matches = n, [path]
+            elif n == best:
+                matches.append(path)
+        if matches:
+            pages.update(matches)
+        else:
+            unresolved.append(file)
+    return Resolution(pages=pages, unresolved=unresolved)
+
+
+def add_dependents(base_url: str, pages: Iterable[str], graph: LinkGraph) -> Set[str]:
+    """Return `pages` plus every page that links in to one of them (all as
+    URL paths), according to `graph`."""
+    base_url = base_url.rstrip('/')
+    ret = set(pages)
+    for path in pages:
+        for edge in graph.inbound(base_url + path):
+            if edge.pageurl.startswith(base_url + '/'):
+                ret.add(edge.pageurl[len(base_url) :])
+    return ret
+
+
+def affected_pages(
+    pubdir: str,
+    base_url: str,
+    changed_files: Iterable[str],
+    baseline: Optional[str] = None,
+    linkgraph: Optional[str] = None,
+) -> Resolution:
+    """Return the URLs of the pages (on `base_url`) that a change to
+    `changed_files` affects; see the module docstring.  `baseline` is the
+    filename of a manifest to diff against; `linkgraph` is the filename of
+    a link graph to look up dependents in."""
+    manifest = build_manifest(pubdir)
+    res = resolve_sources(changed_files, manifest)
+    pages = res.pages
+    if baseline:
+        pages |= changed_pages(load_manifest(baseline), manifest)
+    if linkgraph:
+        graph = LinkGraph(linkgraph, readonly=True)
+        try:
+            pages = add_dependents(base_url, pages, graph)
+        finally:
+            graph.close()
+    base_url = base_url.rstrip('/')
+    return Resolution(
+        # Removed pages can't be checked, but the pages linking to them can.
+        pages={base_url + path for path in pages if path in manifest},
+        unresolved=res.unresolved,
+    )
+
+
+def read_changed_files(filename: str) -> List[str]:
+    """Read a whitespace-separated list of changed files."""
+    with open(filename, 'r') as fh:
+        return fh.read().split()
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python3 -m blclib.prmode', description=__doc__)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    p = subparsers.add_parser('manifest', help='write a content-hash manifest of PUBDIR')
+    p.add_argument('pubdir')
+    p.add_argument('outfile')
+    p = subparsers.add_parser('affected', help='list the pages that a change affects')
+    p.add_argument('--baseline', metavar='MANIFEST')
+    p.add_argument('--linkgraph', metavar='DBFILE')
+    p.add_argument('pubdir')
+    p.add_argument('base_url')
+    p.add_argument('changed_files')
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'manifest':
+        write_manifest(args.outfile, build_manifest(args.pubdir))
+    elif args.command == 'affected':
+        res = affected_pages(
+            args.pubdir,
+            args.base_url,
+            read_changed_files(args.changed_files),
+            baseline=args.baseline,
+            linkgraph=args.linkgraph,
+        )
+        for file in res.unresolved:
+            print(f"{file}: does not correspond to any page", file=sys.stderr)
+        for url in sorted(res.pages):
+            print(url)
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv))
+    except KeyboardInterrupt as err:
+        print(err, file=sys.stderr)
+        sys.exit(130)
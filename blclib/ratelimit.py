@@ -0,0 +1,202 @@
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from fnmatch import fnmatch
+from typing import Deque, Dict, Mapping, Optional
+
+# Additive increase: how many requests/second a throttled host's rate grows by, per
+# second of successful requests.
+INCREASE = 1.0
+# Multiplicative decrease: what a host's rate is multiplied by when it throttles us.
+DECREASE = 0.5
+# Multiplicative decrease for when a host's latency balloons (it's struggling, but hasn't
+# told us to back off yet).
+LATENCY_DECREASE = 0.8
+# A response is "slow" if it takes this many times longer than the fastest that we've
+# seen from the host (and at least MIN_SLOW seconds).
+LATENCY_FACTOR = 4.0
+MIN_SLOW = 1.0
+# Rates (requests/second) are kept within [MIN_RATE, MAX_RATE]; a learned rate that grows
+# past MAX_RATE stops being a limit at all.
+MIN_RATE = 0.1
+MAX_RATE = 50.0
+# Backoff for throttling that doesn't say how long to wait (self-redirects, 503s without
+# Retry-After): doubles each time, from MIN_BACKOFF up to MAX_BACKOFF seconds.
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+# How many recent sends to measure a host's actual request rate over.
+RATE_WINDOW = 20
+
+
+def parse_retry_after(value: str, now: Optional[float] = None) -> Optional[float]:
+    """Parse a Retry-After header value (either delay-seconds or an HTTP-date;
+    https://httpwg.org/specs/rfc9110.html#field.retry-after) into a number of
+    seconds from `now`.  Returns None if it isn't valid.
+
+    """
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        return None
+    return max(when.timestamp() - (time.time() if now is None else now), 0.0)
+
+
+def parse_rate_limits(value: str) -> Dict[str, float]:
+    """Parse a string of the form "github.com=2,*.example.com=0.5" in to a
+    {host-pattern: requests-per-second} dict.
+
+    """
+    ret: Dict[str, float] = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        pattern, sep, rate = item.partition('=')
+        if not sep:
+            raise ValueError(f"expected HOST=RATE, got {item.strip()!r}")
+        ret[pattern.strip().lower()] = float(rate)
+    return ret
+
+
+class HostLimiter:
+    """HostLimiter is a token bucket for a single host, whose rate is
+    learned AIMD-style: it grows additively while requests succeed, and
+    shrinks multiplicatively when the host throttles us (429, 503) or when
+    its latency balloons.  A `rate` of None means no limit (which is where
+    every host without a configured cap starts out).
+
+    """
+
+    cap: Optional[float]
+    rate: Optional[float]
+    tokens: float
+    stamp: float
+    not_before: float
+    backoff: float
+    min_latency: Optional[float]
+    # How many times the host has throttled us.
+    throttles: int
+    _sends: Deque[float]
+
+    def __init__(self, cap: Optional[float] = None) -> None:
+        self.cap = cap
+        self.rate = cap
+        self.tokens = 1.0
+        self.stamp = time.time()
+        self.not_before = 0.0
+        self.backoff = MIN_BACKOFF
+        self.min_latency = None
+        self.throttles = 0
+        self._sends = deque(maxlen=RATE_WINDOW)
+
+    def _refill(self, now: float) -> None:
+        if self.rate is not None:
+            # Allow a burst of up to 1 second worth of requests.
+            self.tokens = min(
+                max(self.rate, 1.0), self.tokens + (now - self.stamp) * self.rate
+            )
+        self.stamp = now
+
+    def acquire(self, now: float) -> float:
+        """Take a token to send a request; returns 0 on success, or else how
+        many seconds until we may send.
+
+        """
+        if now < self.not_before:
+            return self.not_before - now
+        self._refill(now)
+        if self.rate is not None:
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.rate
+                self.not_before = now + wait
+                return wait
+            self.tokens -= 1
+        self._sends.append(now)
+        return 0.0
+
+    def observed_rate(self, now: float) -> float:
+        if len(self._sends) < 2:
+            return MAX_RATE
+        return len(self._sends) / max(now - self._sends[0], 1e-3)
+
+    def _decrease(self, now: float, factor: float) -> None:
+        base = self.rate if self.rate is not None else self.observed_rate(now)
+        self.rate = max(min(base * factor, MAX_RATE), MIN_RATE)
+        if self.cap is not None:
+            self.rate = min(self.rate, self.cap)
+        self.tokens = min(self.tokens, 1.0)
+
+    def on_success(self, now: float, latency: Optional[float]) -> None:
+        self.backoff = MIN_BACKOFF
+        if latency is not None:
+            if self.min_latency is None or latency < self.min_latency:
+                self.min_latency = latency
+            elif latency > max(self.min_latency * LATENCY_FACTOR, MIN_SLOW):
+                self._decrease(now, LATENCY_DECREASE)
+                return
+        if self.rate is not None:
+            self.rate += INCREASE / self.rate
+            if self.cap is not None:
+                self.rate = min(self.rate, self.cap)
+            elif self.rate > MAX_RATE:
+                self.rate = None
+
+    def on_throttle(self, now: float, retry_after: Optional[float]) -> float:
+        """Record that the host told us to slow down; returns how many seconds
+        to wait before the next request to it."""
+        self.throttles += 1
+        self._decrease(now, DECREASE)
+        if retry_after is None:
+            retry_after = self.backoff
+            self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+        self.not_before = max(self.not_before, now + retry_after)
+        return retry_after
+
+
+class RateLimiter:
+    """RateLimiter holds a HostLimiter for each host (by netloc) that we talk
+    to.  `caps` maps host patterns (fnmatch-style, matched against the
+    netloc) to the maximum requests/second that we'll ever send to matching
+    hosts.
+
+    """
+
+    caps: Mapping[str, float]
+    _hosts: Dict[str, HostLimiter]
+
+    def __init__(self, caps: Optional[Mapping[str, float]] = None) -> None:
+        self.caps = caps or {}
+        self._hosts = {}
+
+    def host(self, netloc: str) -> HostLimiter:
+        if (ret := self._hosts.get(netloc)) is None:
+            cap: Optional[float] = None
+            for pattern, rate in self.caps.items():
+                if fnmatch(netloc.lower(), pattern):
+                    cap = rate if cap is None else min(cap, rate)
+            ret = self._hosts[netloc] = HostLimiter(cap)
+        return ret
+
+    def not_before(self, netloc: str) -> float:
+        """Return the time (as in `time.time()`) before which we shouldn't
+        send a request to `netloc`."""
+        if (host := self._hosts.get(netloc)) is None:
+            return 0.0
+        return host.not_before
+
+    def hosts(self) -> Dict[str, HostLimiter]:
+        """Return the HostLimiter for each host that has been talked to."""
+        return dict(self._hosts)
+
+    def acquire(self, netloc: str) -> float:
+        return self.host(netloc).acquire(time.time())
+
+    def on_success(self, netloc: str, latency: Optional[float] = None) -> None:
+        self.host(netloc).on_success(time.time(), latency)
+
+    def on_throttle(self, netloc: str, retry_after: Optional[float] = None) -> float:
+        return self.host(netloc).on_throttle(time.time(), retry_after)
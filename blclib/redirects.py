@@ -0,0 +1,76 @@
+from typing import Dict, NamedTuple, Optional, Tuple
+from urllib.parse import urldefrag
+
+# How many hops to follow before giving up (the same as requests.models.DEFAULT_REDIRECT_LIMIT).
+MAX_HOPS = 30
+
+
+class Hop(NamedTuple):
+    status: int
+    location: str
+
+
+class Redirect(NamedTuple):
+    # The URL that the chain ends at (or the last good URL, if `error` is set); keeping the
+    # original #fragment if no hop replaced it.
+    final: str
+    # How many hops it took to get to `final`.
+    hops: int
+    # The HTTP status of the first hop (or 0 if there were no hops).
+    status: int
+    # Every URL along the way, from the original URL to `final` (without fragments).
+    chain: Tuple[str, ...]
+    # Why the chain is broken, if it is.
+    error: Optional[str]
+
+
+class RedirectMap:
+    """RedirectMap remembers every redirect hop (URL -> status + Location)
+    that has been seen, so that each hop only ever needs to be requested
+    once; `resolve()` follows the known hops from a URL as far as they go.
+
+    """
+
+    _hops: Dict[str, Hop]
+
+    def __init__(self) -> None:
+        self._hops = {}
+
+    def add_hop(self, url: str, status: int, location: str) -> None:
+        """Record that `url` redirects (with `status`) to the absolute URL
+        `location`."""
+        self._hops[urldefrag(url).url] = Hop(status=status, location=location)
+
+    def get_hop(self, url: str) -> Optional[Hop]:
+        return self._hops.get(urldefrag(url).url)
+
+    def resolve(self, url: str) -> Redirect:
+        """Follow the known hops from `url`.  If the returned `final` URL
+        hasn't been fetched yet, it might redirect further still."""
+        cur, fragment = urldefrag(url)
+        chain = [cur]
+        status = 0
+        error = None
+        while (hop := self._hops.get(cur)) is not None:
+            if not status:
+                status = hop.status
+            nxt, nxt_fragment = urldefrag(hop.location)
+            if nxt_fragment:
+                # Like a browser (and requests), only replace the fragment if the redirect
+                # gives a new one.
+                fragment = nxt_fragment
+            if nxt in chain:
+                error = f"redirect loop: {' -> '.join(chain + [nxt])}"
+                break
+            if len(chain) > MAX_HOPS:
+                error = f"too many redirects: more than {MAX_HOPS}"
+                break
+            cur = nxt
+            chain.append(cur)
+        return Redirect(
+            final=(f'{cur}#{fragment}' if fragment else cur),
+            hops=len(chain) - 1,
+            status=status,
+            chain=tuple(chain),
+            error=error,
+        )
@@ -0,0 +1,239 @@
+import heapq
+from collections import deque
+from typing import Callable, Container, Deque, Dict, List, Mapping, Optional, Tuple, Union
+from urllib.parse import urldefrag
+
+from .models import Link, URLReference
+
+Task = Union[Link, URLReference]
+
+# Task classes, in priority order.
+PAGE = 'page'
+FRAGMENT = 'fragment'
+INTERNAL = 'internal'
+EXTERNAL = 'external'
+
+DEFAULT_WEIGHTS: Mapping[str, float] = {
+    PAGE: 8,
+    FRAGMENT: 4,
+    INTERNAL: 4,
+    EXTERNAL: 1,
+}
+
+
+class Scheduler:
+    """Scheduler decides which task to run next.
+
+    Each task is put in a class (by the `classify` callback; one of PAGE,
+    FRAGMENT, INTERNAL, or EXTERNAL), and classes get turns in proportion
+    to their weights (stride scheduling); so by default internal pages get
+    crawled 8 times as often as external links get checked, but external
+    links never starve.
+
+    Links are grouped by their resolved URL (ignoring the fragment), since
+    they all need the same document; `pop()` returns every link that is
+    waiting on that URL, so the URL only gets fetched once, and all of the
+    fragments checked against it at once.
+
+    A batch whose host has told us to back off can be `park()`ed until a
+    given time, without holding up anything else in its class.
+
+    Several checkers can share one Scheduler (see batch.py), each through a
+    SiteScheduler that tags its tasks with a site name; tasks of different
+    sites are never batched together, and `pop_site()` says which site a
+    batch is for.
+
+    """
+
+    weights: Mapping[str, float]
+    _classify: Callable[[Task], str]
+    _queues: Dict[str, Deque[str]]
+    _batches: Dict[str, List[Task]]
+    _classes: Dict[str, str]
+    _sites: Dict[str, str]
+    _pass: Dict[str, float]
+    _parked: List[Tuple[float, int, str]]
+    _seq: int
+    # How many tasks are waiting (queued or parked), in all and per class; kept up to date by
+    # `push()`, `park()`, and `pop_site()`, since the run loops ask on every iteration.
+    _count: int
+    _sizes: Dict[str, int]
+    # How many tasks of each class have been handed out by `pop()`.
+    popped: Dict[str, int]
+
+    def __init__(
+        self, classify: Callable[[Task], str], weights: Mapping[str, float] = DEFAULT_WEIGHTS
+    ) -> None:
+        self.weights = weights
+        self._classify = classify
+        self._queues = {cls: deque() for cls in weights}
+        self._batches = {}
+        self._classes = {}
+        self._sites = {}
+        self._pass = {cls: 0.0 for cls in weights}
+        self._parked = []
+        self._seq = 0
+        self._count = 0
+        self._sizes = {cls: 0 for cls in weights}
+        self.popped = {cls: 0 for cls in weights}
+
+    @staticmethod
+    def _key(task: Task, site: str = '') -> str:
+        prefix = f'{site} ' if site else ''
+        if isinstance(task, Link):
+            return f'{prefix}link {urldefrag(task.linkurl.resolved).url}'
+        return f'{prefix}page {task.resolved}'
+
+    def __len__(self) -> int:
+        return self._count
+
+    def sizes(self) -> Dict[str, int]:
+        """Return how many tasks of each class are waiting (queued or
+        parked)."""
+        return dict(self._sizes)
+
+    def _add(self, cls: str, n: int) -> None:
+        self._count += n
+        self._sizes[cls] = self._sizes.get(cls, 0) + n
+
+    def parked(self) -> int:
+        """Return how many batches are parked."""
+        return len(self._parked)
+
+    def push(self, task: Task, site: str = '', cls: Optional[str] = None) -> None:
+        """Queue `task` (for `site`, in class `cls`; by default, whatever
+        `classify` says)."""
+        key = self._key(task, site)
+        if (batch := self._batches.get(key)) is not None:
+            batch.append(task)
+            self._add(self._classes[key], 1)
+            return
+        if cls is None:
+            cls = self._classify(task)
+        self._add(cls, 1)
+        self._batches[key] = [task]
+        self._classes[key] = cls
+        self._sites[key] = site
+        queue = self._queues.setdefault(cls, deque())
+        if not queue:
+            # Don't let a class that has been idle catch up all at once.
+            active = [self._pass[c] for c, q in self._queues.items() if q]
+            self._pass[cls] = max(self._pass.get(cls, 0.0), min(active, default=0.0))
+        queue.append(key)
+
+    def park(
+        self, batch: List[Task], until: float, site: str = '', cls: Optional[str] = None
+    ) -> None:
+        """Put a batch (as returned by `pop()`) back, but not to be returned
+        again before the time `until`."""
+        key = self._key(batch[0], site)
+        if (pending := self._batches.get(key)) is not None:
+            # More tasks for the same URL came in since it was popped.
+            self._add(self._classes[key], -len(pending))
+            batch = batch + pending
+            queue = self._queues[self._classes[key]]
+            if key in queue:
+                queue.remove(key)
+            else:
+                # They got popped and parked too (while this batch was still running, in an
+                # AsyncBaseChecker).
+                self._parked = [entry for entry in self._parked if entry[2] != key]
+                heapq.heapify(self._parked)
+        self._batches[key] = batch
+        self._classes[key] = self._classify(batch[0]) if cls is None else cls
+        self._sites[key] = site
+        self._add(self._classes[key], len(batch))
+        heapq.heappush(self._parked, (until, self._seq, key))
+        self._seq += 1
+
+    def unpark(self, now: float, classes: Optional[Container[str]] = None) -> None:
+        """Return parked batches whose time has come (or, if `classes` is
+        given, all parked batches of those classes) to their queues."""
+        keep = []
+        # Back to the front of the line (it was there first), earliest first.
+        for until, seq, key in sorted(self._parked, reverse=True):
+            cls = self._classes[key]
+            if until <= now or (classes is not None and cls in classes):
+                self._queues[cls].appendleft(key)
+            else:
+                keep.append((until, seq, key))
+        self._parked = keep
+        heapq.heapify(self._parked)
+
+    def next_wake(self) -> Optional[float]:
+        """Return when the next parked batch is due, or None if nothing is
+        parked."""
+        return self._parked[0][0] if self._parked else None
+
+    def pop(self, now: float) -> Optional[List[Task]]:
+        """Return the next batch of tasks to run (either a single page task,
+        or all of the link tasks for one URL, whatever their fragments), or None if there is nothing
+        that can run before some parked batch's time comes (see
+        `next_wake()`)."""
+        ret = self.pop_site(now)
+        return ret[1] if ret else None
+
+    def pop_site(self, now: float) -> Optional[Tuple[str, List[Task]]]:
+        """Like `pop()`, but return (the site it is for, the batch)."""
+        if self._parked and self._parked[0][0] <= now:
+            self.unpark(now)
+        ready = [cls for cls, queue in self._queues.items() if queue]
+        if not ready:
+            return None
+        cls = min(ready, key=lambda c: self._pass[c])
+        self._pass[cls] += 1.0 / self.weights.get(cls, 1.0)
+        key = self._queues[cls].popleft()
+        del self._classes[key]
+        site = self._sites.pop(key)
+        batch = self._batches.pop(key)
+        self._add(cls, -len(batch))
+        self.popped[cls] = self.popped.get(cls, 0) + len(batch)
+        return site, batch
+
+
+class SiteScheduler(Scheduler):
+    """SiteScheduler is one site's view of a Scheduler shared with other
+    sites: what it queues and parks is tagged with `site` (and classified
+    by its own `classify`), and everything else is the shared Scheduler's.
+
+    """
+
+    shared: Scheduler
+    site: str
+
+    def __init__(
+        self, shared: Scheduler, site: str, classify: Callable[[Task], str]
+    ) -> None:
+        self.shared = shared
+        self.site = site
+        self.weights = shared.weights
+        self._classify = classify
+        self.popped = shared.popped
+
+    def __len__(self) -> int:
+        return len(self.shared)
+
+    def sizes(self) -> Dict[str, int]:
+        return self.shared.sizes()
+
+    def parked(self) -> int:
+        return self.shared.parked()
+
+    def push(self, task: Task, site: str = '', cls: Optional[str] = None) -> None:
+        self.shared.push(task, self.site, self._classify(task) if cls is None else cls)
+
+    def park(
+        self, batch: List[Task], until: float, site: str = '', cls: Optional[str] = None
+    ) -> None:
+        self.shared.park(
+            batch, until, self.site, self._classify(batch[0]) if cls is None else cls
+        )
+
+    def unpark(self, now: float, classes: Optional[Container[str]] = None) -> None:
+        self.shared.unpark(now, classes)
+
+    def next_wake(self) -> Optional[float]:
+        return self.shared.next_wake()
+
+    def pop_site(self, now: float) -> Optional[Tuple[str, List[Task]]]:
+        return self.shared.pop_site(now)
@@ -0,0 +1,48 @@
+from typing import Iterable, List
+from xml.etree.ElementTree import Element, XMLPullParser
+
+import requests
+
+CHUNK_SIZE = 64 * 1024
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+XHTML_NS = 'http://www.w3.org/1999/xhtml'
+IMAGE_NS = 'http://www.google.com/schemas/sitemap-image/1.1'
+
+_LOC_TAGS = (f'{{{SITEMAP_NS}}}loc', f'{{{IMAGE_NS}}}loc', 'loc')
+_LINK_TAG = f'{{{XHTML_NS}}}link'
+
+
+def scan_sitemap(chunks: Iterable[bytes]) -> List[str]:
+    """Return the URLs in a sitemap (https://www.sitemaps.org/protocol.html)
+    or sitemap index: every `<loc>` (including image-sitemap `<image:loc>`),
+    and the `href` of `<xhtml:link rel="alternate">` entries.
+
+    Like `scan_svg()`, the document is parsed incrementally and each element
+    is discarded once it has been looked at.  Raises
+    `xml.etree.ElementTree.ParseError` if it isn't well-formed XML.
+
+    """
+    parser = XMLPullParser(events=('end',))  # type: ignore[var-annotated]
+    ret: List[str] = []
+
+    def handle_events() -> None:
+        for _, elem in parser.read_events():  # type: ignore[misc]
+            if not isinstance(elem, Element):
+                continue
+            if elem.tag in _LOC_TAGS and elem.text and elem.text.strip():
+                ret.append(elem.text.strip())
+            elif elem.tag == _LINK_TAG and (href := elem.get('href')):
+                ret.append(href.strip())
+            elem.clear()
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        handle_events()
+    parser.close()
+    handle_events()
+    return ret
+
+
+def scan_sitemap_response(resp: requests.Response) -> List[str]:
+    return scan_sitemap(resp.iter_content(CHUNK_SIZE))
@@ -0,0 +1,59 @@
+from typing import Iterable, List, Optional
+from xml.etree.ElementTree import Element, XMLPullParser
+
+import requests
+
+from .css import CSSCache, iter_css_urls
+
+CHUNK_SIZE = 64 * 1024
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+XLINK_NS = 'http://www.w3.org/1999/xlink'
+
+_HREF_ATTRS = ('href', f'{{{XLINK_NS}}}href')
+
+
+def scan_svg(chunks: Iterable[bytes], csscache: Optional[CSSCache] = None) -> List[str]:
+    """Return the URL references in an SVG document: `href` and `xlink:href`
+    attributes, and `url()`s in `<style>` elements and `style` attributes.
+
+    The document is parsed incrementally (a chunk at a time) with an XML pull
+    parser, and each element is discarded as soon as it has been looked at,
+    so large diagrams are never held in memory as a whole tree.  Raises
+    `xml.etree.ElementTree.ParseError` if the document isn't well-formed XML.
+
+    """
+    parser = XMLPullParser(events=('start', 'end'))  # type: ignore[var-annotated]
+    ret: List[str] = []
+
+    def handle_events() -> None:
+        for event, elem in parser.read_events():  # type: ignore[misc]
+            if not isinstance(elem, Element):
+                continue
+            if event == 'start':
+                for attr in _HREF_ATTRS:
+                    if (val := elem.get(attr)) is not None:
+                        ret.append(val.strip())
+                if style := elem.get('style'):
+                    # A declaration list, not a stylesheet, so don't ask for errors.
+                    ret.extend(iter_css_urls(style))
+            else:
+                if elem.tag in (f'{{{SVG_NS}}}style', 'style') and elem.text:
+                    if csscache:
+                        ret.extend(csscache.extract(elem.text).urls)
+                    else:
+                        ret.extend(iter_css_urls(elem.text))
+                elem.clear()
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        handle_events()
+    parser.close()
+    handle_events()
+    return ret
+
+
+def scan_svg_response(
+    resp: requests.Response, csscache: Optional[CSSCache] = None
+) -> List[str]:
+    return scan_svg(resp.iter_content(CHUNK_SIZE), csscache)
@@ -1,17 +1,58 @@
 #!/usr/bin/env python3
+import contextlib
 import os.path
 import re
 import subprocess
 import sys
+import tempfile
 import threading
-import time
-from typing import Optional, Protocol, Set
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    ContextManager,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Protocol,
+    Set,
+    Union,
+)
 from urllib.parse import urldefrag, urlparse
-
-import bs4.element
-from bs4 import BeautifulSoup
-
-from blclib import BaseChecker, Link, RetryAfterException, URLReference
+from xml.etree.ElementTree import ParseError
+
+from blclib import (
+    BaseChecker,
+    Link,
+    RetryAfterException,
+    URLReference,
+    fswalk,
+    settings_errors,
+)
+from blclib.extractors import SitemapExtractor
+from blclib.output import DEBUG, INFO, OutputSink, parse_verbosity
+from blclib.redirects import Redirect
+from blclib.sitemap import scan_sitemap
+
+if TYPE_CHECKING:
+    import bs4.element
+    from bs4 import BeautifulSoup
+
+# Where to seed the queue from, in addition to the site root: a comma-separated list of
+# "public" (every HTML file in PROJDIR/public) and/or "sitemap" (PROJDIR/public/sitemap.xml).
+SEED = os.getenv('SEED', '')
+SEED_SOURCES = ('public', 'sitemap')
+# How much to log: "result" (just the problems found), "info" (and backoffs), or "debug"
+# (and every request); see blclib/output.py.
+VERBOSITY = os.getenv('VERBOSITY', '')
+# Where to keep the listing of PROJDIR/public between runs, so that directories that haven't
+# changed don't get read again (see blclib/fswalk.py).
+FS_CACHE = os.getenv('FS_CACHE', '')
+# Comma-separated globs of which files in PROJDIR/public the "not reachable" check looks at.
+ORPHANS_INCLUDE = os.getenv('ORPHANS_INCLUDE', '')
+ORPHANS_EXCLUDE = os.getenv('ORPHANS_EXCLUDE', '')
 
 
 class GenericChecker(BaseChecker):
@@ -25,59 +66,104 @@ class GenericChecker(BaseChecker):
     stats_sleep: float = 0
     stats_broken_links: int = 0
     stats_ugly_links: int = 0
+    stats_unchecked: int = 0
 
-    stats_sitemap: Set[str] = set()
+    # The internal part of the link graph: {page URL: {linked URL}}, all without fragments.
+    link_graph: Dict[str, Set[str]]
+    # Where the log goes.
+    out: OutputSink
 
     def __init__(self, domain: str) -> None:
         self.domain = domain
+        self.link_graph = {}
+        self.out = OutputSink()
         super().__init__()
+        sitemap = SitemapExtractor()
+        self.extractors.register('application/xml', sitemap)
+        self.extractors.register('text/xml', sitemap)
 
     def log_broken(self, link: Link, reason: str) -> None:
         self.stats_links_bad += 1
         msg = f'Page {urldefrag(link.pageurl.resolved).url} has a broken link: "{link.linkurl.ref}" ({reason})'
-        print(msg)
+        self.out.write(msg)
 
     def log_ugly(self, link: Link, reason: str, suggestion: Optional[str] = None) -> None:
         self.stats_links_bad += 1
         msg = f'Page {urldefrag(link.pageurl.resolved).url} has an ugly link: "{link.linkurl.ref}" {reason}'
         if suggestion:
             msg += f' (did you mean "{suggestion}"?)'
-        print(msg)
+        self.out.write(msg)
 
     def handle_request_starting(self, url: str) -> None:
         urlobj = urlparse(url)
-        if urlobj.netloc == self.domain:
-            self.stats_sitemap.add(urlobj.path)
         if urlobj.scheme != 'data':
-            print(f"clt GET {urldefrag(url).url}")
+            if self.out.enabled(DEBUG):
+                self.out.write(f"clt GET {urldefrag(url).url}", DEBUG)
             self.stats_requests += 1
 
     def handle_page_starting(self, url: str) -> None:
         self.stats_pages += 1
 
-    def handle_html_extra(self, page_url: URLReference, page_soup: BeautifulSoup) -> None:
+    def handle_redirect_chain(self, link: Link, redirect: Redirect) -> None:
+        self.log_ugly(
+            link=link,
+            reason=f'goes through {redirect.hops} redirects',
+            suggestion=redirect.final,
+        )
+
+    def reachable_paths(self, roots: Iterable[str]) -> Set[str]:
+        """Return the paths of all internal URLs that can be reached from
+        `roots` by following links (and redirects) in the link graph.
+
+        """
+        seen: Set[str] = set()
+        todo = [urldefrag(url).url for url in roots]
+        while todo:
+            url = todo.pop()
+            if url in seen:
+                continue
+            seen.add(url)
+            if hop := self.redirects.get_hop(url):
+                todo.append(urldefrag(hop.location).url)
+            todo.extend(self.link_graph.get(url, ()))
+        return {urlparse(url).path for url in seen if urlparse(url).netloc == self.domain}
+
+    def handle_html_extra(self, page_url: URLReference, page_soup: 'BeautifulSoup') -> None:
         # It is important that all pages have canonicals so that Netlify previews don't
         # devalue the real site.
-        def is_canonical(tag: bs4.element.Tag) -> bool:
+        def is_canonical(tag: 'bs4.element.Tag') -> bool:
             return (tag.name == 'link') and bool(tag['href']) and ('canonical' in tag['rel'])
 
         if not page_soup.find_all(is_canonical):
-            print(f'Page {urldefrag(page_url.resolved).url} does not have a canonical')
+            self.out.write(
+                f'Page {urldefrag(page_url.resolved).url} does not have a canonical'
+            )
 
     def handle_page_error(self, url: str, err: str) -> None:
         self.stats_errors += 1
-        print(f"error: {url}: {err}")
+        self.out.write(f"error: {url}: {err}")
+
+    def handle_unchecked(self, task: Union[Link, URLReference], reason: str) -> None:
+        self.stats_unchecked += 1
+        if isinstance(task, Link):
+            self.out.write(
+                f'Page {urldefrag(task.pageurl.resolved).url} has an unchecked link: "{task.linkurl.ref}" ({reason})'
+            )
+        else:
+            self.out.write(f'Page {urldefrag(task.resolved).url} was {reason}')
 
     def handle_timeout(self, url: str, err: str) -> None:
         self.stats_errors += 1
-        print(f"Page {url} produced a timeout error. A manual review is required")
+        self.out.write(f"Page {url} produced a timeout error. A manual review is required")
 
     def handle_429(self, err: RetryAfterException) -> None:
-        print(f"backoff: {err.url}: retrying after {err.retry_after} seconds")
+        self.out.write(f"backoff: {err.url}: retrying after {err.retry_after} seconds", INFO)
 
     def handle_sleep(self, secs: float) -> None:
         self.stats_sleep += secs
-        print(f"backoff: sleeping for {secs} seconds")
+        self.out.write(f"backoff: sleeping for {secs} seconds", INFO)
+        # Don't hold the log back while we wait.
+        self.out.flush()
 
     def is_internal_domain(self, netloc: str) -> bool:
         if netloc == 'telepresence.io':
@@ -160,6 +246,10 @@ class GenericChecker(BaseChecker):
 
     def handle_link_result(self, link: Link, broken: Optional[str]) -> None:
         self.stats_links_total += 1
+        linkurl = urldefrag(link.linkurl.resolved).url
+        if urlparse(linkurl).netloc == self.domain:
+            pageurl = urldefrag(link.pageurl.resolved).url
+            self.link_graph.setdefault(pageurl, set()).add(linkurl)
         if broken:
             if not self.product_should_skip_link_result(link, broken):
                 self.log_broken(link, broken)
@@ -176,85 +266,262 @@ class CheckerInterface(Protocol):
     def __call__(self, domain: str) -> GenericChecker: ...  # noqa: E704
 
 
-def crawl_filesystem(pubdir: str) -> Set[str]:
-    pubdir = os.path.normpath(pubdir)
+def walk_public(pubdir: str) -> fswalk.Manifest:
+    """List `pubdir` (through FS_CACHE, if it is set)."""
+    manifest = fswalk.walk(pubdir, fswalk.load(FS_CACHE) if FS_CACHE else None)
+    if FS_CACHE:
+        fswalk.save(FS_CACHE, manifest)
+    return manifest
+
+
+def crawl_filesystem(pubdir: str, manifest: Optional[fswalk.Manifest] = None) -> Set[str]:
+    if manifest is None:
+        manifest = walk_public(pubdir)
     ret: Set[str] = set()
-    for root, dirs, files in os.walk(pubdir):
-        for file in files:
-            fullpath = os.path.join(root, file)
-            urlpath = fullpath[len(pubdir) :]
-            if urlpath.endswith('/index.html'):
-                urlpath = urlpath[: -len('index.html')]
-            if urlpath == "/_redirects" or urlpath == "/_headers":
-                continue
-            ret.add(urlpath)
+    for urlpath in fswalk.files(manifest):
+        if urlpath.endswith('/index.html'):
+            urlpath = urlpath[: -len('index.html')]
+        if urlpath == "/_redirects" or urlpath == "/_headers":
+            continue
+        ret.add(urlpath)
     return ret
 
 
-def main(checkerCls: CheckerInterface, projdir: str) -> int:
-    urls = [
-        'http://localhost:9000/',
-        'http://localhost:9000/404.html',
-        'http://localhost:9000/404/',
-    ]
-    checker = checkerCls(domain=urlparse(urls[0]).netloc)
-    for url in urls:
-        checker.enqueue(URLReference(ref=url))
+def read_sitemap(pubdir: str, filename: str, base_url: str) -> List[str]:
+    """Return the page URLs listed in the sitemap `pubdir/filename`
+    (following sitemap indexes to other sitemap files in `pubdir`), rewritten
+    to be on `base_url` instead of on the production domain.
+
+    """
+    base = urlparse(base_url)
+    ret: List[str] = []
+    with open(os.path.join(pubdir, filename.lstrip('/')), 'rb') as fh:
+        locs = scan_sitemap(iter(lambda: fh.read(64 * 1024), b''))
+    for loc in locs:
+        url = urlparse(loc)._replace(scheme=base.scheme, netloc=base.netloc)
+        if url.path.endswith('.xml') and os.path.isfile(
+            os.path.join(pubdir, url.path.lstrip('/'))
+        ):
+            ret += read_sitemap(pubdir, url.path, base_url)
+        else:
+            ret.append(url.geturl())
+    return ret
+
+
+def seed_urls(
+    pubdir: str,
+    base_url: str,
+    sources: Iterable[str],
+    manifest: Optional[fswalk.Manifest] = None,
+) -> List[str]:
+    ret: List[str] = []
+    for source in sources:
+        if source == 'public':
+            ret += [
+                base_url + path
+                for path in sorted(crawl_filesystem(pubdir, manifest))
+                if path.endswith('/') or path.endswith('.html')
+            ]
+        elif source == 'sitemap':
+            if os.path.isfile(os.path.join(pubdir, 'sitemap.xml')):
+                ret += read_sitemap(pubdir, 'sitemap.xml', base_url)
+        else:
+            raise ValueError(
+                f"unknown seed source: {repr(source)} (valid sources: {', '.join(SEED_SOURCES)})"
+            )
+    return ret
 
-    with subprocess.Popen(
-        [os.path.join(os.path.abspath(os.path.dirname(__file__)), 'serve.js')],
-        cwd=projdir,
-        stdout=subprocess.PIPE,
-    ) as srv:
+
+def is_local_address(url: str) -> bool:
+    return urlparse(url).hostname in ('localhost', '127.0.0.1')
+
+
+@contextlib.contextmanager
+def serving(
+    projdir: str,
+    out: Optional[OutputSink] = None,
+    manifest: Optional[fswalk.Manifest] = None,
+    port: int = 9000,
+) -> Iterator[None]:
+    """Serve `projdir` (with serve.js) on http://localhost:`port` for the
+    duration of the with-block, logging to `out`; the block is entered once
+    the server is ready.  serve.js loads the files listed in `manifest`
+    (by default, a fresh walk of PROJDIR/public) instead of walking the
+    directory itself."""
+    sink = out or OutputSink()
+    if manifest is None:
+        manifest = walk_public(os.path.join(projdir, 'public'))
+    with contextlib.ExitStack() as stack:
+        if FS_CACHE:
+            # walk_public() just saved it.
+            manifest_file = os.path.abspath(FS_CACHE)
+        else:
+            manifest_file = stack.enter_context(
+                tempfile.NamedTemporaryFile(prefix='blc-fs-', suffix='.json')
+            ).name
+            fswalk.save(manifest_file, manifest)
+        srv = stack.enter_context(
+            subprocess.Popen(
+                [os.path.join(os.path.abspath(os.path.dirname(__file__)), 'serve.js')],
+                cwd=projdir,
+                stdout=subprocess.PIPE,
+                env={**os.environ, 'FS_MANIFEST': manifest_file, 'PORT': str(port)},
+            )
+        )
+        assert srv.stdout
+        stdout = srv.stdout
+        ready = threading.Event()
+
+        # Pump the servers logs
+        def pump() -> None:
+            while line := stdout.readline().decode('utf-8'):
+                if "Serving" in line:
+                    ready.set()
+                sink.write(line.rstrip('\n'), DEBUG if line.startswith('srv ') else INFO)
+            # It exited; don't wait forever.
+            ready.set()
+
+        pumper = threading.Thread(target=pump)
+        pumper.start()
         try:
-            server_ready = [False]
-            # Wait for the server to be ready
-            assert srv.stdout
-            sys.stdout.write(srv.stdout.readline().decode('utf-8'))
-
-            # Pump the servers logs
-            def pump(flag):
-                while line := srv.stdout.readline():
-                    line = line.decode('utf-8')
-                    if "Serving" in line:
-                        flag[0] = True
-                    sys.stdout.write(line)
-
-            threading.Thread(target=pump, args=[server_ready]).start()
-
-            # wait until the server is ready
-            while not server_ready[0]:
-                time.sleep(3)
-            # Run the checker
-            checker.run()
+            # Wait until the server is ready
+            ready.wait()
+            if srv.poll() is not None:
+                raise RuntimeError(f"serve.js exited with status {srv.returncode}")
+            yield
         finally:
             srv.kill()
+            # Finish pumping before Popen.__exit__ closes the pipe out from under it.
+            pumper.join()
+
+
+class Site(NamedTuple):
+    """A site to check, as set up by a product's `setup()`: its checker;
+    what to serve it locally with for the duration of the check; and what
+    to call afterwards to write the rest of the report (such as the
+    summary), which returns the exit code."""
+
+    checker: GenericChecker
+    serving: ContextManager[None]
+    report: Callable[[], int]
+
+
+def setup(
+    checkerCls: CheckerInterface,
+    projdir: str,
+    seed: str = SEED,
+    port: int = 9000,
+    out: Optional[OutputSink] = None,
+) -> Union[Site, int]:
+    """Set up checking PROJDIR (served on `port`); or print why not, and
+    return the exit code."""
+    base_url = f'http://localhost:{port}'
+    roots = [
+        f'{base_url}/',
+        f'{base_url}/404.html',
+        f'{base_url}/404/',
+    ]
+    pubdir = os.path.join(projdir, 'public')
+    if errors := settings_errors():
+        for err in errors:
+            print(err, file=sys.stderr)
+        return 2
+    try:
+        verbosity = parse_verbosity(VERBOSITY)
+    except ValueError as err:
+        print(f"VERBOSITY: {err}", file=sys.stderr)
+        return 2
+    checker = checkerCls(domain=urlparse(base_url).netloc)
+    if out:
+        checker.out = out
+    checker.out.verbosity = verbosity
+    for url in roots:
+        checker.enqueue(URLReference(ref=url))
+    # Walk PROJDIR/public once, for seeding, for serve.js, and for the "not reachable"
+    # check (checking doesn't change any files).
+    manifest = walk_public(pubdir)
+    try:
+        sources = [source.strip() for source in seed.split(',') if source.strip()]
+        seeds = seed_urls(pubdir, base_url, sources, manifest)
+    except (ValueError, ParseError) as err:
+        print(f"SEED: {err}", file=sys.stderr)
+        return 2
+    for url in seeds:
+        checker.enqueue(URLReference(ref=url))
 
-    sitemap = crawl_filesystem(os.path.join(projdir, 'public'))
-    stats_unreachable = len(sitemap - checker.stats_sitemap)
-    for path in sorted(sitemap - checker.stats_sitemap):
-        print(
-            f'Page http://localhost:9000{path} is not reachable from elsewhere on the site'
-        )
+    def report() -> int:
+        out = checker.out
+        # Reachability is computed from the link graph (rather than from what happened to
+        # get requested), so that it doesn't matter what order pages got checked in, or
+        # whether they were seeded.
+        include = fswalk.parse_globs(ORPHANS_INCLUDE)
+        exclude = fswalk.parse_globs(ORPHANS_EXCLUDE)
+        sitemap = {
+            path
+            for path in crawl_filesystem(pubdir, manifest)
+            if fswalk.matches(path, include, exclude)
+        }
+        unreachable = sitemap - checker.reachable_paths(roots)
+        stats_unreachable = len(unreachable)
+        if checker.stats_unchecked:
+            # The links on the pages that didn't get checked are missing from the link graph,
+            # so pages that only they link to would look unreachable; don't count that.
+            out.write(
+                f"Note: not reporting {stats_unreachable} apparently unreachable pages, since"
+                " the run ran out of time before checking everything"
+            )
+            stats_unreachable = 0
+        else:
+            for path in sorted(unreachable):
+                out.write(
+                    f'Page {base_url}{path} is not reachable from elsewhere on the site'
+                )
 
-    # Print a summary
-    print("Summary:")
-    print(
-        f"  Actions: Sent {checker.stats_requests} HTTP requests and slept for {checker.stats_sleep} seconds in order to check {checker.stats_links_total} links on {checker.stats_pages} pages."
-    )
-    print(
-        f"  Results: Encountered {checker.stats_errors} errors, {checker.stats_links_bad} bad links, and identified {stats_unreachable} unreachable pages."
+        # Print a summary
+        out.write("Summary:")
+        out.write(
+            f"  Actions: Sent {checker.stats_requests} HTTP requests and slept for {checker.stats_sleep} seconds in order to check {checker.stats_links_total} links on {checker.stats_pages} pages."
+        )
+        out.write(
+            f"  Results: Encountered {checker.stats_errors} errors, {checker.stats_links_bad} bad links, and identified {stats_unreachable} unreachable pages."
+        )
+        if checker.stats_unchecked:
+            out.write(
+                f"  Skipped: Ran out of time before checking {checker.stats_unchecked} links and pages."
+            )
+        out.flush()
+        total_problems = checker.stats_errors + checker.stats_links_bad + stats_unreachable
+        return 1 if total_problems > 0 else 0
+
+    return Site(
+        checker=checker, serving=serving(projdir, checker.out, manifest, port), report=report
     )
-    total_problems = checker.stats_errors + checker.stats_links_bad + stats_unreachable
-    return 1 if total_problems > 0 else 0
+
+
+def main(checkerCls: CheckerInterface, projdir: str, seed: str = SEED) -> int:
+    site = setup(checkerCls, projdir, seed)
+    if isinstance(site, int):
+        return site
+    with site.serving:
+        site.checker.run()
+    return site.report()
+
+
+def batch_site(projdir: str, port: int, out: OutputSink) -> Union[Site, int]:
+    """Set up checking PROJDIR as part of a batch (see batch_blc.py)."""
+    return setup(GenericChecker, projdir, port=port, out=out)
+
+
+def cli(argv: List[str]) -> int:
+    if len(argv) != 2:
+        print(f"Usage: {argv[0]} PROJDIR", file=sys.stderr)
+        return 2
+    return main(GenericChecker, argv[1])
 
 
 if __name__ == "__main__":
     try:
-        if len(sys.argv) != 2:
-            print(f"Usage: {sys.argv[0]} PROJDIR", file=sys.stderr)
-            sys.exit(2)
-        sys.exit(main(GenericChecker, sys.argv[1]))
+        sys.exit(cli(sys.argv))
     except KeyboardInterrupt as err:
         print(err, file=sys.stderr)
         sys.exit(130)
@@ -1,16 +1,32 @@
 #!/usr/bin/env python3
-import os
+import contextlib
+import os.path
 import re
-import subprocess
 import sys
-import threading
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 from urllib.parse import urldefrag, urlparse
 
-from blclib import Link, URLReference
-from generic_blc import CheckerInterface, GenericChecker
+from blclib import Link, URLReference, settings_errors
+from blclib.output import OutputSink, parse_verbosity
+from blclib.prmode import affected_pages, read_changed_files
+from generic_blc import (
+    VERBOSITY,
+    CheckerInterface,
+    GenericChecker,
+    Site,
+    is_local_address,
+    serving,
+)
 from utils.read_input_pages import ReadInputPages
 
+# PR mode: if either of these is set, then PAGES_TO_CHECK is a list of changed files, and
+# the pages to check are worked out from them (see blclib/prmode.py).  PR_BASELINE is a
+# content-hash manifest of a base build's public/ directory to diff against, and
+# PR_LINKGRAPH is the LINKGRAPH database of an earlier full run to find the pages that link
+# in to the changed ones from.
+PR_BASELINE = os.getenv('PR_BASELINE', '')
+PR_LINKGRAPH = os.getenv('PR_LINKGRAPH', '')
+
 
 def is_doc_url(url: URLReference) -> Optional[str]:
     """Returns the docs version if 'url' is a docs-url, or None if 'url' is not a docs-url."""
@@ -84,14 +100,14 @@ class AmbassadorChecker(GenericChecker):
     def log_broken(self, link: Link, reason: str) -> None:
         self.stats_broken_links += 1
         msg = f'Page {urldefrag(link.pageurl.resolved).url} has a broken link: "{link.linkurl.ref}" ({reason})'
-        print(msg)
+        self.out.write(msg)
 
     def log_ugly(self, link: Link, reason: str, suggestion: Optional[str] = None) -> None:
         self.stats_ugly_links += 1
         msg = f'Page {urldefrag(link.pageurl.resolved).url} has an ugly link: "{link.linkurl.ref}" {reason}'
         if suggestion:
             msg += f' (did you mean "{suggestion}"?)'
-        print(msg)
+        self.out.write(msg)
 
     def is_internal_domain(self, netloc: str) -> bool:
         if netloc == 'blog.getambassador.io':
@@ -124,7 +140,8 @@ class AmbassadorChecker(GenericChecker):
             'http://localhost:3000/color',
             'https://github.com/datawire/project-template/generate',
             'https://github.com/datawire/getambassador.io',
-            'http://localhost:9000/docs/telepresence/latest/extension/intro/',
+            # On whichever port this site is being served (see batch_site()).
+            f'http://{self.domain}/docs/telepresence/latest/extension/intro/',
             '/favicons/apple-icon-57x57.png',
             '/favicons/apple-icon-60x60.png',
             '/favicons/apple-icon-72x72.png',
@@ -226,73 +243,122 @@ class AmbassadorChecker(GenericChecker):
         return [desc.split()[0] for desc in attrvalue.split(',')]
 
 
-def main(
-    checkerCls: CheckerInterface, projdir: str, pages_to_check_file: str, base_address: str
-) -> int:
+def setup(
+    checkerCls: CheckerInterface,
+    projdir: str,
+    pages_to_check_file: str,
+    base_address: str,
+    out: Optional[OutputSink] = None,
+) -> Union[Site, int]:
+    """Set up checking PROJDIR (as served at BASE_ADDRESS); or print why
+    not (or that there's nothing to check), and return the exit code."""
     urls = [
         f'{base_address}/',
         f'{base_address}/404.html',
         f'{base_address}/404/',
     ]
-    checker = checkerCls(domain=urlparse(urls[0]).netloc)
-
-    if len(pages_to_check_file) > 0:
+    if errors := settings_errors():
+        for err in errors:
+            print(err, file=sys.stderr)
+        return 2
+    try:
+        verbosity = parse_verbosity(VERBOSITY)
+    except ValueError as err:
+        print(f"VERBOSITY: {err}", file=sys.stderr)
+        return 2
+    pages_to_check: List[str] = []
+    if len(pages_to_check_file) > 0 and (PR_BASELINE or PR_LINKGRAPH):
+        # This needs to happen before the checker is created, in case LINKGRAPH is the same
+        # file as PR_LINKGRAPH.
+        affected = affected_pages(
+            os.path.join(projdir, 'public'),
+            base_address,
+            read_changed_files(pages_to_check_file),
+            baseline=PR_BASELINE or None,
+            linkgraph=PR_LINKGRAPH or None,
+        )
+        for file in affected.unresolved:
+            print(f"PAGES_TO_CHECK: {file} does not correspond to any page")
+        pages_to_check = sorted(affected.pages)
+        if not pages_to_check:
+            print("PAGES_TO_CHECK: no pages are affected")
+            return 0
+    elif len(pages_to_check_file) > 0:
         pages_to_check_reader = ReadInputPages(pages_to_check_file, f'{base_address}/')
         pages_to_check = pages_to_check_reader.read_input_pages()
+
+    checker = checkerCls(domain=urlparse(urls[0]).netloc)
+    if out:
+        checker.out = out
+    checker.out.verbosity = verbosity
+    if pages_to_check:
         checker.pages_to_check = pages_to_check
-        urls = urls if len(pages_to_check) == 0 else pages_to_check
+        urls = pages_to_check
 
     for url in urls:
         checker.enqueue(URLReference(ref=url))
 
-    with subprocess.Popen(
-        [os.path.join(os.path.abspath(os.path.dirname(__file__)), 'serve.js')],
-        cwd=projdir,
-        stdout=subprocess.PIPE,
-    ) as srv:
-        try:
-            # Wait for the server to be ready
-            assert srv.stdout
-            sys.stdout.write(srv.stdout.readline().decode('utf-8'))
-
-            # Pump the servers logs
-            def pump():
-                while line := srv.stdout.readline():
-                    sys.stdout.write(line.decode('utf-8'))
-
-            threading.Thread(target=pump).start()
-
-            # Run the checker
-            checker.run()
-        finally:
-            srv.kill()
-
-    # Print a summary
-    print("Summary:")
-    print(
-        f"  Actions: Sent {checker.stats_requests} HTTP requests and slept for {checker.stats_sleep} seconds in order to check {checker.stats_links_total} links on {checker.stats_pages} pages."
+    def report() -> int:
+        out = checker.out
+        # Print a summary
+        out.write("Summary:")
+        out.write(
+            f"  Actions: Sent {checker.stats_requests} HTTP requests and slept for {checker.stats_sleep} seconds in order to check {checker.stats_links_total} links on {checker.stats_pages} pages."
+        )
+        out.write(
+            f"  Results: Encountered {checker.stats_broken_links} errors, {checker.stats_links_bad} bad links."
+        )
+        if checker.stats_unchecked:
+            out.write(
+                f"  Skipped: Ran out of time before checking {checker.stats_unchecked} links and pages."
+            )
+        out.flush()
+        return 0
+
+    # serve.js only serves localhost; there's no point starting it to check some other
+    # address (such as a deploy preview).
+    return Site(
+        checker=checker,
+        serving=(
+            serving(projdir, checker.out, port=urlparse(base_address).port or 9000)
+            if is_local_address(base_address)
+            else contextlib.nullcontext()
+        ),
+        report=report,
     )
-    print(
-        f"  Results: Encountered {checker.stats_broken_links} errors, {checker.stats_links_bad} bad links."
+
+
+def main(
+    checkerCls: CheckerInterface, projdir: str, pages_to_check_file: str, base_address: str
+) -> int:
+    site = setup(checkerCls, projdir, pages_to_check_file, base_address)
+    if isinstance(site, int):
+        return site
+    with site.serving:
+        site.checker.run()
+    return site.report()
+
+
+def batch_site(projdir: str, port: int, out: OutputSink) -> Union[Site, int]:
+    """Set up checking PROJDIR as part of a batch (see batch_blc.py)."""
+    return setup(AmbassadorChecker, projdir, '', f'http://localhost:{port}', out)
+
+
+def cli(argv: List[str]) -> int:
+    if len(argv) < 4:
+        print(f"Usage: {argv[0]} PROJDIR PAGES_TO_CHECK BASE_ADDRESS", file=sys.stderr)
+        return 2
+    return main(
+        AmbassadorChecker,
+        argv[1],
+        argv[2],
+        argv[3],
     )
-    return 0
 
 
 if __name__ == "__main__":
     try:
-        if len(sys.argv) < 4:
-            print(
-                f"Usage: {sys.argv[0]} PROJDIR PAGES_TO_CHECK BASE_ADDRESS", file=sys.stderr
-            )
-            sys.exit(2)
-        sys.exit(
-            main(
-                AmbassadorChecker,
-                sys.argv[1],
-                sys.argv[2],
-                sys.argv[3],
-            )
-        )
+        sys.exit(cli(sys.argv))
     except KeyboardInterrupt as err:
         print(err, file=sys.stderr)
         sys.exit(130)
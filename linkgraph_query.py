@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+from typing import List
+
+from blclib.linkgraph import Edge, LinkGraph
+
+
+def format_edge(edge: Edge, url: str) -> str:
+    where = (
+        f'<{edge.tag} {edge.attr}>' if edge.attr else (f'<{edge.tag}>' if edge.tag else '-')
+    )
+    return f'{url}\t"{edge.ref}"\t{where}\t{edge.broken or "ok"}'
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog=argv[0],
+        description='Query the link graph recorded by a checker run with LINKGRAPH=DBFILE.',
+    )
+    parser.add_argument('dbfile')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('inbound', help='pages that link to URL').add_argument('url')
+    subparsers.add_parser('outbound', help='links on the page URL').add_argument('url')
+    subparsers.add_parser(
+        'broken', help='pages affected by broken links (to URL, if given)'
+    ).add_argument('url', nargs='?')
+    subparsers.add_parser(
+        'orphans', help='checked pages not reachable from any ROOT'
+    ).add_argument('roots', metavar='root', nargs='+')
+    args = parser.parse_args(argv[1:])
+
+    graph = LinkGraph(args.dbfile, readonly=True)
+    try:
+        if args.command == 'inbound':
+            for edge in graph.inbound(args.url):
+                print(format_edge(edge, edge.pageurl))
+        elif args.command == 'outbound':
+            for edge in graph.outbound(args.url):
+                print(format_edge(edge, edge.linkurl))
+        elif args.command == 'broken':
+            for edge in graph.broken(args.url):
+                print(f'{edge.linkurl}\t' + format_edge(edge, edge.pageurl))
+        elif args.command == 'orphans':
+            if unchecked := graph.unchecked():
+                print(
+                    f"{argv[0]}: warning: the run ran out of time before checking {unchecked}"
+                    " links and pages, so some of these may be reachable after all",
+                    file=sys.stderr,
+                )
+            for url in graph.orphans(args.roots):
+                print(url)
+    finally:
+        graph.close()
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv))
+    except KeyboardInterrupt as err:
+        print(err, file=sys.stderr)
+        sys.exit(130)
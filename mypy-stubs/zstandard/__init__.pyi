@@ -0,0 +1,7 @@
+class ZstdCompressor:
+    def __init__(self, level: int = ...) -> None: ...
+    def compress(self, data: bytes) -> bytes: ...
+
+class ZstdDecompressor:
+    def __init__(self) -> None: ...
+    def decompress(self, data: bytes) -> bytes: ...
@@ -14,7 +14,7 @@ const {
 const {fdir} = require('fdir');
 
 let host = 'localhost';
-let port = 9000;
+let port = parseInt(process.env.PORT || '9000', 10);
 let dir = path.resolve('public');
 let cfg = path.resolve('netlify.toml');
 
@@ -75,9 +75,31 @@ function doRedirect(requestURL, response, redirect) {
 const filesOnMemory = {};
 const errorLoadingFile = 'There was an error reading the file';
 
+// The files under `dir`: from the manifest that the checker already walked it in to (see
+// blclib/fswalk.py), if it passed one in FS_MANIFEST; otherwise, by walking it.
+function listFiles(dir) {
+  const manifestFile = process.env.FS_MANIFEST;
+  if (manifestFile) {
+    try {
+      const manifest = JSON.parse(require('fs').readFileSync(manifestFile, 'utf8'));
+      if (manifest.version === 1) {
+        const files = [];
+        for (const [rel, [, names]] of Object.entries(manifest.dirs)) {
+          for (const name of names) {
+            files.push(path.join(dir, rel, name));
+          }
+        }
+        return files;
+      }
+    } catch (err) {
+      console.log(`could not read FS_MANIFEST: ${err}; walking ${dir} instead`);
+    }
+  }
+  return new fdir().withFullPaths().crawl(dir).sync();
+}
+
 function loadSiteOnMemory(dir) {
-  const api = new fdir().withFullPaths().crawl(dir);
-  const files = api.sync();
+  const files = listFiles(dir);
   for (const file of files) {
     fs.readFile(file).then(content => {
       filesOnMemory[file] = content;
@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 import sys
+from typing import List, Union
 from urllib.parse import urlparse
 
 from blclib import Link
-from generic_blc import GenericChecker, main
+from blclib.output import OutputSink
+from generic_blc import GenericChecker, Site, main, setup
 
 
 class TelepresenceChecker(GenericChecker):
@@ -60,12 +62,21 @@ class TelepresenceChecker(GenericChecker):
             )
 
 
+def batch_site(projdir: str, port: int, out: OutputSink) -> Union[Site, int]:
+    """Set up checking PROJDIR as part of a batch (see batch_blc.py)."""
+    return setup(TelepresenceChecker, projdir, port=port, out=out)
+
+
+def cli(argv: List[str]) -> int:
+    if len(argv) != 2:
+        print(f"Usage: {argv[0]} PROJDIR", file=sys.stderr)
+        return 2
+    return main(TelepresenceChecker, argv[1])
+
+
 if __name__ == "__main__":
     try:
-        if len(sys.argv) != 2:
-            print(f"Usage: {sys.argv[0]} PROJDIR", file=sys.stderr)
-            sys.exit(2)
-        sys.exit(main(TelepresenceChecker, sys.argv[1]))
+        sys.exit(cli(sys.argv))
     except KeyboardInterrupt as err:
         print(err, file=sys.stderr)
         sys.exit(130)